@@ -0,0 +1,232 @@
+# agents/alert_agent.py
+import os
+import json
+import time
+import logging
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait
+from pydantic import BaseModel, Field, ValidationError
+
+from utils import llm_client
+from utils.metrics import Counters
+
+logging.getLogger("groq").setLevel(logging.WARNING)
+
+ALERT_MODEL = "llama-3.1-8b-instant"
+
+ALERT_FIELDS = ["alert_en", "alert_hi", "alert_mr", "tweet_public", "tweet_authority"]
+
+# fanout: one small concurrent request per channel; single: one JSON call for all
+ALERT_MODE = os.getenv("NIVARAN_ALERT_MODE", "fanout")
+# llm: Hindi / Marathi drafted by the model; template: filled local templates
+REGIONAL_MODE = os.getenv("NIVARAN_ALERT_REGIONAL", "llm")
+# per-channel budget; the run deadline still applies when it is sooner
+CHANNEL_SECONDS = float(os.getenv("NIVARAN_ALERT_CHANNEL_SECONDS", "8"))
+
+# no wider than the Groq concurrency guard: extra threads would only queue on it
+_channel_pool = ThreadPoolExecutor(
+    max_workers=min(len(ALERT_FIELDS), llm_client.MAX_CONCURRENCY["groq"]),
+    thread_name_prefix="alert-channel",
+)
+
+
+def empty_alerts() -> dict:
+    return {field: "" for field in ALERT_FIELDS}
+
+
+def template_alerts(disaster_type: str) -> dict:
+    """Hard-coded multilingual alerts used when generation is unavailable."""
+    return {
+        "alert_en": f"⚠️ {disaster_type.capitalize()} alert. Follow NDMA guidelines.",
+        "alert_hi": f"⚠️ {disaster_type} चेतावनी। NDMA दिशानिर्देशों का पालन करें।",
+        "alert_mr": f"⚠️ {disaster_type} इशारा। NDMA मार्गदर्शक तत्त्वांचे पालन करा।",
+        "tweet_public": f"⚠️ {disaster_type.capitalize()} detected in Mumbai. Stay safe. #MumbaiRains #Nivaran",
+        "tweet_authority": f"@RailwayMumbai @MumbaiPolice 🚨 {disaster_type.capitalize()} HIGH severity. Immediate action needed. #NivaranAlert"
+    }
+
+
+_REGIONAL_TERMS = {
+    "hi": {
+        "flood": "बाढ़", "fire": "आग", "landslide": "भूस्खलन",
+        "high": "उच्च", "medium": "मध्यम", "low": "निम्न",
+    },
+    "mr": {
+        "flood": "पूर", "fire": "आग", "landslide": "भूस्खलन",
+        "high": "उच्च", "medium": "मध्यम", "low": "कमी",
+    },
+}
+
+
+@lru_cache(maxsize=64)
+def regional_alerts(disaster_type: str, severity: str) -> dict:
+    """Hindi / Marathi alerts from fixed templates with the type and severity filled in."""
+    hi = _REGIONAL_TERMS["hi"]
+    mr = _REGIONAL_TERMS["mr"]
+    t, sev = disaster_type.lower(), severity.lower()
+    return {
+        "alert_hi": (
+            f"⚠️ मुंबई रेलवे स्टेशन पर {hi.get(t, t)} की चेतावनी ({hi.get(sev, sev)} गंभीरता)। "
+            "इस क्षेत्र से बचें, वैकल्पिक मार्ग अपनाएँ और NDMA दिशानिर्देशों का पालन करें।"
+        ),
+        "alert_mr": (
+            f"⚠️ मुंबई रेल्वे स्थानकावर इशारा: {mr.get(t, t)} ({mr.get(sev, sev)} तीव्रता). "
+            "हा परिसर टाळा, पर्यायी मार्ग वापरा आणि NDMA मार्गदर्शक तत्त्वांचे पालन करा."
+        ),
+    }
+
+
+# ------------------------------
+# Structured output schema
+# ------------------------------
+class AlertDrafts(BaseModel):
+    alert_en: str = Field(min_length=1, max_length=240)
+    alert_hi: str = Field(min_length=1, max_length=240)
+    alert_mr: str = Field(min_length=1, max_length=240)
+    tweet_public: str = Field(min_length=1, max_length=280)
+    tweet_authority: str = Field(min_length=1, max_length=280)
+
+
+FIELD_SPECS = {
+    "alert_en": "English public alert, <=180 chars, mention alternate routes",
+    "alert_hi": "Hindi public alert, <=180 chars",
+    "alert_mr": "Marathi public alert, <=180 chars",
+    "tweet_public": "public tweet, <=220 chars, include #MumbaiRains #Nivaran",
+    "tweet_authority": "urgent tweet tagging @RailwayMumbai @MumbaiPolice @NDMA_India, <=220 chars, include #NivaranAlert",
+}
+
+# token / retry counters (read by bench_structured.py)
+usage = Counters()
+
+
+def _ask_json(fields: list, disaster_type: str, severity: str, protocol: str, deadline: float = None) -> dict:
+    keys = "; ".join(f'"{f}": {FIELD_SPECS[f]}' for f in fields)
+    prompt = (
+        f"Mumbai disaster alert officer. {severity} severity {disaster_type} at a Mumbai railway station. "
+        f"NDMA protocol: {protocol[:300]}\n"
+        f"Return a JSON object with keys: {keys}."
+    )
+
+    client = llm_client.groq_client()
+    response = llm_client.call(
+        "groq",
+        client.chat.completions.create,
+        model=ALERT_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"},
+        temperature=0.2,
+        max_tokens=max(160, 120 * len(fields)),   # Devanagari needs headroom on single-field calls
+        deadline=deadline,
+    )
+
+    if response.usage is not None:
+        usage.inc("prompt_tokens", response.usage.prompt_tokens or 0)
+        usage.inc("output_tokens", response.usage.completion_tokens or 0)
+    usage.inc("calls")
+
+    text = response.choices[0].message.content.strip()
+    print(f"\n📢 Raw Alert Output:\n{text}")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+    return {k: str(v).strip() for k, v in data.items() if k in FIELD_SPECS} if isinstance(data, dict) else {}
+
+
+def _failed_fields(raw: dict) -> list:
+    try:
+        AlertDrafts.model_validate(raw)
+        return []
+    except ValidationError as e:
+        return sorted({str(err["loc"][0]) for err in e.errors() if err["loc"]})
+
+
+def _field_ok(field: str, text: str, templates: dict) -> bool:
+    return field not in _failed_fields({**templates, field: text})
+
+
+def _fanout_alerts(disaster_type: str, severity: str, protocol: str, deadline: float = None):
+    """
+    One small JSON-mode request per channel, run concurrently. Returns
+    (drafts, sources) where sources maps each field to "llm", "regional"
+    (template-plus-fill) or "template". A channel that fails validation,
+    errors, or is still running at its deadline (CHANNEL_SECONDS, or the
+    run deadline if sooner) gets its template_alerts() string instead.
+    """
+    templates = template_alerts(disaster_type)
+    drafts, sources = {}, {}
+    fields = list(ALERT_FIELDS)
+
+    if REGIONAL_MODE == "template":
+        for field, text in regional_alerts(disaster_type, severity).items():
+            fields.remove(field)
+            drafts[field], sources[field] = text, "regional"
+
+    channel_deadline = time.time() + CHANNEL_SECONDS
+    if deadline is not None:
+        channel_deadline = min(channel_deadline, deadline)
+
+    futures = {
+        _channel_pool.submit(_ask_json, [field], disaster_type, severity, protocol, channel_deadline): field
+        for field in fields
+    }
+    done, pending = wait(futures, timeout=max(0.0, llm_client.remaining(channel_deadline)))
+
+    for future in done:
+        field = futures[future]
+        try:
+            text = future.result().get(field, "")
+        except Exception as e:
+            print(f"❌ Alert channel {field} failed: {e}")
+            usage.inc("channel_errors")
+            text = ""
+        if _field_ok(field, text, templates):
+            drafts[field], sources[field] = text, "llm"
+        else:
+            usage.inc("field_fallbacks")
+            drafts[field], sources[field] = templates[field], "template"
+
+    for future in pending:
+        future.cancel()
+        usage.inc("channel_timeouts")
+        usage.inc("field_fallbacks")
+        field = futures[future]
+        drafts[field], sources[field] = templates[field], "template"
+
+    return drafts, sources
+
+
+def draft_alerts(disaster_type: str, severity: str, protocol: str, deadline: float = None):
+    """
+    EN/HI/MR public alerts plus two tweet drafts, returned as (alerts,
+    sources): sources maps each field to "llm", "regional" or "template"
+    so callers can tell a partial draft from a full one. In fanout mode
+    (default) the channels run concurrently and any late or invalid
+    channel gets its template. In single mode one Groq JSON call returns
+    every field; invalid fields are re-requested on their own once, then
+    filled from template_alerts(). Raises when no channel produced a
+    model draft; callers fall back to template_alerts().
+    """
+    if ALERT_MODE == "fanout":
+        drafts, sources = _fanout_alerts(disaster_type, severity, protocol, deadline)
+        if "llm" not in sources.values():
+            raise RuntimeError("no alert channel returned a usable draft")
+        return {f: drafts[f] for f in ALERT_FIELDS}, {f: sources[f] for f in ALERT_FIELDS}
+
+    raw = _ask_json(ALERT_FIELDS, disaster_type, severity, protocol, deadline)
+    failed = _failed_fields(raw)
+
+    if failed:
+        print(f"   ↻ Retrying invalid alert field(s): {', '.join(failed)}")
+        usage.inc("field_retries", len(failed))
+        try:
+            raw.update(_ask_json(failed, disaster_type, severity, protocol, deadline))
+        except Exception as e:
+            print(f"❌ Alert field retry failed: {e}")
+        failed = _failed_fields(raw)
+
+    if failed:
+        templates = template_alerts(disaster_type)
+        raw.update({f: templates[f] for f in failed})
+
+    sources = {f: "template" if f in failed else "llm" for f in ALERT_FIELDS}
+    return {f: raw[f] for f in ALERT_FIELDS}, sources
@@ -0,0 +1,272 @@
+# agents/bm25_index.py
+"""
+Persisted BM25 index over the NDMA chunks (pure Python + NumPy).
+
+Dense retrieval cannot answer until torch, the bge model and the corpus
+vectors are loaded. This lexical index needs none of them, so protocol
+retrieval can run as soon as the process starts. It also scores exact
+NDMA terms ("NDRF", "evacuation", "sandbags") that embeddings blur.
+
+Layout of an index directory:
+    meta.json       count, avgdl, k1, b, corpus fingerprint
+    vocab.json      term -> term id
+    idf.npy         float32 idf per term
+    indptr.npy      int64 CSR row pointers into the postings (vocab + 1)
+    postings.npy    int32 chunk ids, grouped by term
+    tf.npy          float32 term frequency, aligned with postings
+    doc_len.npy     float32 chunk length in tokens
+    records.bin     UTF-8 JSON records {"id", "text", "metadata"} back to back
+    offsets.npy     int64 byte offsets into records.bin (count + 1)
+
+Arrays and records are opened with mmap, so loading costs only the
+vocabulary parse (a few milliseconds). A query visits only the postings
+of its own terms.
+"""
+import os
+import re
+import json
+import shutil
+from collections import Counter
+from typing import List
+
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+
+BM25_K1 = float(os.getenv("NIVARAN_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("NIVARAN_BM25_B", "0.75"))
+# raw BM25 score that maps to 0.5 after normalize_score()
+BM25_SCORE_HALF = float(os.getenv("NIVARAN_BM25_SCORE_HALF", "8"))
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was
+were will with what which who how when where should do does can your you their them
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased word tokens without stopwords. No stemming: exact NDMA terms count."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def normalize_score(score: float, half: float = BM25_SCORE_HALF) -> float:
+    """Map an unbounded BM25 score into 0..1, comparable with cosine scores."""
+    return score / (score + half) if score > 0 else 0.0
+
+
+class BM25Index:
+    """Read-only, memory-mapped BM25 index."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+
+        self.path = path
+        self.k1 = float(self.meta["k1"])
+        self.b = float(self.meta["b"])
+        self.avgdl = float(self.meta["avgdl"]) or 1.0
+        self.idf = np.load(os.path.join(path, "idf.npy"), mmap_mode="r")
+        self.indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode="r")
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self.tf = np.load(os.path.join(path, "tf.npy"), mmap_mode="r")
+        self.doc_len = np.load(os.path.join(path, "doc_len.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        records = os.path.join(path, "records.bin")
+        # mmap refuses an empty file (empty corpus)
+        self.records = (np.memmap(records, dtype=np.uint8, mode="r") if os.path.getsize(records)
+                        else np.empty(0, dtype=np.uint8))
+
+    def __len__(self):
+        return int(self.meta["count"])
+
+    @property
+    def fingerprint(self) -> str:
+        return self.meta.get("fingerprint", "")
+
+    # --------------------------------------------------
+    # Build / persist
+    # --------------------------------------------------
+    @classmethod
+    def build(cls, nodes, path: str, fingerprint: str = "", k1: float = BM25_K1, b: float = BM25_B):
+        """Write llama_index nodes (embeddings not needed) to an index directory."""
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        vocab, postings = {}, []          # postings[term_id] = [(chunk, tf), ...]
+        doc_len = np.zeros(len(nodes), dtype=np.float32)
+        offsets = [0]
+        with open(os.path.join(tmp, "records.bin"), "wb") as f:
+            for doc, node in enumerate(nodes):
+                text = node.get_content()
+                counts = Counter(tokenize(text))
+                doc_len[doc] = sum(counts.values())
+                for term, tf in counts.items():
+                    term_id = vocab.setdefault(term, len(vocab))
+                    if term_id == len(postings):
+                        postings.append([])
+                    postings[term_id].append((doc, tf))
+
+                record = json.dumps({
+                    "id": node.node_id,
+                    "text": text,
+                    "metadata": node.metadata,
+                }, ensure_ascii=False).encode("utf-8")
+                f.write(record)
+                offsets.append(offsets[-1] + len(record))
+
+        n = len(nodes)
+        df = np.asarray([len(p) for p in postings], dtype=np.float32)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)   # Lucene-style, never negative
+        indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(df.astype(np.int64))
+        flat = [entry for plist in postings for entry in plist]
+
+        np.save(os.path.join(tmp, "idf.npy"), idf)
+        np.save(os.path.join(tmp, "indptr.npy"), indptr)
+        np.save(os.path.join(tmp, "postings.npy"), np.asarray([d for d, _ in flat], dtype=np.int32))
+        np.save(os.path.join(tmp, "tf.npy"), np.asarray([t for _, t in flat], dtype=np.float32))
+        np.save(os.path.join(tmp, "doc_len.npy"), doc_len)
+        np.save(os.path.join(tmp, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        with open(os.path.join(tmp, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False)
+
+        # meta.json last: its presence marks a complete index
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({
+                "count": n,
+                "terms": len(vocab),
+                "avgdl": float(doc_len.mean()) if n else 0.0,
+                "k1": k1,
+                "b": b,
+                "fingerprint": fingerprint,
+            }, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+        return cls(path)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    # --------------------------------------------------
+    # Search
+    # --------------------------------------------------
+    def search(self, query: str, top_k: int = 5):
+        """Return (row_ids, bm25_scores) of the top_k chunks; empty if no term matches."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        matched = False
+        for term, qtf in Counter(tokenize(query)).items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            matched = True
+            start, end = int(self.indptr[term_id]), int(self.indptr[term_id + 1])
+            docs = self.postings[start:end]
+            tf = self.tf[start:end]
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[docs] / self.avgdl)
+            # each chunk appears once per term, so fancy-index += is exact
+            scores[docs] += qtf * self.idf[term_id] * tf * (self.k1 + 1.0) / (tf + norm)
+
+        if not matched:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        k = min(top_k, int(np.count_nonzero(scores)))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def record(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self.records[start:end].tobytes().decode("utf-8"))
+
+
+class BM25Retriever(BaseRetriever):
+    """llama_index retriever over a BM25Index. Scores are normalised to 0..1."""
+
+    def __init__(self, index: BM25Index, similarity_top_k: int = 5):
+        super().__init__()
+        self._index = index
+        self._top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        rows, scores = self._index.search(query_bundle.query_str, self._top_k)
+        hits = []
+        for row, score in zip(rows, scores):
+            rec = self._index.record(int(row))
+            node = TextNode(id_=rec["id"], text=rec["text"], metadata=rec["metadata"])
+            hits.append(NodeWithScore(node=node, score=normalize_score(float(score))))
+        return hits
+
+
+def reciprocal_rank_fusion(result_lists: list, top_k: int, k: int = 60) -> list:
+    """
+    Fuse ranked NodeWithScore lists by RRF: sum of 1 / (k + rank).
+
+    Chunks are matched by text, since each index assigns its own node
+    ids. A fused hit keeps the highest score any list gave it, so scores
+    stay on the 0..1 scale the extractive protocol thresholds expect.
+    """
+    fused, best = {}, {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, start=1):
+            key = hit.node.get_content()
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+            if key not in best or (hit.score or 0.0) > (best[key].score or 0.0):
+                best[key] = hit
+    order = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [best[key] for key in order]
+
+
+# ------------------------------
+# MAIN (build + load / query latency)
+# ------------------------------
+if __name__ == "__main__":
+    import sys
+    import time
+    import tempfile
+
+    from agents.ingest import build_nodes
+
+    data_path = sys.argv[1] if len(sys.argv) > 1 else "./data/ndma_docs"
+    queries = [
+        "flood evacuation steps", "what to do during an earthquake",
+        "fire exit safety", "landslide warning signs", "first aid for burns",
+        "electrical safety in floods", "shelter after earthquake", "smoke inhalation",
+    ]
+
+    nodes, stats = build_nodes(data_path, embed=False)
+    print(stats.report())
+
+    tmp_root = tempfile.mkdtemp(prefix="nivaran_bm25_")
+    try:
+        path = os.path.join(tmp_root, "bm25")
+        t0 = time.perf_counter()
+        BM25Index.build(nodes, path)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        index = BM25Index(path)
+        load_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        rounds = 50
+        for _ in range(rounds):
+            for q in queries:
+                index.search(q, 5)
+        query_ms = (time.perf_counter() - t0) * 1000 / (rounds * len(queries))
+
+        disk = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        print(f"\n🔎 BM25: {len(index)} chunks, {index.meta['terms']} terms, {disk / 1024:.0f} KB on disk")
+        print(f"   build {build_ms:.0f} ms | load {load_ms:.2f} ms | query {query_ms:.3f} ms")
+        for q in queries[:3]:
+            rows, scores = index.search(q, 1)
+            if len(rows):
+                print(f"   '{q}' → {index.record(int(rows[0]))['text'][:80]!r} ({scores[0]:.2f})")
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
@@ -0,0 +1,265 @@
+# agents/ingest.py
+"""
+Parallel ingestion pipeline for the NDMA corpus.
+
+PDF pages are parsed in a process pool (large PDFs are split into page
+ranges so one 180-page file does not pin a single core), streamed into
+the sentence chunker as soon as each range finishes, and embedded in
+large batches. Nodes leave this module with their embeddings already
+set, so VectorStoreIndex does not embed them a second time.
+
+Only stdlib + pypdf are imported at module level, but that alone does
+not keep workers light: a spawn child re-imports the parent's __main__
+script, so under `python graph.py` every worker pays graph's torch /
+llama_index imports (~5 s, ~180 MB each). That start-up cost only pays
+off on a big corpus, so anything under NIVARAN_INGEST_INPROCESS_MB is
+parsed in the calling process instead (the bundled NDMA corpus is ~4 MB
+and parses in ~7 s on one core). When the pool is used, page counting
+runs in the workers too, so the parent never opens PDFs serially before
+work is fanned out.
+"""
+import os
+import sys
+import time
+import hashlib
+import multiprocessing
+from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# --------------------------------------------------
+# Tunables (env overridable)
+# --------------------------------------------------
+INGEST_WORKERS = int(os.getenv("NIVARAN_INGEST_WORKERS", "0")) or os.cpu_count() or 1
+PAGES_PER_TASK = int(os.getenv("NIVARAN_PAGES_PER_TASK", "32"))
+EMBED_BATCH_SIZE = int(os.getenv("NIVARAN_EMBED_BATCH_SIZE", "128"))
+EMBED_THREADS = int(os.getenv("NIVARAN_EMBED_THREADS", "0")) or os.cpu_count() or 1
+# corpora smaller than this are parsed without a process pool
+INPROCESS_MB = float(os.getenv("NIVARAN_INGEST_INPROCESS_MB", "8"))
+
+DOC_EXTS = [".pdf", ".txt"]
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    pages: int = 0
+    chunks: int = 0
+    parse_seconds: float = 0.0
+    embed_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.parse_seconds if self.parse_seconds else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.embed_seconds if self.embed_seconds else 0.0
+
+    def report(self) -> str:
+        return (
+            f"📊 Ingest: {self.files} files | {self.pages} pages in {self.parse_seconds:.1f}s "
+            f"({self.pages_per_second:.1f} pages/s) | {self.chunks} chunks embedded in "
+            f"{self.embed_seconds:.1f}s ({self.chunks_per_second:.1f} chunks/s) | "
+            f"total {self.total_seconds:.1f}s"
+        )
+
+
+# --------------------------------------------------
+# Worker side (runs in the process pool)
+# --------------------------------------------------
+def _count_pages(file_path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(file_path).pages)
+
+
+def _parse_task(file_path: str, start: int, end: int):
+    """Extract pages [start, end) of one file → list of (text, metadata)."""
+    file_name = os.path.basename(file_path)
+
+    if file_path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        reader = PdfReader(file_path)
+        pages = []
+        for page_no in range(start, min(end, len(reader.pages))):
+            text = reader.pages[page_no].extract_text() or ""
+            pages.append((text, {
+                "file_name": file_name,
+                "file_path": file_path,
+                "page_label": str(page_no + 1),
+            }))
+        return pages
+
+    with open(file_path, encoding="utf-8", errors="ignore") as f:
+        return [(f.read(), {"file_name": file_name, "file_path": file_path})]
+
+
+# --------------------------------------------------
+# Parent side
+# --------------------------------------------------
+def _list_files(data_path: str, exts) -> list:
+    exts = tuple(e.lower() for e in exts)
+    found = []
+    for root, _, names in os.walk(data_path):
+        for name in sorted(names):
+            if name.lower().endswith(exts):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def corpus_fingerprint(data_path: str, exts=DOC_EXTS) -> str:
+    """Cheap version id of the corpus: file names, sizes and mtimes."""
+    h = hashlib.sha1()
+    for path in _list_files(data_path, exts):
+        st = os.stat(path)
+        h.update(f"{os.path.relpath(path, data_path)}|{st.st_size}|{int(st.st_mtime)}".encode())
+    return h.hexdigest()[:16]
+
+
+def _page_ranges(path: str, n_pages: int, pages_per_task: int) -> list:
+    """Split one PDF into (path, start, end) page-range tasks."""
+    return [(path, start, min(start + pages_per_task, n_pages))
+            for start in range(0, n_pages, pages_per_task)]
+
+
+def _use_pool(files: list, workers: int) -> bool:
+    total = sum(os.path.getsize(path) for path in files)
+    return workers > 1 and total >= INPROCESS_MB * 1024 * 1024
+
+
+def _parse_in_pool(files: list, workers: int, pages_per_task: int):
+    """
+    Yield parsed page lists as the pool finishes them. PDFs are first
+    page-counted in the workers, and each one's ranges are submitted as
+    soon as its count comes back.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        counting, parsing = {}, set()
+        for path in files:
+            if path.lower().endswith(".pdf"):
+                counting[pool.submit(_count_pages, path)] = path
+            else:
+                parsing.add(pool.submit(_parse_task, path, 0, 1))
+
+        while counting or parsing:
+            done, _ = wait(set(counting) | parsing, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in counting:
+                    path = counting.pop(future)
+                    for task in _page_ranges(path, future.result(), pages_per_task):
+                        parsing.add(pool.submit(_parse_task, *task))
+                else:
+                    parsing.discard(future)
+                    yield future.result()
+
+
+def _set_torch_threads(n: int):
+    try:
+        import torch
+        torch.set_num_threads(n)
+    except ImportError:
+        pass
+
+
+def _embed_nodes(nodes: list, embed_model, stats: IngestStats):
+    from llama_index.core.schema import MetadataMode
+
+    texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in nodes]
+    t0 = time.perf_counter()
+    vectors = embed_model.get_text_embedding_batch(texts)
+    stats.embed_seconds += time.perf_counter() - t0
+
+    for node, vector in zip(nodes, vectors):
+        node.embedding = vector
+    stats.chunks += len(nodes)
+
+
+def build_nodes(
+    data_path: str,
+    exts=DOC_EXTS,
+    workers: int = INGEST_WORKERS,
+    pages_per_task: int = PAGES_PER_TASK,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    chunk_size: int = None,
+    chunk_overlap: int = None,
+    embed_model=None,
+    embed: bool = True,
+):
+    """
+    Parse, chunk and (optionally) embed every document under data_path.
+
+    Returns (nodes, IngestStats).
+    """
+    from llama_index.core import Document, Settings
+    from llama_index.core.node_parser import SentenceSplitter
+
+    stats = IngestStats()
+    t_start = time.perf_counter()
+
+    files = _list_files(data_path, exts)
+    stats.files = len(files)
+
+    splitter = SentenceSplitter(
+        chunk_size=chunk_size or Settings.chunk_size,
+        chunk_overlap=chunk_overlap if chunk_overlap is not None else Settings.chunk_overlap,
+    )
+
+    if embed:
+        embed_model = embed_model or Settings.embed_model
+        embed_model.embed_batch_size = embed_batch_size
+        _set_torch_threads(EMBED_THREADS)
+
+    nodes, pending = [], []
+    if _use_pool(files, workers):
+        parsed = _parse_in_pool(files, workers, pages_per_task)
+    else:
+        # small corpus: worker start-up would cost more than it saves
+        parsed = (_parse_task(path, 0, sys.maxsize) for path in files)
+
+    for pages in parsed:
+        stats.pages += len(pages)
+
+        docs = [Document(text=text, metadata=meta) for text, meta in pages if text.strip()]
+        chunked = splitter.get_nodes_from_documents(docs)
+        nodes.extend(chunked)
+
+        # embed in big batches while the pool keeps parsing
+        if embed:
+            pending.extend(chunked)
+            if len(pending) >= embed_batch_size:
+                _embed_nodes(pending, embed_model, stats)
+                pending = []
+
+    stats.parse_seconds = time.perf_counter() - t_start - stats.embed_seconds
+
+    if embed and pending:
+        _embed_nodes(pending, embed_model, stats)
+    if not embed:
+        stats.chunks = len(nodes)
+
+    stats.total_seconds = time.perf_counter() - t_start
+    return nodes, stats
+
+
+def build_index(data_path: str, **kwargs):
+    """Build a VectorStoreIndex from pre-embedded nodes. Returns (index, stats)."""
+    from llama_index.core import VectorStoreIndex
+
+    nodes, stats = build_nodes(data_path, **kwargs)
+    return VectorStoreIndex(nodes), stats
+
+
+# ------------------------------
+# MAIN (throughput check)
+# ------------------------------
+if __name__ == "__main__":
+    from llama_index.core import Settings
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    Settings.embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+
+    _, ingest_stats = build_nodes("./data/ndma_docs")
+    print(ingest_stats.report())
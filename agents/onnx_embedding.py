@@ -0,0 +1,282 @@
+# agents/onnx_embedding.py
+"""
+ONNX Runtime backend for the bge-small embedding model.
+
+Runs the same model as HuggingFaceEmbedding("BAAI/bge-small-en-v1.5")
+without torch at runtime: the model is exported once to ONNX (optionally
+int8 dynamic-quantized) and served with onnxruntime + the `tokenizers`
+fast tokenizer. Same CLS pooling, L2 normalisation and bge query
+instruction as the torch backend, so vectors are interchangeable within
+tolerance (see bench_embeddings.py).
+
+Batching:
+- document batches are sorted by token length and padded per batch only
+  to their longest member, not to max_length; a batch is also capped at
+  NIVARAN_ONNX_MAX_BATCH_TOKENS padded tokens, since attention memory
+  grows with batch x length^2 (64 full 512-token chunks in one run took
+  the process past 5 GB; one full chunk per run was also the fastest in
+  bench_embeddings.py)
+- concurrent get_query_embedding() calls (server, semantic cache) are
+  coalesced by a small collector thread into one session.run(); the
+  async variant awaits the same future without blocking the event loop
+
+Export once before using the backend (needs torch + transformers, and
+onnxscript on torch >= 2.9 where the exporter defaults to dynamo; the
+runtime does not):
+
+    python -m agents.onnx_embedding --out ./storage/onnx/bge-small-en-v1.5   # export + quantize
+"""
+import os
+import time
+import asyncio
+import queue
+import threading
+from typing import Optional
+from concurrent.futures import Future
+
+import numpy as np
+from pydantic import Field, PrivateAttr
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+ONNX_DIR = os.getenv("NIVARAN_ONNX_DIR", "./storage/onnx")
+ONNX_THREADS = int(os.getenv("NIVARAN_ONNX_THREADS", "0")) or os.cpu_count() or 1
+QUERY_BATCH_WINDOW_MS = float(os.getenv("NIVARAN_ONNX_QUERY_WINDOW_MS", "2"))
+MAX_BATCH_TOKENS = int(os.getenv("NIVARAN_ONNX_MAX_BATCH_TOKENS", "512"))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+# same prompts the torch backend applies to bge English models
+# (llama_index.embeddings.huggingface.utils; not imported: it pulls in torch)
+BGE_QUERY_INSTRUCTION = "Represent this question for searching relevant passages:"
+
+
+def _default_query_instruction(model_name: str) -> str:
+    name = (model_name or "").lower()
+    return BGE_QUERY_INSTRUCTION if "bge-" in name and "-en" in name else ""
+
+
+def _with_instruction(instruction: str, text: str) -> str:
+    return f"{instruction} {text}".strip() if instruction else text
+
+
+# --------------------------------------------------
+# Export (one-off; needs torch + transformers)
+# --------------------------------------------------
+def export_model(model_name: str, out_dir: str, quantize: bool = True, opset: int = 17) -> str:
+    """Export model_name to out_dir/model.onnx (+ model.int8.onnx). Returns out_dir."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    class _LastHidden(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(
+                input_ids=input_ids, attention_mask=attention_mask,
+                token_type_ids=token_type_ids, return_dict=False,
+            )[0]
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    axes = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        _LastHidden(model),
+        (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+        os.path.join(out_dir, FP32_FILE),
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={"input_ids": axes, "attention_mask": axes, "token_type_ids": axes,
+                      "last_hidden_state": axes},
+        opset_version=opset,
+    )
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, TOKENIZER_FILE))
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            os.path.join(out_dir, FP32_FILE),
+            os.path.join(out_dir, INT8_FILE),
+            weight_type=QuantType.QInt8,
+        )
+    return out_dir
+
+
+def default_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_DIR, model_name.split("/")[-1])
+
+
+# --------------------------------------------------
+# Embedding model
+# --------------------------------------------------
+class OnnxEmbedding(BaseEmbedding):
+    model_dir: str = Field(description="Directory with model.onnx / model.int8.onnx and tokenizer.json")
+    quantized: bool = Field(default=False, description="Use the int8 dynamic-quantized graph")
+    max_length: int = Field(default=512)
+    num_threads: int = Field(default=ONNX_THREADS, description="onnxruntime intra-op threads")
+    normalize: bool = Field(default=True)
+    query_instruction: Optional[str] = Field(default=None)
+    text_instruction: Optional[str] = Field(default=None)
+    query_window_ms: float = Field(default=QUERY_BATCH_WINDOW_MS)
+    max_batch_tokens: int = Field(default=MAX_BATCH_TOKENS, description="Cap on padded tokens per session.run()")
+
+    _session = PrivateAttr()
+    _tokenizer = PrivateAttr()
+    _input_names = PrivateAttr()
+    _queries = PrivateAttr()
+    _collector = PrivateAttr(default=None)
+    _collector_lock = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if self.query_instruction is None:
+            self.query_instruction = _default_query_instruction(self.model_name)
+        if self.text_instruction is None:
+            self.text_instruction = ""
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        path = os.path.join(self.model_dir, INT8_FILE if self.quantized else FP32_FILE)
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+        tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, TOKENIZER_FILE))
+        tokenizer.enable_truncation(max_length=self.max_length)
+        tokenizer.enable_padding()   # pads to the longest in each batch
+        self._tokenizer = tokenizer
+
+        self._queries = queue.Queue()
+        self._collector_lock = threading.Lock()
+
+    @classmethod
+    def from_pretrained(cls, model_name: str, quantized: bool = False, model_dir: str = None, **kwargs):
+        """Load the exported model (see export_model; the runtime never exports)."""
+        model_dir = model_dir or default_model_dir(model_name)
+        wanted = INT8_FILE if quantized else FP32_FILE
+        if not os.path.exists(os.path.join(model_dir, wanted)):
+            raise FileNotFoundError(
+                f"❌ No ONNX export of {model_name} at {os.path.join(model_dir, wanted)}. "
+                f"Run once (needs torch + transformers): "
+                f"python -m agents.onnx_embedding --model {model_name} --out {model_dir}"
+            )
+        return cls(model_name=model_name, model_dir=model_dir, quantized=quantized, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    # --------------------------------------------------
+    # Inference
+    # --------------------------------------------------
+    def _run(self, texts: list) -> list:
+        return self._forward(self._tokenizer.encode_batch(texts))
+
+    def _forward(self, encodings: list, width: int = None) -> list:
+        # padding is on the right: cutting at width drops only padding
+        feeds = {
+            "input_ids": np.array([e.ids[:width] for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask[:width] for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids[:width] for e in encodings], dtype=np.int64),
+        }
+        hidden = self._session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+        vectors = hidden[:, 0]   # CLS pooling, as bge / sentence-transformers
+        if self.normalize:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.tolist()
+
+    def _embed_batch(self, texts: list) -> list:
+        # tokenize once, sort by token length so each padded batch wastes little compute
+        encodings = self._tokenizer.encode_batch(texts)
+        lengths = [sum(e.attention_mask) for e in encodings]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        out = [None] * len(texts)
+        size = max(1, self.embed_batch_size)
+        start = 0
+        while start < len(order):
+            # lengths ascend, so the next member sets the batch's padded width
+            end = start + 1
+            while (end < len(order) and end - start < size
+                   and (end - start + 1) * lengths[order[end]] <= self.max_batch_tokens):
+                end += 1
+            idx = order[start:end]
+            for i, vector in zip(idx, self._forward([encodings[i] for i in idx], lengths[idx[-1]])):
+                out[i] = vector
+            start = end
+        return out
+
+    # --------------------------------------------------
+    # Concurrent query coalescing
+    # --------------------------------------------------
+    def _collect(self):
+        while True:
+            batch = [self._queries.get()]
+            deadline = time.perf_counter() + self.query_window_ms / 1000.0
+            while len(batch) < self.embed_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queries.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                vectors = self._run([text for text, _ in batch])
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def _submit_query(self, text: str) -> Future:
+        with self._collector_lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name="onnx-embed-queries", daemon=True)
+                self._collector.start()
+        future = Future()
+        self._queries.put((text, future))
+        return future
+
+    # --------------------------------------------------
+    # BaseEmbedding interface
+    # --------------------------------------------------
+    def _get_query_embedding(self, query: str) -> list:
+        return self._submit_query(_with_instruction(self.query_instruction, query)).result()
+
+    async def _aget_query_embedding(self, query: str) -> list:
+        return await asyncio.wrap_future(self._submit_query(_with_instruction(self.query_instruction, query)))
+
+    def _get_text_embedding(self, text: str) -> list:
+        return self._run([_with_instruction(self.text_instruction, text)])[0]
+
+    def _get_text_embeddings(self, texts: list) -> list:
+        return self._embed_batch([_with_instruction(self.text_instruction, t) for t in texts])
+
+
+# ------------------------------
+# MAIN (export)
+# ------------------------------
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export an embedding model to ONNX (+ int8)")
+    parser.add_argument("--model", default="BAAI/bge-small-en-v1.5")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    out = export_model(args.model, args.out or default_model_dir(args.model), quantize=not args.no_quantize)
+    print(f"✅ Exported {args.model} to {out}")
@@ -1,15 +1,27 @@
 # agents/policy_agent.py
 import os
+import re
+import json
+import time
 import logging
+import threading
+from typing import List
 from dotenv import load_dotenv
 from llama_index.core import (
-    VectorStoreIndex,
-    SimpleDirectoryReader,
     Settings,
     PromptTemplate
 )
-from llama_index.llms.groq import Groq
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+from llama_index.core import QueryBundle
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+from agents.ingest import build_index, build_nodes, corpus_fingerprint
+from agents.vector_store import MmapVectorStore, MmapRetriever
+from agents.bm25_index import BM25Index, BM25Retriever, reciprocal_rank_fusion
+from agents.semantic_cache import SemanticCache, CachedQueryEngine
+from utils import llm_client
 
 os.environ["TRANSFORMERS_OFFLINE"] = "1"
 os.environ["HF_DATASETS_OFFLINE"] = "1"
@@ -29,13 +41,41 @@ groq_api_key = os.getenv("GROQ_API_KEY")
 if not groq_api_key:
     raise ValueError("❌ GROQ_API_KEY not found! Check your .env file.")
 
-Settings.llm = Groq(
-    model="llama-3.1-8b-instant",
-    api_key=groq_api_key
-)
-Settings.embed_model = HuggingFaceEmbedding(
-    model_name="BAAI/bge-small-en-v1.5"
-)
+# --------------------------------------------------
+# Embedding backend (loaded lazily, see ensure_embed_model)
+#   torch     → HuggingFaceEmbedding (sentence-transformers / PyTorch)
+#   onnx      → agents/onnx_embedding.py, fp32 ONNX Runtime, no torch at runtime
+#   onnx-int8 → same, int8 dynamic-quantized graph
+# --------------------------------------------------
+EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+EMBED_BACKEND = os.getenv("NIVARAN_EMBED_BACKEND", "torch").lower()
+
+
+def make_embed_model(backend: str = EMBED_BACKEND):
+    if backend in ("onnx", "onnx-int8"):
+        from agents.onnx_embedding import OnnxEmbedding
+        return OnnxEmbedding.from_pretrained(EMBED_MODEL_NAME, quantized=backend == "onnx-int8")
+
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    return HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME)
+
+
+_embed_lock = threading.Lock()
+_embed_ready = False
+
+
+def ensure_embed_model():
+    """Load the embedding model into Settings on first use (torch / bge load is slow)."""
+    global _embed_ready
+    with _embed_lock:
+        if not _embed_ready:
+            Settings.embed_model = make_embed_model()
+            _embed_ready = True
+    return Settings.embed_model
+
+
+RAG_MODEL = "llama-3.1-8b-instant"
+Settings.llm = llm_client.groq_llm(RAG_MODEL)
 
 # --------------------------------------------------
 # System Prompt
@@ -54,65 +94,494 @@ Rules:
 """
 
 DATA_PATH = "./data/ndma_docs"
+DOC_EXTS = [".pdf", ".txt"]
+
+# --------------------------------------------------
+# Retrieval profile (written by rag_eval.py)
+#   chunk_size / chunk_overlap / similarity_top_k tuned on the labelled
+#   NDMA queries; without a profile the llama_index defaults and k=5 apply
+# --------------------------------------------------
+RAG_PROFILE_PATH = os.getenv("NIVARAN_RAG_PROFILE", "./data/rag_profile.json")
+
+
+def _load_rag_profile() -> dict:
+    if not os.path.exists(RAG_PROFILE_PATH):
+        return {}
+    try:
+        with open(RAG_PROFILE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable RAG profile {RAG_PROFILE_PATH}: {e}")
+        return {}
+
+
+RAG_PROFILE = _load_rag_profile()
+SIMILARITY_TOP_K = int(RAG_PROFILE.get("similarity_top_k", 5))
+CHUNK_SIZE = RAG_PROFILE.get("chunk_size")         # None → llama_index default
+CHUNK_OVERLAP = RAG_PROFILE.get("chunk_overlap")
+
+# --------------------------------------------------
+# Vector store
+#   default → llama_index in-memory store (rebuilt per process)
+#   mmap    → agents/vector_store.py, persisted + shared read-only
+# --------------------------------------------------
+VECTOR_STORE = os.getenv("NIVARAN_VECTOR_STORE", "default").lower()
+VECTOR_DTYPE = os.getenv("NIVARAN_VECTOR_DTYPE", "float16").lower()
+STORE_PATH = os.getenv("NIVARAN_STORE_PATH", "./storage/ndma")
+
+# --------------------------------------------------
+# Retrieval mode
+#   hybrid → BM25 (agents/bm25_index.py) answers from startup while the
+#            embedding model and vectors warm up in the background;
+#            once warm, BM25 and dense hits are fused by reciprocal rank
+#   dense  → embeddings only (loads the model before the first answer)
+#   bm25   → lexical only, never loads the embedding model
+# --------------------------------------------------
+RETRIEVAL_MODE = os.getenv("NIVARAN_RETRIEVAL", "hybrid").lower()
+BM25_PATH = os.getenv("NIVARAN_BM25_PATH", "./storage/ndma_bm25")
+RRF_K = int(os.getenv("NIVARAN_RRF_K", "60"))
+RRF_CANDIDATES = int(os.getenv("NIVARAN_RRF_CANDIDATES", "20"))
+
+# --------------------------------------------------
+# Protocol mode
+#   extractive → pull numbered steps straight out of the retrieved
+#                NDMA chunks; only call Groq if extraction is weak
+#   generate   → always ask Groq (original behaviour)
+# --------------------------------------------------
+PROTOCOL_MODE = os.getenv("NIVARAN_PROTOCOL_MODE", "extractive").lower()
+EXTRACTIVE_TOP_K = int(os.getenv("NIVARAN_EXTRACTIVE_TOP_K", "8"))
+EXTRACTIVE_MAX_STEPS = int(os.getenv("NIVARAN_EXTRACTIVE_MAX_STEPS", "8"))
+EXTRACTIVE_MIN_STEPS = int(os.getenv("NIVARAN_EXTRACTIVE_MIN_STEPS", "3"))
+EXTRACTIVE_MIN_CONFIDENCE = float(os.getenv("NIVARAN_EXTRACTIVE_MIN_CONFIDENCE", "0.45"))
 
 # --------------------------------------------------
 # Build index ONCE when module loads (not on every call)
 # --------------------------------------------------
+_index = None
+_mmap_store = None
+_bm25 = None
 _query_engine = None
+_cached_engine = None
+_protocol_cache = {}   # disaster type -> last good protocol (deadline fast path)
+_bm25_lock = threading.Lock()
+_dense_lock = threading.RLock()   # held for the whole (slow) dense load
+_dense_ready = threading.Event()
+_dense_thread = None
+_warm_lock = threading.Lock()     # only guards starting the warm-up thread
 
-def _load_engine():
-    """Lazy-load the RAG engine once and cache it."""
-    global _query_engine
+# the corpus fingerprint stats every document: re-read it at most this often
+CORPUS_CHECK_SECONDS = float(os.getenv("NIVARAN_CORPUS_CHECK_S", "30"))
+_corpus_version = None
+_corpus_checked = 0.0
+_corpus_lock = threading.Lock()
 
-    if _query_engine is not None:
-        return _query_engine
+def corpus_version() -> str:
+    """
+    NDMA corpus fingerprint, re-read from disk at most every
+    CORPUS_CHECK_SECONDS. When it changes, every loaded index is dropped
+    so the next retrieval reopens (or rebuilds) them on the new corpus.
+    """
+    global _corpus_version, _corpus_checked
+
+    if _corpus_version is not None and time.monotonic() - _corpus_checked < CORPUS_CHECK_SECONDS:
+        return _corpus_version
 
+    with _corpus_lock:
+        if _corpus_version is None or time.monotonic() - _corpus_checked >= CORPUS_CHECK_SECONDS:
+            version = corpus_fingerprint(DATA_PATH, DOC_EXTS)
+            if _corpus_version is not None and version != _corpus_version:
+                print("♻️ NDMA corpus changed, reloading retrieval indexes.")
+                _reset_retrieval()
+            _corpus_version, _corpus_checked = version, time.monotonic()
+    return _corpus_version
+
+
+def _reset_retrieval():
+    global _index, _mmap_store, _bm25, _dense_thread
+
+    # waits for an in-flight dense warm-up, so it cannot publish the old corpus afterwards
+    with _bm25_lock, _dense_lock, _warm_lock:
+        _index = None
+        _mmap_store = None
+        _bm25 = None
+        _dense_ready.clear()
+        _dense_thread = None
+        _protocol_cache.clear()
+
+
+def _check_docs():
     if not os.path.exists(DATA_PATH) or not os.listdir(DATA_PATH):
         raise FileNotFoundError(
             f"❌ NDMA docs folder '{DATA_PATH}' is missing or empty. "
             "Add NDMA PDFs before running."
         )
 
+
+def _load_index():
+    """Lazy-load the NDMA vector index once and cache it."""
+    global _index
+
+    if _index is not None:
+        return _index
+
+    _check_docs()
+
     print("📂 Loading NDMA PDFs (first call only)...")
-    documents = SimpleDirectoryReader(
-        DATA_PATH,
-        recursive=True,
-        required_exts=[".pdf"]
-    ).load_data()
+    _index, stats = build_index(DATA_PATH, exts=DOC_EXTS, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    print(f"✅ Indexed {stats.pages} pages.")
+    print(stats.report())
+    return _index
+
+
+def _load_mmap_store():
+    """Open the persisted mmap store, (re)building it if the corpus changed."""
+    global _mmap_store
+
+    if _mmap_store is not None:
+        return _mmap_store
+
+    _check_docs()
+
+    path = f"{STORE_PATH}_{VECTOR_DTYPE}"
+    # chunking and embedding backend are part of the store's identity
+    fingerprint = (
+        f"{corpus_fingerprint(DATA_PATH, DOC_EXTS)}-c{CHUNK_SIZE}-o{CHUNK_OVERLAP}-{EMBED_BACKEND}"
+    )
+
+    if MmapVectorStore.exists(path):
+        store = MmapVectorStore(path)
+        if store.fingerprint == fingerprint:
+            print(f"✅ Opened NDMA vector store {path} ({len(store)} chunks, {store.dtype}).")
+            _mmap_store = store
+            return _mmap_store
+
+    print(f"📂 Building NDMA vector store {path} (first run only)...")
+    nodes, stats = build_nodes(DATA_PATH, exts=DOC_EXTS, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    print(stats.report())
+
+    _mmap_store = MmapVectorStore.build(nodes, path, dtype=VECTOR_DTYPE, fingerprint=fingerprint)
+    return _mmap_store
+
+
+def _load_bm25():
+    """Open the persisted BM25 index, (re)building it if the corpus or chunking changed."""
+    global _bm25
+
+    if _bm25 is not None:
+        return _bm25
+
+    with _bm25_lock:
+        if _bm25 is None:
+            _bm25 = _open_or_build_bm25()
+    return _bm25
+
+
+def _open_or_build_bm25():
+    _check_docs()
+
+    fingerprint = f"{corpus_fingerprint(DATA_PATH, DOC_EXTS)}-c{CHUNK_SIZE}-o{CHUNK_OVERLAP}"
+    if BM25Index.exists(BM25_PATH):
+        index = BM25Index(BM25_PATH)
+        if index.fingerprint == fingerprint:
+            print(f"✅ Opened NDMA BM25 index {BM25_PATH} ({len(index)} chunks).")
+            return index
+
+    print(f"📂 Building NDMA BM25 index {BM25_PATH} (first run only, no embeddings)...")
+    nodes, stats = build_nodes(
+        DATA_PATH, exts=DOC_EXTS, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, embed=False
+    )
+    print(stats.report())
+    return BM25Index.build(nodes, BM25_PATH, fingerprint=fingerprint)
+
+
+def _load_dense_retriever(top_k: int):
+    with _dense_lock:
+        ensure_embed_model()
+        if VECTOR_STORE == "mmap":
+            retriever = MmapRetriever(_load_mmap_store(), similarity_top_k=top_k)
+        else:
+            retriever = _load_index().as_retriever(similarity_top_k=top_k)
+        _dense_ready.set()
+        return retriever
+
+
+def _warm_dense():
+    try:
+        _load_dense_retriever(1)
+        print("✅ Dense retrieval warm: BM25 + embeddings fused from now on.")
+    except Exception as e:
+        print(f"⚠️ Dense retrieval warm-up failed, staying on BM25: {e}")
+
+
+def start_dense_warmup():
+    """Load the embedding model and vectors in a background thread (once)."""
+    global _dense_thread
+    with _warm_lock:
+        if _dense_thread is None and not _dense_ready.is_set():
+            _dense_thread = threading.Thread(target=_warm_dense, name="nivaran-dense-warmup", daemon=True)
+            _dense_thread.start()
+
+
+def dense_ready() -> bool:
+    return _dense_ready.is_set()
+
 
-    print(f"✅ Indexed {len(documents)} pages.")
+class HybridRetriever(BaseRetriever):
+    """BM25 until the dense side is warm, then BM25 + dense fused by RRF (see RETRIEVAL_MODE)."""
 
-    index = VectorStoreIndex.from_documents(documents)
+    def __init__(self, similarity_top_k: int = 5):
+        super().__init__()
+        self._top_k = similarity_top_k
 
-    _query_engine = index.as_query_engine(
-        similarity_top_k=5,
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        corpus_version()
+        if RETRIEVAL_MODE == "dense":
+            return _load_dense_retriever(self._top_k).retrieve(query_bundle)
+
+        candidates = max(self._top_k, RRF_CANDIDATES)
+        lexical = BM25Retriever(_load_bm25(), similarity_top_k=candidates).retrieve(query_bundle)
+        if RETRIEVAL_MODE == "bm25" or not dense_ready():
+            if RETRIEVAL_MODE != "bm25":
+                start_dense_warmup()
+            return lexical[:self._top_k]
+
+        dense = _load_dense_retriever(candidates).retrieve(query_bundle)
+        return reciprocal_rank_fusion([dense, lexical], self._top_k, k=RRF_K)
+
+
+def _load_retriever(top_k: int):
+    return HybridRetriever(similarity_top_k=top_k)
+
+
+class _GuardedEngine:
+    """
+    engine.query() under a deadline. Retrieval runs here in the caller;
+    only the Groq request (Settings.llm, see llm_client.groq_llm) goes
+    through the client layer's guard.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def query(self, question: str, deadline: float = None):
+        with llm_client.deadline_scope(deadline):
+            return self.engine.query(question)
+
+
+def _load_engine():
+    """Lazy-load the RAG engine once and cache it (retrieval settings from RAG_PROFILE)."""
+    global _query_engine
+
+    if _query_engine is not None:
+        return _query_engine
+
+    if RAG_PROFILE:
+        if RAG_PROFILE.get("corpus") != corpus_version():
+            print("⚠️ RAG profile was tuned on a different corpus; re-run rag_eval.py")
+        if RAG_PROFILE.get("retrieval", RETRIEVAL_MODE) != RETRIEVAL_MODE:
+            print(f"⚠️ RAG profile was tuned for {RAG_PROFILE['retrieval']} retrieval, running {RETRIEVAL_MODE}")
+        print(
+            f"🎛️ RAG profile: chunk_size={CHUNK_SIZE} overlap={CHUNK_OVERLAP} "
+            f"top_k={SIMILARITY_TOP_K}"
+        )
+
+    _query_engine = _GuardedEngine(RetrieverQueryEngine.from_args(
+        _load_retriever(SIMILARITY_TOP_K),
         text_qa_template=PromptTemplate(
             SYSTEM_PROMPT +
             "\n\nContext:\n{context_str}\n\nQuestion: {query_str}\nAnswer:"
         )
-    )
+    ))
 
     return _query_engine
 
 
+def _load_cached_engine():
+    """Query engine behind the semantic cache, keyed to the corpus version."""
+    global _cached_engine
+
+    if _cached_engine is None:
+        _cached_engine = CachedQueryEngine(
+            _load_engine(),
+            SemanticCache(),
+            version_fn=corpus_version,
+            # the cache embeds questions: skip it rather than wait for the model
+            enabled_fn=lambda: RETRIEVAL_MODE != "bm25" and dense_ready(),
+        )
+    return _cached_engine
+
+
+def warm_up():
+    """
+    Get retrieval ready before the first request. BM25 loads in
+    milliseconds; dense retrieval warms in the background (hybrid) or
+    here (dense).
+    """
+    if RETRIEVAL_MODE == "dense":
+        _load_dense_retriever(1)
+    else:
+        _load_bm25()
+        if RETRIEVAL_MODE == "hybrid":
+            start_dense_warmup()
+    _load_cached_engine()
+
+
+def invalidate_cache():
+    """Drop cached answers (call after replacing NDMA documents)."""
+    if _cached_engine is not None:
+        _cached_engine.cache.invalidate()
+
+
+def _retrieve(query: str, top_k: int):
+    """Return the top-k NodeWithScore hits for a query (no LLM call)."""
+    return _load_retriever(top_k).retrieve(query)
+
+
+# --------------------------------------------------
+# Extractive protocol (retrieval only, no Groq call)
+# --------------------------------------------------
+# Verbs NDMA documents open their safety steps with
+IMPERATIVE_VERBS = {
+    "avoid", "be", "call", "carry", "check", "clear", "close", "cover",
+    "disconnect", "do", "drink", "drop", "ensure", "evacuate", "follow",
+    "get", "go", "help", "hold", "identify", "inform", "keep", "leave",
+    "listen", "locate", "look", "make", "move", "never", "note", "open",
+    "prepare", "protect", "reach", "remain", "remove", "report", "seek",
+    "shut", "stay", "stop", "store", "switch", "take", "tune", "turn",
+    "use", "wait", "wear",
+}
+
+_LIST_MARKER = re.compile(r"(?:^|\s)(?:\(?\d{1,2}[.)]|\(?[a-h][.)]|[•▪●◦◆■►✓*–-])\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+_WORD = re.compile(r"[a-z']+")
+
+
+def _candidate_steps(text: str):
+    """Split a chunk into (step_text, from_list) candidates."""
+    for block in text.splitlines():
+        parts = _LIST_MARKER.split(block)
+        from_list = len(parts) > 1
+        for part in parts:
+            for sentence in _SENTENCE_END.split(part):
+                sentence = " ".join(sentence.split()).strip(" .;:-")
+                if sentence:
+                    yield sentence, from_list
+
+
+def _is_imperative(step: str) -> bool:
+    words = _WORD.findall(step.lower())
+    if not 3 <= len(words) <= 40:
+        return False
+    if words[0] == "please" and len(words) > 1:
+        words = words[1:]
+    return words[0] in IMPERATIVE_VERBS or words[0] in ("don't", "dont")
+
+
+def _step_key(step: str) -> frozenset:
+    return frozenset(w for w in _WORD.findall(step.lower()) if len(w) > 2)
+
+
+def _is_duplicate(key: frozenset, seen: list) -> bool:
+    for other in seen:
+        union = len(key | other)
+        if union and len(key & other) / union >= 0.7:
+            return True
+    return False
+
+
+def extract_protocol_steps(disaster_type: str, hits, max_steps: int = EXTRACTIVE_MAX_STEPS):
+    """
+    Pull imperative safety steps out of retrieved NDMA chunks.
+
+    Steps are ranked by the retrieval score of their chunk, with a boost
+    for numbered/bulleted list items and for mentions of the disaster
+    type, then deduplicated by word overlap.
+
+    Returns (steps, confidence) where confidence is in 0.0 – 1.0.
+    """
+    disaster = disaster_type.lower()
+    scored = []
+
+    for rank, hit in enumerate(hits):
+        chunk_score = hit.score if hit.score is not None else 1.0 / (rank + 1)
+        for position, (step, from_list) in enumerate(_candidate_steps(hit.node.get_content())):
+            if not _is_imperative(step):
+                continue
+            score = chunk_score
+            score += 0.15 if from_list else 0.0
+            score += 0.10 if disaster in step.lower() else 0.0
+            score -= 0.001 * position   # keep document order within a chunk
+            scored.append((score, step))
+
+    scored.sort(key=lambda s: s[0], reverse=True)
+
+    steps, seen = [], []
+    for _, step in scored:
+        key = _step_key(step)
+        if not key or _is_duplicate(key, seen):
+            continue
+        seen.append(key)
+        steps.append(step[0].upper() + step[1:] + ".")
+        if len(steps) >= max_steps:
+            break
+
+    if not steps or not hits:
+        return steps, 0.0
+
+    top_score = max((h.score or 0.0) for h in hits)
+    coverage = min(1.0, len(steps) / EXTRACTIVE_MIN_STEPS)
+    return steps, round(top_score * coverage, 3)
+
+
+def get_extractive_protocol(disaster_type: str):
+    """
+    Retrieval-only protocol lookup. Returns (protocol_text, confidence);
+    protocol_text is None when nothing usable was extracted.
+    """
+    query = f"{disaster_type} immediate safety steps emergency protocol do's and don'ts"
+    hits = _retrieve(query, EXTRACTIVE_TOP_K)
+    steps, confidence = extract_protocol_steps(disaster_type, hits)
+
+    if not steps:
+        return None, 0.0
+
+    text = "\n".join(f"{i}. {step}" for i, step in enumerate(steps, start=1))
+    return text, confidence
+
+
 # --------------------------------------------------
 # 🔑 THE CALLABLE FUNCTION Vedant's graph.py imports
 # --------------------------------------------------
-def get_protocol(disaster_type: str) -> str:
+def get_protocol(disaster_type: str, mode: str = None, deadline: float = None) -> str:
     """
     Given a disaster type (e.g. 'flood', 'landslide', 'fire'),
     query the NDMA knowledge base and return safety protocol text.
 
+    mode: "extractive" (default, see NIVARAN_PROTOCOL_MODE) answers from
+    the retrieved chunks and only falls back to Groq when extraction
+    confidence is low; "generate" always asks Groq.
+    deadline: absolute time.time() by which the Groq call must finish.
+
     Returns a plain string — ready to drop into AgentState["protocol"].
     """
     if not disaster_type or disaster_type.lower() in ["none", "unknown", "error"]:
         return "No disaster detected. No action required."
 
+    mode = (mode or PROTOCOL_MODE).lower()
     query = f"What are the immediate safety steps and emergency protocol for a {disaster_type}?"
 
     try:
+        if mode == "extractive":
+            protocol, confidence = get_extractive_protocol(disaster_type)
+            if protocol and confidence >= EXTRACTIVE_MIN_CONFIDENCE:
+                _protocol_cache[disaster_type.lower()] = protocol
+                return protocol
+            print(f"ℹ️ Extractive protocol confidence {confidence:.2f} too low, generating with Groq.")
+
         engine = _load_engine()
-        response = engine.query(query)
+        response = engine.query(query, deadline=deadline)
+        _protocol_cache[disaster_type.lower()] = str(response)
         return str(response)
 
     except FileNotFoundError as e:
@@ -121,4 +590,26 @@ def get_protocol(disaster_type: str) -> str:
 
     except Exception as e:
         print(f"❌ RAG error: {e}")
-        return f"⚠️ Protocol lookup failed due to an error. Manual response required for {disaster_type}."
\ No newline at end of file
+        return f"⚠️ Protocol lookup failed due to an error. Manual response required for {disaster_type}."
+
+
+def get_cached_protocol(disaster_type: str):
+    """Last good protocol for this disaster type in this process, or None. Never blocks."""
+    return _protocol_cache.get((disaster_type or "").lower())
+
+
+def ask(question: str) -> str:
+    """
+    Free-form NDMA Q&A for operators. Paraphrases of recent questions
+    are answered from the semantic cache without retrieval or Groq.
+    """
+    try:
+        return _load_cached_engine().query(question)
+
+    except FileNotFoundError as e:
+        print(str(e))
+        return "⚠️ NDMA docs not found. Cannot answer right now."
+
+    except Exception as e:
+        print(f"❌ RAG error: {e}")
+        return "⚠️ Could not answer due to an error."
@@ -0,0 +1,139 @@
+# agents/semantic_cache.py
+"""
+Semantic answer cache in front of the NDMA query engine.
+
+Questions are embedded with the already-loaded bge-small model and
+matched by cosine similarity, so "what to do in a flood" and "flood
+safety steps" share one Groq answer. Entries expire by TTL, the least
+recently used entry is evicted when full, and the whole cache is dropped
+whenever the NDMA corpus version changes.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from llama_index.core import Settings
+
+CACHE_THRESHOLD = float(os.getenv("NIVARAN_CACHE_THRESHOLD", "0.90"))
+CACHE_MAX_ENTRIES = int(os.getenv("NIVARAN_CACHE_MAX_ENTRIES", "256"))
+CACHE_TTL_SECONDS = float(os.getenv("NIVARAN_CACHE_TTL_SECONDS", "3600"))
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        embed_model=None,
+        threshold: float = CACHE_THRESHOLD,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        version: str = "",
+    ):
+        self._embed_model = embed_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = version
+
+        self._entries = OrderedDict()   # question -> (unit embedding, answer, created)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, question: str) -> np.ndarray:
+        embed_model = self._embed_model or Settings.embed_model
+        vector = np.asarray(embed_model.get_query_embedding(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self, now: float):
+        stale = [q for q, (_, _, created) in self._entries.items() if now - created > self.ttl_seconds]
+        for q in stale:
+            del self._entries[q]
+
+    def lookup(self, question: str, embedding: np.ndarray = None):
+        """Return (answer or None, similarity, embedding)."""
+        if embedding is None:
+            embedding = self.embed(question)
+
+        with self._lock:
+            self._expire(time.time())
+
+            if not self._entries:
+                self.misses += 1
+                return None, 0.0, embedding
+
+            keys = list(self._entries)
+            matrix = np.stack([self._entries[k][0] for k in keys])
+            sims = matrix @ embedding
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, similarity, embedding
+
+            self._entries.move_to_end(keys[best])
+            self.hits += 1
+            return self._entries[keys[best]][1], similarity, embedding
+
+    def store(self, question: str, answer: str, embedding: np.ndarray = None):
+        if embedding is None:
+            embedding = self.embed(question)
+
+        with self._lock:
+            self._entries[question] = (embedding, answer, time.time())
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, version: str = None):
+        """Drop every entry; optionally record the new corpus version."""
+        with self._lock:
+            self._entries.clear()
+            if version is not None:
+                self.version = version
+
+    def check_version(self, version: str) -> bool:
+        """Invalidate if the corpus version changed. Returns True if it did."""
+        if version == self.version:
+            return False
+        self.invalidate(version)
+        return True
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class CachedQueryEngine:
+    """Wraps any llama_index query engine with a SemanticCache."""
+
+    def __init__(self, engine, cache: SemanticCache = None, version_fn=None, enabled_fn=None):
+        self.engine = engine
+        self.cache = cache or SemanticCache()
+        self.version_fn = version_fn
+        self.enabled_fn = enabled_fn   # False → bypass (e.g. embedding model not loaded yet)
+        if version_fn is not None:
+            self.cache.version = version_fn()
+
+    def query(self, question: str) -> str:
+        if self.enabled_fn is not None and not self.enabled_fn():
+            return str(self.engine.query(question))
+
+        if self.version_fn is not None and self.cache.check_version(self.version_fn()):
+            print("♻️ NDMA corpus changed, semantic cache cleared.")
+
+        answer, similarity, embedding = self.cache.lookup(question)
+        if answer is not None:
+            print(f"⚡ Semantic cache hit (similarity {similarity:.2f})")
+            return answer
+
+        answer = str(self.engine.query(question))
+        self.cache.store(question, answer, embedding)
+        return answer
@@ -0,0 +1,240 @@
+# agents/vector_store.py
+"""
+Compact NumPy vector store for the NDMA embeddings.
+
+Layout of a store directory:
+    meta.json       dtype, dim, count, corpus fingerprint
+    vectors.npy     float32 / float16 / int8 embeddings (row-normalised)
+    scales.npy      per-row dequantisation scale (int8 only)
+    records.bin     UTF-8 JSON records {"id", "text", "metadata"} back to back
+    offsets.npy     int64 byte offsets into records.bin (count + 1)
+
+Everything is opened with mmap, so the Streamlit app, the video monitor
+and batch runners share one read-only copy through the page cache
+instead of each holding float32 vectors and node text as Python objects.
+Node text is decoded only for the top-k hits.
+"""
+import os
+import json
+import shutil
+import numpy as np
+from typing import List
+
+from llama_index.core import Settings, QueryBundle
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+
+DTYPES = ("float32", "float16", "int8")
+SEARCH_CHUNK_ROWS = 65536
+
+
+class MmapVectorStore:
+    """Read-only, memory-mapped vector store with vectorised top-k search."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+
+        self.path = path
+        self.dtype = self.meta["dtype"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        # mmap refuses an empty file (empty corpus)
+        records = os.path.join(path, "records.bin")
+        self.records = (np.memmap(records, dtype=np.uint8, mode="r") if os.path.getsize(records)
+                        else np.empty(0, dtype=np.uint8))
+        self.scales = None
+        if self.dtype == "int8":
+            self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return int(self.meta["count"])
+
+    @property
+    def fingerprint(self) -> str:
+        return self.meta.get("fingerprint", "")
+
+    # --------------------------------------------------
+    # Build / persist
+    # --------------------------------------------------
+    @classmethod
+    def build(cls, nodes, path: str, dtype: str = "float16", fingerprint: str = ""):
+        """
+        Write pre-embedded llama_index nodes to a store directory.
+
+        The store is written next to `path` and swapped in afterwards, so
+        processes that still have the old files mapped keep reading the
+        old (unlinked) inodes instead of crashing on truncated files.
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"❌ Unknown vector dtype '{dtype}'. Use one of {DTYPES}.")
+
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        vectors = np.asarray([n.embedding for n in nodes], dtype=np.float32)
+        if vectors.ndim != 2:
+            # empty corpus: keep a (0, dim) matrix so every row-wise op below still applies
+            vectors = vectors.reshape(len(nodes), -1 if len(nodes) else 0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+
+        if dtype == "int8":
+            scales = np.abs(vectors).max(axis=1, initial=0.0) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+            np.save(os.path.join(tmp, "vectors.npy"), quantized)
+            np.save(os.path.join(tmp, "scales.npy"), scales.astype(np.float32))
+        else:
+            np.save(os.path.join(tmp, "vectors.npy"), vectors.astype(dtype))
+
+        offsets = [0]
+        with open(os.path.join(tmp, "records.bin"), "wb") as f:
+            for node in nodes:
+                record = json.dumps({
+                    "id": node.node_id,
+                    "text": node.get_content(),
+                    "metadata": node.metadata,
+                }, ensure_ascii=False).encode("utf-8")
+                f.write(record)
+                offsets.append(offsets[-1] + len(record))
+        np.save(os.path.join(tmp, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+        # meta.json last: its presence marks a complete store
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({
+                "dtype": dtype,
+                "dim": int(vectors.shape[1]),
+                "count": len(nodes),
+                "fingerprint": fingerprint,
+            }, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+        return cls(path)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    # --------------------------------------------------
+    # Search
+    # --------------------------------------------------
+    def search(self, query_vector, top_k: int = 5):
+        """Return (row_ids, scores) of the top_k rows by cosine similarity."""
+        n = len(self)
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        q = np.array(query_vector, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+
+        # chunked so int8/float16 rows are upcast a slice at a time
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SEARCH_CHUNK_ROWS):
+            end = min(start + SEARCH_CHUNK_ROWS, n)
+            block = self.vectors[start:end].astype(np.float32, copy=False)
+            scores[start:end] = block @ q
+        if self.scales is not None:
+            scores *= self.scales
+
+        k = min(top_k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def record(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self.records[start:end].tobytes().decode("utf-8"))
+
+
+class MmapRetriever(BaseRetriever):
+    """llama_index retriever over an MmapVectorStore."""
+
+    def __init__(self, store: MmapVectorStore, similarity_top_k: int = 5, embed_model=None):
+        super().__init__()
+        self._store = store
+        self._top_k = similarity_top_k
+        self._embed_model = embed_model
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embed_model = self._embed_model or Settings.embed_model
+            embedding = embed_model.get_query_embedding(query_bundle.query_str)
+
+        rows, scores = self._store.search(embedding, self._top_k)
+        hits = []
+        for row, score in zip(rows, scores):
+            rec = self._store.record(int(row))
+            node = TextNode(id_=rec["id"], text=rec["text"], metadata=rec["metadata"])
+            hits.append(NodeWithScore(node=node, score=float(score)))
+        return hits
+
+
+# ------------------------------
+# MAIN (memory + latency benchmark vs default store)
+# ------------------------------
+if __name__ == "__main__":
+    import sys
+    import time
+    import tempfile
+    import tracemalloc
+    from llama_index.core import VectorStoreIndex
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    from agents.ingest import build_nodes
+
+    Settings.embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+
+    data_path = sys.argv[1] if len(sys.argv) > 1 else "./data/ndma_docs"
+    queries = [
+        "flood evacuation steps", "what to do during an earthquake",
+        "fire exit safety", "landslide warning signs", "first aid for burns",
+        "electrical safety in floods", "shelter after earthquake", "smoke inhalation",
+    ]
+
+    nodes, stats = build_nodes(data_path)
+    print(stats.report())
+    query_vectors = [Settings.embed_model.get_query_embedding(q) for q in queries]
+
+    def _bench(retrieve):
+        t0 = time.perf_counter()
+        rounds = 50
+        for _ in range(rounds):
+            for qv in query_vectors:
+                retrieve(qv)
+        ms = (time.perf_counter() - t0) * 1000 / (rounds * len(query_vectors))
+        return ms
+
+    rows = []
+
+    tracemalloc.start()
+    index = VectorStoreIndex(nodes)
+    default_mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    default_retriever = index.as_retriever(similarity_top_k=5)
+    default_ms = _bench(lambda qv: default_retriever.retrieve(QueryBundle("", embedding=qv)))
+    rows.append(("default (in-memory)", default_mem, 0, default_ms))
+
+    tmp_root = tempfile.mkdtemp(prefix="nivaran_store_")
+    try:
+        for dtype in DTYPES:
+            path = os.path.join(tmp_root, dtype)
+            MmapVectorStore.build(nodes, path, dtype=dtype)
+            disk = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+            tracemalloc.start()
+            store = MmapVectorStore(path)
+            mem = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            mmap_ms = _bench(lambda qv: store.search(qv, 5))
+            rows.append((f"mmap {dtype}", mem, disk, mmap_ms))
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+    print(f"\n{'store':<22}{'heap (KB)':>12}{'disk (KB)':>12}{'query (ms)':>12}")
+    for label, mem, disk, ms in rows:
+        print(f"{label:<22}{mem / 1024:>12.1f}{disk / 1024:>12.1f}{ms:>12.3f}")
@@ -1,9 +1,16 @@
 import os
 import json
-import re
+import time
+import threading
+from typing import List, Literal
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
 from PIL import Image
 from dotenv import load_dotenv
-from google import genai
+from google.genai import types
+from pydantic import BaseModel, Field, ValidationError, create_model
+
+from utils import llm_client
+from utils.metrics import Counters, LatencyHistogram
 
 # Load environment variables
 load_dotenv()
@@ -13,87 +20,381 @@ API_KEY = os.getenv("GOOGLE_API_KEY")
 if not API_KEY:
     raise ValueError("GOOGLE_API_KEY not found in .env file")
 
-# Create Gemini client
-client = genai.Client(api_key=API_KEY)
+# Shared Gemini client (timeouts, retries, breaker: utils/llm_client.py)
+client = llm_client.gemini_client()
+
+# Deadline fast path: duplicate the request if the first one is slow
+HEDGE_AFTER_SECONDS = float(os.getenv("NIVARAN_HEDGE_AFTER", "3"))
+_hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vision-hedge")
+
+
+# ------------------------------
+# Structured output schema
+# ------------------------------
+class Detection(BaseModel):
+    hazard: bool
+    type: Literal["flood", "landslide", "fire", "infrastructure", "none"]
+    severity: Literal["low", "medium", "high"]
+    confidence: float = Field(ge=0.0, le=1.0)
 
 
-def analyze_image(image_path: str) -> dict:
+# ------------------------------
+# Model cascade: cheapest tier first, escalate when the answer is
+# low-confidence or the hazard is high-stakes. Last tier is final.
+# ------------------------------
+VISION_CASCADE = [
+    m.strip() for m in os.getenv("NIVARAN_VISION_CASCADE", "gemini-2.5-flash-lite,gemini-2.5-flash").split(",")
+    if m.strip()
+]
+CASCADE_MIN_CONFIDENCE = float(os.getenv("NIVARAN_CASCADE_MIN_CONFIDENCE", "0.75"))
+CASCADE_HIGH_STAKES_TYPES = {
+    t.strip().lower() for t in os.getenv("NIVARAN_CASCADE_HIGH_STAKES", "fire,landslide").split(",") if t.strip()
+}
+CASCADE_ESCALATE_SEVERITIES = {
+    s.strip().lower() for s in os.getenv("NIVARAN_CASCADE_ESCALATE_SEVERITY", "high").split(",") if s.strip()
+}
+
+VISION_MODEL = VISION_CASCADE[-1]
+
+# per-tier counters (calls / accepted / escalated / errors) and latency
+tier_counters = {model: Counters() for model in VISION_CASCADE}
+tier_latency = {model: LatencyHistogram() for model in VISION_CASCADE}
+
+VISION_PROMPT = (
+    "Disaster detection. Classify this image. "
+    "type: flood|landslide|fire|infrastructure|none. "
+    "severity: low=minor, medium=visible but manageable, high=severe, danger to life. "
+    "confidence: 0-1."
+)
+
+# token / retry counters (read by bench_structured.py)
+usage = Counters()
+
+
+def _unknown_result(kind: str = "unknown") -> dict:
+    return {"hazard": False, "type": kind, "severity": "unknown", "confidence": 0.0}
+
+
+def _json_config(schema):
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=schema,
+        temperature=0.0,
+        max_output_tokens=128,
+        thinking_config=types.ThinkingConfig(thinking_budget=0),
+    )
+
+
+def _record_usage(response):
+    meta = getattr(response, "usage_metadata", None)
+    if meta is not None:
+        usage.inc("prompt_tokens", meta.prompt_token_count or 0)
+        usage.inc("output_tokens", meta.candidates_token_count or 0)
+    usage.inc("calls")
+
+
+def _validate(raw: dict):
+    """Validate raw JSON into a Detection. Returns (detection or None, failed field names)."""
+    if not isinstance(raw, dict):
+        return None, list(Detection.model_fields)
+    try:
+        return Detection.model_validate(raw), []
+    except ValidationError as e:
+        failed = sorted({str(err["loc"][0]) for err in e.errors() if err["loc"]})
+        return None, failed
+
+
+def _retry_fields(img, raw: dict, failed: list, model: str, deadline: float = None) -> dict:
+    """Re-ask Gemini for only the fields that failed validation."""
+    usage.inc("field_retries", len(failed))
+    raw = raw if isinstance(raw, dict) else {}
+    partial = create_model(
+        "DetectionFields",
+        **{name: (Detection.model_fields[name].annotation, Detection.model_fields[name]) for name in failed}
+    )
+    known = {k: v for k, v in raw.items() if k in Detection.model_fields and k not in failed}
+
+    response = llm_client.call(
+        "gemini",
+        client.models.generate_content,
+        model=model,
+        contents=[f"{VISION_PROMPT} Known: {json.dumps(known)}. Return only: {', '.join(failed)}.", img],
+        config=_json_config(partial),
+        deadline=deadline
+    )
+    _record_usage(response)
+    return {**raw, **json.loads(response.text)}
+
+
+def _detect(img, image_path: str, model: str, deadline: float = None) -> dict:
+    """One tier: JSON-mode Gemini call + single-field retry. Raises on API errors."""
+    response = llm_client.call(
+        "gemini",
+        client.models.generate_content,
+        model=model,
+        contents=[VISION_PROMPT, img],
+        config=_json_config(Detection),
+        deadline=deadline
+    )
+    _record_usage(response)
+
+    text = response.text.strip()
+    print(f"\nRAW RESPONSE ({image_path}, {model}):", text)
+
+    try:
+        raw = json.loads(text)
+    except json.JSONDecodeError:
+        raw = {}
+    detection, failed = _validate(raw)
+
+    if detection is None:
+        print(f"   ↻ Retrying invalid field(s): {', '.join(failed)}")
+        detection, failed = _validate(_retry_fields(img, raw, failed, model, deadline))
+
+    if detection is None:
+        print(f"   ⚠️ Invalid vision output after retry: {', '.join(failed)}")
+        return _unknown_result()
+
+    return detection.model_dump()
+
+
+def needs_escalation(result: dict) -> bool:
+    """True if a cheaper tier's answer should be checked by the next tier."""
+    if result.get("type") in ("unknown", "error"):
+        return True
+    if float(result.get("confidence", 0.0)) < CASCADE_MIN_CONFIDENCE:
+        return True
+    if result.get("hazard") and str(result.get("type", "")).lower() in CASCADE_HIGH_STAKES_TYPES:
+        return True
+    return bool(result.get("hazard")) and str(result.get("severity", "")).lower() in CASCADE_ESCALATE_SEVERITIES
+
+
+def _cascade(img, image_path: str, deadline: float = None, start_tier: int = 0) -> dict:
+    result = _unknown_result("error")
+    last = len(VISION_CASCADE) - 1
+
+    for tier in range(start_tier, last + 1):
+        model = VISION_CASCADE[tier]
+        tier_counters[model].inc("calls")
+        t0 = time.perf_counter()
+        try:
+            result = _detect(img, image_path, model, deadline)
+        except Exception as e:
+            tier_counters[model].inc("errors")
+            print(f"Vision Agent Error ({model}):", e)
+            result = _unknown_result("error")
+            if tier == last:
+                break
+            continue
+        finally:
+            tier_latency[model].observe(time.perf_counter() - t0)
+
+        if tier == last or not needs_escalation(result):
+            tier_counters[model].inc("accepted")
+            return result
+
+        tier_counters[model].inc("escalated")
+        print(f"   ⤴️ Escalating from {model} (type={result.get('type')}, confidence={result.get('confidence')})")
+
+    return result
+
+
+def analyze_image(image_path: str, deadline: float = None, start_tier: int = 0,
+                  image_bytes: bytes = None) -> dict:
     """
     Analyze a single image and return structured disaster detection output.
+    deadline: absolute time.time() by which Gemini must have answered.
+    image_bytes: an already encoded JPEG (e.g. a monitor frame); it is
+    sent as is, image_path is then only a label.
+
+    Runs the VISION_CASCADE: each tier answers in JSON mode against the
+    Detection schema, and the next (stronger) tier is asked only when
+    needs_escalation() says so.
     """
 
     try:
+        if image_bytes is not None:
+            img = types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
+            return _cascade(img, image_path, deadline, start_tier)
+
         if not os.path.exists(image_path):
-            return {
-                "hazard": False,
-                "type": "file_not_found",
-                "severity": "unknown",
-                "confidence": 0.0
-            }
+            return _unknown_result("file_not_found")
 
         img = Image.open(image_path)
+        return _cascade(img, image_path, deadline, start_tier)
 
-        prompt = """
-        You are an advanced disaster detection AI.
-
-        Analyze the image carefully.
-
-        Detect if there is:
-        - Flood
-        - Landslide
-        - Fire
-        - Infrastructure damage
-        - Or no disaster
-
-        Determine:
-        - hazard (true/false)
-        - type (flood/landslide/fire/infrastructure/none)
-        - severity (low/medium/high)
-        - confidence (0.0 to 1.0)
-
-        Severity Guidelines:
-        - low: minor issue
-        - medium: visible hazard but manageable
-        - high: severe damage, danger to life
-
-        Respond ONLY in valid JSON format:
-
-        {
-            "hazard": true,
-            "type": "flood",
-            "severity": "high",
-            "confidence": 0.95
-        }
-        """
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[prompt, img]
+    except Exception as e:
+        print("Vision Agent Error:", e)
+        return _unknown_result("error")
+
+
+def cascade_report() -> str:
+    lines = []
+    for model in VISION_CASCADE:
+        c, lat = tier_counters[model].snapshot(), tier_latency[model].snapshot()
+        lines.append(
+            f"🪜 {model:<24} calls={c.get('calls', 0)} accepted={c.get('accepted', 0)} "
+            f"escalated={c.get('escalated', 0)} errors={c.get('errors', 0)} "
+            f"p50={lat['p50_ms']}ms p95={lat['p95_ms']}ms"
         )
+    return "\n".join(lines)
+
+
+def analyze_image_hedged(image_path: str, deadline: float = None,
+                         hedge_after: float = HEDGE_AFTER_SECONDS, image_bytes: bytes = None) -> dict:
+    """
+    Hedged analyze_image(): if the first request has not answered after
+    hedge_after seconds, send a duplicate and take whichever succeeds first.
+    """
+    first = _hedge_pool.submit(analyze_image, image_path, deadline, image_bytes=image_bytes)
+    done, _ = wait([first], timeout=hedge_after)
+    if done:
+        return first.result()
+
+    print(f"⏩ Vision slow after {hedge_after:.1f}s, sending hedged request")
+    second = _hedge_pool.submit(analyze_image, image_path, deadline, image_bytes=image_bytes)
+
+    result = _unknown_result("error")
+    try:
+        for future in as_completed([first, second], timeout=max(0.0, llm_client.remaining(deadline))):
+            result = future.result()
+            if result.get("type") != "error":
+                return result
+    except TimeoutError:
+        print("Vision Agent Error: deadline exceeded")
+    return result
+
+
+# ------------------------------
+# Packed mode: several images, one Gemini request
+# ------------------------------
+PACK_MAX_BATCH = int(os.getenv("NIVARAN_PACK_MAX_BATCH", "8"))
+PACK_TARGET_SECONDS = float(os.getenv("NIVARAN_PACK_TARGET_SECONDS", "8"))
+
 
-        text = response.text.strip()
-        print(f"\nRAW RESPONSE ({image_path}):", text)
+class PackedDetection(Detection):
+    index: int
 
-        match = re.search(r'\{.*\}', text, re.DOTALL)
 
-        if match:
-            return json.loads(match.group())
+class PackedDetections(BaseModel):
+    detections: List[PackedDetection]
+
+
+class AdaptiveBatchSize:
+    """
+    AIMD batch sizing: grow by one after a clean pack that finished under
+    the latency target, halve after a parse failure or a slow pack.
+    """
+
+    def __init__(self, max_size: int = PACK_MAX_BATCH, target_seconds: float = PACK_TARGET_SECONDS):
+        self.max_size = max(1, max_size)
+        self.target_seconds = target_seconds
+        self.size = min(4, self.max_size)
+        self.error_rate = 0.0   # EWMA of failed packs
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, seconds: float):
+        with self._lock:
+            self.error_rate = 0.8 * self.error_rate + 0.2 * (0.0 if ok else 1.0)
+            if ok and seconds <= self.target_seconds and self.error_rate < 0.2:
+                self.size = min(self.max_size, self.size + 1)
+            elif not ok or seconds > self.target_seconds:
+                self.size = max(1, self.size // 2)
+
+
+batch_sizer = AdaptiveBatchSize()
+
+
+def _analyze_pack(paths: list, deadline: float = None) -> list:
+    """One Gemini request for up to N images; per-image fallback for anything unmapped."""
+    results = [None] * len(paths)
+    present = []
+    for i, path in enumerate(paths):
+        if os.path.exists(path):
+            present.append(i)
         else:
-            return {
-                "hazard": False,
-                "type": "unknown",
-                "severity": "unknown",
-                "confidence": 0.0
-            }
+            results[i] = _unknown_result("file_not_found")
+
+    if len(present) <= 1:
+        for i in present:
+            results[i] = analyze_image(paths[i], deadline)
+        return results
+
+    contents = [
+        f"{VISION_PROMPT} There are {len(present)} images. "
+        "Return one detection per image in 'detections', with 'index' = the image number."
+    ]
+    for n, i in enumerate(present, start=1):
+        contents += [f"Image {n}:", Image.open(paths[i])]
+
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        response = llm_client.call(
+            "gemini",
+            client.models.generate_content,
+            model=VISION_CASCADE[0],
+            contents=contents,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=PackedDetections,
+                temperature=0.0,
+                max_output_tokens=64 * len(present) + 64,
+                thinking_config=types.ThinkingConfig(thinking_budget=0),
+            ),
+            deadline=deadline
+        )
+        _record_usage(response)
+        usage.inc("packed_images", len(present))
+
+        for item in json.loads(response.text).get("detections", []):
+            detection, failed = _validate(item)
+            n = item.get("index") if isinstance(item, dict) else None
+            if detection is None or not isinstance(n, int) or not 1 <= n <= len(present):
+                continue
+            results[present[n - 1]] = detection.model_dump()
+
+        ok = all(results[i] is not None for i in present)
+        tier_counters[VISION_CASCADE[0]].inc("calls", len(present))
 
     except Exception as e:
-        print("Vision Agent Error:", e)
-        return {
-            "hazard": False,
-            "type": "error",
-            "severity": "unknown",
-            "confidence": 0.0
-        }
+        print("Vision Agent Error (packed):", e)
+
+    batch_sizer.record(ok, time.perf_counter() - t0)
+
+    # cascade: uncertain / high-stakes packed answers go to the next tier singly
+    if len(VISION_CASCADE) > 1:
+        for i in present:
+            if results[i] is not None and needs_escalation(results[i]):
+                tier_counters[VISION_CASCADE[0]].inc("escalated")
+                results[i] = analyze_image(paths[i], deadline, start_tier=1)
+            elif results[i] is not None:
+                tier_counters[VISION_CASCADE[0]].inc("accepted")
+
+    missing = [i for i in present if results[i] is None]
+    if missing:
+        print(f"   ↻ Packed request left {len(missing)} image(s) unmapped, analyzing singly")
+        usage.inc("pack_fallbacks", len(missing))
+        for i in missing:
+            results[i] = analyze_image(paths[i], deadline)
+
+    return results
+
+
+def analyze_images(image_paths: list, deadline: float = None) -> list:
+    """
+    Analyze many images with packed requests. The pack size adapts to
+    observed latency and error rate. Results are aligned with image_paths.
+    """
+    results = []
+    i = 0
+    while i < len(image_paths):
+        size = batch_sizer.size
+        chunk = image_paths[i:i + size]
+        print(f"\n📦 Packing {len(chunk)} image(s) into one vision request")
+        results.extend(_analyze_pack(chunk, deadline))
+        i += len(chunk)
+    return results
 
 
 def analyze_multiple_images(folder_path: str):
@@ -107,17 +408,17 @@ def analyze_multiple_images(folder_path: str):
         print("Folder not found:", folder_path)
         return results
 
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
-            full_path = os.path.join(folder_path, filename)
-            print(f"\nAnalyzing: {filename}")
-
-            result = analyze_image(full_path)
+    filenames = [
+        f for f in os.listdir(folder_path)
+        if f.lower().endswith((".jpg", ".jpeg", ".png"))
+    ]
+    paths = [os.path.join(folder_path, f) for f in filenames]
 
-            results.append({
-                "image": filename,
-                "result": result
-            })
+    for filename, result in zip(filenames, analyze_images(paths)):
+        results.append({
+            "image": filename,
+            "result": result
+        })
 
     return results
 
@@ -142,3 +443,5 @@ if __name__ == "__main__":
     print("\nFINAL RESULTS (Multiple Images):")
     for r in results:
         print(r)
+
+    print("\n" + cascade_report())
@@ -3,11 +3,21 @@ from PIL import Image
 from datetime import datetime
 import folium
 from streamlit_folium import st_folium
-from graph import app as nivaran_graph
+from utils.records import RecordBuffer
+from utils.metrics import LatencyHistogram
+from utils import profiling
+from utils import dispatch
+from utils.geo_index import shared_index, DEDUP_RADIUS_M, DEDUP_WINDOW_S
+import io
+import uuid
+import functools
 import tempfile
+import time
 import os
 import requests
 
+_script_t0 = time.perf_counter()
+
 
 # ---------------- Page config ----------------
 st.set_page_config(
@@ -28,6 +38,22 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# ---------------- Shared heavy resources (once per server process) ----------------
+@st.cache_resource(show_spinner="Loading Nivaran agents...")
+def load_pipeline():
+    """Compiled graph + warmed NDMA engine, shared by every session."""
+    import graph
+    from agents import policy_agent
+
+    try:
+        policy_agent.warm_up()
+    except Exception as e:
+        print(f"⚠️ NDMA engine warm-up failed: {e}")
+    return graph.run
+
+
+run_graph = load_pipeline()
+
 st.title("🛡️ Nivaran: Disaster Response Dashboard")
 st.caption("UI Mockup: Upload image/video + map marker + incident log + language selector (no backend yet).")
 
@@ -40,10 +66,11 @@ def ss_init(key, value):
 
 ss_init("result", None)
 ss_init("approval_status", "PENDING")
-ss_init("incidents", [])
+ss_init("incidents", RecordBuffer())   # bounded: NIVARAN_RESULT_CAP
 ss_init("location_text", "")
 ss_init("lat", 19.0760)       # Mumbai default
 ss_init("lon", 72.8777)       # Mumbai default
+ss_init("coords_set", False)  # lat/lon searched or edited by the operator (not the default)
 ss_init("alert_en", "")
 ss_init("alert_hi", "")
 ss_init("alert_mr", "")
@@ -62,6 +89,25 @@ ss_init("last_search_name", "")
 ss_init("last_search_lat", None)
 ss_init("last_search_lon", None)
 ss_init("last_search_address", "")
+ss_init("rerun_timings", {})   # scope -> LatencyHistogram (full script / each fragment)
+ss_init("profile_runs", profiling.enabled())   # per session; NIVARAN_PROFILE sets the default
+ss_init("last_profile", None)
+ss_init("preferred_lang", "English")   # picked in the result panel; reruns only that fragment
+
+
+def _timed(scope: str):
+    """Record how long a full run or fragment rerun takes (sidebar Diagnostics)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings = st.session_state.rerun_timings
+                timings.setdefault(scope, LatencyHistogram(window=200)).observe(time.perf_counter() - t0)
+        return wrapper
+    return decorator
 
 
 # ---------------- Helpers ----------------
@@ -94,8 +140,12 @@ def get_marker_color(disaster_type: str) -> str:
     return "gray"
 
 
+MAP_FIELDS = ("id", "type", "severity", "location", "time", "lat", "lon")
+
+
 def _incidents_hashable(incidents_list):
-    return tuple(tuple(sorted(i.items())) for i in incidents_list)
+    # only what the map draws; protocol / alert text stays out of the cache key
+    return tuple(tuple((k, i.get(k)) for k in MAP_FIELDS) for i in incidents_list)
 
 
 def _save_uploaded_to_temp(uploaded_file, suffix: str) -> str:
@@ -115,6 +165,38 @@ def _guess_kind_and_suffix(uploaded_file) -> tuple[str, str]:
     return "image", ext
 
 
+def _media_coords(uploaded_file) -> tuple:
+    """(lat, lon) from an image's EXIF GPS tags, or (None, None)."""
+    try:
+        gps = Image.open(io.BytesIO(uploaded_file.getbuffer())).getexif().get_ifd(0x8825)   # GPSInfo
+        if not all(tag in gps for tag in (1, 2, 3, 4)):
+            return None, None
+
+        def _deg(dms, ref):
+            value = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
+            return -value if ref in ("S", "W") else value
+
+        lat, lon = _deg(gps[2], gps[1]), _deg(gps[4], gps[3])
+    except Exception:
+        return None, None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat, lon) == (0.0, 0.0):
+        return None, None
+    return lat, lon
+
+
+def _report_coords(uploaded_file, kind: str) -> tuple:
+    """
+    Coordinates for proximity dedup: the operator's, if they searched or
+    edited them, else the photo's GPS. Never the Mumbai default, which
+    would merge unrelated same-type uploads into one incident.
+    """
+    if st.session_state.coords_set:
+        return float(st.session_state.lat), float(st.session_state.lon)
+    if kind == "image":
+        return _media_coords(uploaded_file)
+    return None, None
+
+
 # ---------------- Geocoding (Location name -> Lat/Lon) ----------------
 @st.cache_data(show_spinner=False)
 def geocode_place(place_name: str):
@@ -196,12 +278,16 @@ def build_map_cached(incidents_hashable, center_lat, center_lon, zoom=11, search
 
 
 # ---------------- Mock pipeline (Vedant will replace later) ----------------
-def run_pipeline(uploaded_file, kind: str, location_text: str) -> dict:
+def run_pipeline(uploaded_file, kind: str, location_text: str, lat: float = None, lon: float = None,
+                 profile: bool = False) -> dict:
     temp_path = "temp_upload.jpg"
     with open(temp_path, "wb") as f:
         f.write(uploaded_file.getbuffer())
 
-    result = nivaran_graph.invoke({"image_path": temp_path})
+    # lat/lon: a report near an open incident of the same type attaches to it
+    result = run_graph(temp_path, lat=lat, lon=lon, profile=profile)
+    if result.get("profile"):
+        st.session_state.last_profile = result["profile"]
 
     vision = result["vision_output"]
     return {
@@ -217,13 +303,19 @@ def run_pipeline(uploaded_file, kind: str, location_text: str) -> dict:
         "tweet_authority": result.get("tweet_authority", ""),
         "media_kind": kind,
         "media_name": getattr(uploaded_file, "name", "unknown"),
+        "outcome": result.get("outcome", "full"),
+        "vision": vision,
+        "geo_incident": result.get("incident_id"),
+        "duplicate_of": result.get("duplicate_of"),
+        # dispatch identity: reports of one geo incident share its UUID
+        "uid": result.get("incident_uid") or uuid.uuid4().hex,
     }
 
     temp_path = "temp_upload.jpg"
     with open(temp_path, "wb") as f:
         f.write(uploaded_file.getbuffer())
 
-    result = nivaran_graph.invoke({"image_path": temp_path})
+    result = run_graph(temp_path)
 
     vision = result["vision_output"]
     return {
@@ -240,19 +332,25 @@ def run_pipeline(uploaded_file, kind: str, location_text: str) -> dict:
     }
 
 # ---------------- KPI Row ----------------
-incidents = st.session_state.incidents
-total_incidents = len(incidents)
-flood_count = count_by_type(incidents, "Flood")
-landslide_count = count_by_type(incidents, "Landslide")
-fire_count = count_by_type(incidents, "Fire")
-high_count = count_by_severity(incidents, "High")
-
-c1, c2, c3, c4, c5 = st.columns(5)
-c1.metric("📌 Total Incidents", total_incidents)
-c2.metric("🌧️ Flood", flood_count)
-c3.metric("⛰️ Landslide", landslide_count)
-c4.metric("🔥 Fire", fire_count)
-c5.metric("🔴 High Severity", high_count)
+@st.fragment
+@_timed("kpi_row")
+def kpi_row():
+    incidents = [r.to_dict() for r in st.session_state.incidents.newest()]
+    total_incidents = len(incidents)
+    flood_count = count_by_type(incidents, "Flood")
+    landslide_count = count_by_type(incidents, "Landslide")
+    fire_count = count_by_type(incidents, "Fire")
+    high_count = count_by_severity(incidents, "High")
+
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("📌 Total Incidents", total_incidents)
+    c2.metric("🌧️ Flood", flood_count)
+    c3.metric("⛰️ Landslide", landslide_count)
+    c4.metric("🔥 Fire", fire_count)
+    c5.metric("🔴 High Severity", high_count)
+
+
+kpi_row()
 
 st.divider()
 
@@ -293,6 +391,7 @@ if search_btn:
                 # Update both coordinate inputs AND map center
                 st.session_state.lat = float(lat)
                 st.session_state.lon = float(lon)
+                st.session_state.coords_set = True
                 st.session_state.map_center_lat = float(lat)
                 st.session_state.map_center_lon = float(lon)
 
@@ -307,8 +406,11 @@ if search_btn:
 
 # Coordinates (auto-filled by search, but still editable)
 st.sidebar.subheader("📌 Coordinates (auto-filled by search, editable)")
-st.session_state.lat = st.sidebar.number_input("Latitude", value=float(st.session_state.lat), format="%.6f")
-st.session_state.lon = st.sidebar.number_input("Longitude", value=float(st.session_state.lon), format="%.6f")
+lat_input = st.sidebar.number_input("Latitude", value=float(st.session_state.lat), format="%.6f")
+lon_input = st.sidebar.number_input("Longitude", value=float(st.session_state.lon), format="%.6f")
+if (lat_input, lon_input) != (float(st.session_state.lat), float(st.session_state.lon)):
+    st.session_state.coords_set = True
+st.session_state.lat, st.session_state.lon = lat_input, lon_input
 
 # If user edits lat/lon manually, re-center map on those
 st.session_state.map_center_lat = float(st.session_state.lat)
@@ -322,27 +424,43 @@ if st.session_state.last_search_lat is not None and st.session_state.last_search
     if st.session_state.last_search_address:
         st.sidebar.caption(st.session_state.last_search_address)
 
-st.sidebar.subheader("🌐 Preferred Alert Language")
-preferred_lang = st.sidebar.radio("Select language", ["English", "Hindi", "Marathi"], index=0)
-
 st.sidebar.caption("Tip: Type a famous location name and click Search. Map will center and pin it.")
 
+st.sidebar.subheader("🔬 Diagnostics")
+st.sidebar.toggle("Profile pipeline runs", key="profile_runs")
+if st.session_state.profile_runs and st.session_state.last_profile:
+    with st.sidebar.expander("Last profile"):
+        st.code(profiling.report(st.session_state.last_profile))
+rerun_timing_box = st.sidebar.expander("⏱️ Rerun timings (ms)").empty()
+if dispatch.dispatcher() is not None:
+    with st.sidebar.expander("📨 Alert dispatch"):
+        st.code(dispatch.report(dispatch.dispatcher().snapshot()) or "Outbox is empty")
+
 
 # --- Sidebar Map (small, stable) ---
 st.sidebar.markdown("---")
-with st.sidebar.expander("🗺️ Live Map View (click to expand)", expanded=True):
-    searched_marker = None
-    if st.session_state.last_search_lat is not None and st.session_state.last_search_lon is not None:
-        searched_marker = {
-            "name": st.session_state.last_search_name,
-            "lat": st.session_state.last_search_lat,
-            "lon": st.session_state.last_search_lon,
-            "address": st.session_state.last_search_address,
-        }
+def _searched_marker():
+    if st.session_state.last_search_lat is None or st.session_state.last_search_lon is None:
+        return None
+    return {
+        "name": st.session_state.last_search_name,
+        "lat": st.session_state.last_search_lat,
+        "lon": st.session_state.last_search_lon,
+        "address": st.session_state.last_search_address,
+    }
 
-    inc_hash = _incidents_hashable(st.session_state.incidents)
+
+def _map_incidents():
+    return _incidents_hashable(r.to_dict() for r in st.session_state.incidents.newest())
+
+
+@st.fragment
+@_timed("sidebar_map")
+def sidebar_map():
+    # map pan / zoom returns values and reruns only this fragment
+    searched_marker = _searched_marker()
     small_map = build_map_cached(
-        inc_hash,
+        _map_incidents(),
         st.session_state.map_center_lat,
         st.session_state.map_center_lon,
         zoom=13 if searched_marker else 11,
@@ -353,6 +471,11 @@ with st.sidebar.expander("🗺️ Live Map View (click to expand)", expanded=Tru
 
     if st.button("🔍 Expand Map", use_container_width=True):
         st.session_state.map_expanded = True
+        st.rerun()
+
+
+with st.sidebar.expander("🗺️ Live Map View (click to expand)", expanded=True):
+    sidebar_map()
 
 
 # ---------------- Expanded Map (Center Popup) ----------------
@@ -360,18 +483,9 @@ if st.session_state.map_expanded:
     try:
         @st.dialog("🗺️ Expanded Live Map View")
         def show_big_map():
-            searched_marker = None
-            if st.session_state.last_search_lat is not None and st.session_state.last_search_lon is not None:
-                searched_marker = {
-                    "name": st.session_state.last_search_name,
-                    "lat": st.session_state.last_search_lat,
-                    "lon": st.session_state.last_search_lon,
-                    "address": st.session_state.last_search_address,
-                }
-
-            inc_hash2 = _incidents_hashable(st.session_state.incidents)
+            searched_marker = _searched_marker()
             big_map = build_map_cached(
-                inc_hash2,
+                _map_incidents(),
                 st.session_state.map_center_lat,
                 st.session_state.map_center_lon,
                 zoom=14 if searched_marker else 11,
@@ -437,10 +551,208 @@ with left:
             st.rerun()
 
 
+# ---------------- Alert dispatch ----------------
+def _dispatch_id(incident: dict) -> str:
+    # a UUID kept with the incident: INC-/GEO- ids restart with the session / process,
+    # and would make the outbox silently drop a new incident's identical alert text
+    return incident.get("uid")
+
+
+def queue_dispatch(incident: dict, chosen_alert: str):
+    """Put the approved alerts and tweets on the outbox; workers deliver them in the background."""
+    dispatcher = dispatch.dispatcher()
+    if dispatcher is None:
+        return
+    if not _dispatch_id(incident):
+        # result from before incidents carried a uid (session state survives code reloads)
+        st.toast("📨 Not queued: re-run Analyze for this media to dispatch it")
+        return
+    iid = incident.get("id", "cur")
+    if incident.get("duplicate_of"):
+        # attached report: send the incident's own text, so the outbox keys match the
+        # original report's messages instead of adding a second set (e.g. the templates
+        # an attached run falls back to when it times out waiting)
+        geo = shared_index().get(incident.get("geo_incident") or "")
+        if geo is None or not geo.texts:
+            st.toast(f"📨 Not queued: alerts for incident {incident['duplicate_of']} are not ready")
+            return
+        alerts = {lang: geo.texts.get(f"alert_{lang}", "") for lang in ("en", "hi", "mr")}
+        tweets = {"public": geo.texts.get("tweet_public", ""), "authority": geo.texts.get("tweet_authority", "")}
+    else:
+        alerts = {lang: incident.get(f"alert_{lang}", "") for lang in ("en", "hi", "mr")}
+        # the operator may have edited the alert in the selected language
+        alerts[{"English": "en", "Hindi": "hi", "Marathi": "mr"}[st.session_state.preferred_lang]] = chosen_alert
+        tweets = {
+            "public": st.session_state.get(f"pub_tweet_{iid}", incident.get("tweet_public", "")),
+            "authority": st.session_state.get(f"auth_tweet_{iid}", incident.get("tweet_authority", "")),
+        }
+    summary = {
+        k: incident.get(k)
+        for k in ("id", "type", "severity", "location", "lat", "lon", "time", "geo_incident")
+    }
+    planned, queued = dispatcher.dispatch_approved(_dispatch_id(incident), alerts, tweets, summary)
+    if queued:
+        st.toast(f"📨 {queued} message(s) queued for delivery")
+    else:
+        st.toast(f"📨 Already queued ({planned} message(s))")
+
+
+# ---------------- Incident view ----------------
+def render_incident_view(incident: dict):
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Detected", incident.get("detected", "—"))
+    c2.metric("Type", incident.get("type", "—"))
+    c3.metric("Severity", severity_badge(incident.get("severity", "—")))
+
+    st.write(f"**📍 Location:** {incident.get('location', 'Unknown')}")
+    st.write(f"**🧭 Coordinates:** {incident.get('lat', '—')}, {incident.get('lon', '—')}")
+    st.write(f"**🕒 Time:** {incident.get('time', '—')}")
+    st.write(f"**📎 Media:** {incident.get('media_kind', '—')} | {incident.get('media_name', '—')}")
+
+    geo = shared_index().get(incident.get("geo_incident") or "")
+    if geo is not None:
+        st.write(f"**🔗 Incident:** {geo.incident_id} | {geo.reports} report(s)")
+    if incident.get("lat") is not None and incident.get("lon") is not None:
+        nearby = [
+            f"{i.incident_id} ({i.disaster_type}, {d:.0f} m)"
+            for d, i in shared_index().nearby(float(incident["lat"]), float(incident["lon"]))
+            if i is not geo
+        ]
+        if nearby:
+            st.write(
+                f"**📡 Nearby ({DEDUP_RADIUS_M:.0f} m, {DEDUP_WINDOW_S / 60:.0f} min):** " + ", ".join(nearby)
+            )
+
+    status = st.session_state.approval_status
+    if status == "PENDING":
+        st.warning("🟡 Approval Status: PENDING")
+    elif status == "APPROVED":
+        st.success("🟢 Approval Status: APPROVED")
+    else:
+        st.error("🔴 Approval Status: REJECTED")
+
+    st.markdown("### 📘 NDMA Protocol (Mock)")
+    st.success(incident.get("protocol", "—"))
+
+    st.markdown("### 🌐 Alert (Selected Language)")
+    preferred_lang = st.session_state.preferred_lang
+    if preferred_lang == "English":
+        chosen_alert = st.text_area(
+            "Alert (English)",
+            value=incident.get("alert_en", ""),
+            height=120,
+            key=f"chosen_en_{incident.get('id', 'cur')}"
+        )
+    elif preferred_lang == "Hindi":
+        chosen_alert = st.text_area(
+            "Alert (Hindi)",
+            value=incident.get("alert_hi", ""),
+            height=120,
+            key=f"chosen_hi_{incident.get('id', 'cur')}"
+        )
+    else:
+        chosen_alert = st.text_area(
+            "Alert (Marathi)",
+            value=incident.get("alert_mr", ""),
+            height=120,
+            key=f"chosen_mr_{incident.get('id', 'cur')}"
+        )
+
+    st.markdown("### ✅ Human-in-the-Loop Approval")
+    a1, a2 = st.columns(2)
+    if a1.button("✅ Approve Alert", key=f"appr_{incident.get('id', 'cur')}"):
+        st.session_state.approval_status = "APPROVED"
+        queue_dispatch(incident, chosen_alert)
+    if a2.button("❌ Reject Alert", key=f"rej_{incident.get('id', 'cur')}"):
+        st.session_state.approval_status = "REJECTED"
+
+    dispatcher = dispatch.dispatcher()
+    if dispatcher is not None and _dispatch_id(incident):
+        sent = dispatcher.status(_dispatch_id(incident))
+        if sent:
+            st.caption("📨 Dispatch: " + " | ".join(
+                f"{channel} " + ", ".join(f"{n} {status}" for status, n in counts.items())
+                for channel, counts in sent.items()
+            ))
+
+    st.markdown("### 🐦 Tweet Drafts")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("**👥 Public Tweet**")
+        public_tweet = st.text_area(
+            "For general public",
+            value=incident.get("tweet_public", ""),
+            height=140,
+            key=f"pub_tweet_{incident.get('id', 'cur')}"
+        )
+        char1 = len(public_tweet)
+        st.caption(f"{char1}/280 characters")
+        if char1 > 280:
+            st.error("Too long! Shorten it.")
+        else:
+            st.success("✅ Ready to post")
+
+    with col2:
+        st.markdown("**🚨 Authority Tweet**")
+        auth_tweet = st.text_area(
+            "Tags @RailwayMumbai @MumbaiPolice",
+            value=incident.get("tweet_authority", ""),
+            height=140,
+            key=f"auth_tweet_{incident.get('id', 'cur')}"
+        )
+        char2 = len(auth_tweet)
+        st.caption(f"{char2}/280 characters")
+        if char2 > 280:
+            st.error("Too long! Shorten it.")
+        else:
+            st.success("✅ Ready to post")
+
+    # if len(tweet_text) > 280:
+    #     st.error("Tweet is too long! Please shorten the alert.")
+    # else:
+    #     st.info("Tweet length is OK ✅")
+
+    # st.text_area(
+    #     "Tweet Draft (Copy & Paste)",
+    #     value=tweet_text,
+    #     height=120,
+    #     key=f"tweet_{incident.get('id', 'cur')}"
+    # )
+
+
+@st.fragment
+@_timed("incident_log")
+def incident_log():
+    st.subheader("📋 Incident Log")
+    log = st.session_state.incidents.newest()
+    if len(log) == 0:
+        st.info("No incidents yet. Click Analyze to generate a record.")
+    else:
+        options = [
+            f"{i.id} | {i.time} | {i.location} | {i.detection.type.capitalize()} | {i.detection.severity.capitalize()}"
+            for i in log
+        ]
+        selected = st.selectbox("Select an incident to view:", options=options)
+        selected_id = selected.split("|")[0].strip()
+
+        chosen = st.session_state.incidents.get(selected_id)
+        if chosen:
+            render_incident_view(chosen.to_dict())
+
+
 # ---------------- RIGHT: Output + actions ----------------
-with right:
+@st.fragment
+@_timed("result_panel")
+def result_panel():
+    """Analyze / reset, current result tabs and the incident log (reruns alone)."""
+    uploaded_file = st.session_state.current_file
     st.subheader("🤖 AI Output")
 
+    # only the alert views below read the language, so switching it reruns this fragment alone
+    st.radio("🌐 Preferred alert language", ["English", "Hindi", "Marathi"], key="preferred_lang", horizontal=True)
+
     b1, b2 = st.columns([1, 1])
     analyze_btn = b1.button("🚀 Analyze")
     reset_btn = b2.button("🧹 Reset (clear current)")
@@ -457,7 +769,11 @@ with right:
         st.session_state.approval_status = "PENDING"
         with st.spinner("AI Agents are thinking..."):
             kind = st.session_state.current_file_kind or _guess_kind_and_suffix(uploaded_file)[0]
-            result = run_pipeline(uploaded_file, kind, st.session_state.location_text)
+            lat, lon = _report_coords(uploaded_file, kind)
+            result = run_pipeline(
+                uploaded_file, kind, st.session_state.location_text, lat=lat, lon=lon,
+                profile=st.session_state.profile_runs,
+            )
             st.session_state.result = result
 
             st.session_state.alert_en = result.get("alert_en", "")
@@ -466,120 +782,30 @@ with right:
             st.session_state.tweet_public = result.get("tweet_public", "")      # ← ADD
             st.session_state.tweet_authority = result.get("tweet_authority", "") # ← ADD
 
-            incident = {
-                "id": f"INC-{len(st.session_state.incidents)+1:03d}",
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "location": result.get("location", "Unknown"),
-                "lat": float(st.session_state.lat),
-                "lon": float(st.session_state.lon),
-                **result
-            }
-            st.session_state.incidents.insert(0, incident)
+            if not result.get("duplicate_of"):
+                st.session_state.incidents.add(
+                    vision=result["vision"],
+                    result=result,
+                    time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    location=result.get("location", "Unknown"),
+                    lat=float(st.session_state.lat) if lat is None else lat,
+                    lon=float(st.session_state.lon) if lon is None else lon,
+                    media_kind=result.get("media_kind", ""),
+                    media_name=result.get("media_name", ""),
+                    geo_incident=result.get("geo_incident") or "",
+                    uid=result["uid"],
+                )
+        # new incident: KPIs, map and log live outside this fragment
+        st.rerun()
 
     result = st.session_state.result
+    if result is not None and result.get("duplicate_of"):
+        st.info(f"🔗 Same hazard already reported nearby: attached to incident {result['duplicate_of']}.")
 
     tab_flood, tab_landslide, tab_fire, tab_all = st.tabs(
         ["🌧️ Flood", "⛰️ Landslide", "🔥 Fire", "📋 All Incidents"]
     )
 
-    def render_incident_view(incident: dict):
-        c1, c2, c3 = st.columns(3)
-        c1.metric("Detected", incident.get("detected", "—"))
-        c2.metric("Type", incident.get("type", "—"))
-        c3.metric("Severity", severity_badge(incident.get("severity", "—")))
-
-        st.write(f"**📍 Location:** {incident.get('location', 'Unknown')}")
-        st.write(f"**🧭 Coordinates:** {incident.get('lat', '—')}, {incident.get('lon', '—')}")
-        st.write(f"**🕒 Time:** {incident.get('time', '—')}")
-        st.write(f"**📎 Media:** {incident.get('media_kind', '—')} | {incident.get('media_name', '—')}")
-
-        status = st.session_state.approval_status
-        if status == "PENDING":
-            st.warning("🟡 Approval Status: PENDING")
-        elif status == "APPROVED":
-            st.success("🟢 Approval Status: APPROVED")
-        else:
-            st.error("🔴 Approval Status: REJECTED")
-
-        st.markdown("### 📘 NDMA Protocol (Mock)")
-        st.success(incident.get("protocol", "—"))
-
-        st.markdown("### 🌐 Alert (Selected Language)")
-        if preferred_lang == "English":
-            chosen_alert = st.text_area(
-                "Alert (English)",
-                value=st.session_state.alert_en,
-                height=120,
-                key=f"chosen_en_{incident.get('id', 'cur')}"
-            )
-        elif preferred_lang == "Hindi":
-            chosen_alert = st.text_area(
-                "Alert (Hindi)",
-                value=st.session_state.alert_hi,
-                height=120,
-                key=f"chosen_hi_{incident.get('id', 'cur')}"
-            )
-        else:
-            chosen_alert = st.text_area(
-                "Alert (Marathi)",
-                value=st.session_state.alert_mr,
-                height=120,
-                key=f"chosen_mr_{incident.get('id', 'cur')}"
-            )
-
-        st.markdown("### ✅ Human-in-the-Loop Approval")
-        a1, a2 = st.columns(2)
-        if a1.button("✅ Approve Alert", key=f"appr_{incident.get('id', 'cur')}"):
-            st.session_state.approval_status = "APPROVED"
-        if a2.button("❌ Reject Alert", key=f"rej_{incident.get('id', 'cur')}"):
-            st.session_state.approval_status = "REJECTED"
-
-        st.markdown("### 🐦 Tweet Drafts")
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("**👥 Public Tweet**")
-            public_tweet = st.text_area(
-                "For general public",
-                value=st.session_state.tweet_public,
-                height=140,
-                key=f"pub_tweet_{incident.get('id', 'cur')}"
-            )
-            char1 = len(public_tweet)
-            st.caption(f"{char1}/280 characters")
-            if char1 > 280:
-                st.error("Too long! Shorten it.")
-            else:
-                st.success("✅ Ready to post")
-
-        with col2:
-            st.markdown("**🚨 Authority Tweet**")
-            auth_tweet = st.text_area(
-                "Tags @RailwayMumbai @MumbaiPolice",
-                value=st.session_state.tweet_authority,
-                height=140,
-                key=f"auth_tweet_{incident.get('id', 'cur')}"
-            )
-            char2 = len(auth_tweet)
-            st.caption(f"{char2}/280 characters")
-            if char2 > 280:
-                st.error("Too long! Shorten it.")
-            else:
-                st.success("✅ Ready to post")
-
-        # if len(tweet_text) > 280:
-        #     st.error("Tweet is too long! Please shorten the alert.")
-        # else:
-        #     st.info("Tweet length is OK ✅")
-
-        # st.text_area(
-        #     "Tweet Draft (Copy & Paste)",
-        #     value=tweet_text,
-        #     height=120,
-        #     key=f"tweet_{incident.get('id', 'cur')}"
-        # )
-
     with tab_flood:
         st.subheader("🌧️ Flood")
         if result is None:
@@ -608,17 +834,19 @@ with right:
             render_incident_view({"id": "CURRENT", "time": "NOW", "lat": st.session_state.lat, "lon": st.session_state.lon, **result})
 
     with tab_all:
-        st.subheader("📋 Incident Log")
-        if len(st.session_state.incidents) == 0:
-            st.info("No incidents yet. Click Analyze to generate a record.")
-        else:
-            options = [
-                f"{i['id']} | {i['time']} | {i.get('location', 'Unknown')} | {i['type']} | {i['severity']}"
-                for i in st.session_state.incidents
-            ]
-            selected = st.selectbox("Select an incident to view:", options=options)
-            selected_id = selected.split("|")[0].strip()
-
-            chosen = next((i for i in st.session_state.incidents if i["id"] == selected_id), None)
-            if chosen:
-                render_incident_view(chosen)
+        incident_log()
+
+
+with right:
+    result_panel()
+
+
+# ---------------- Rerun timings ----------------
+# full-script time is recorded here; fragment reruns record themselves
+st.session_state.rerun_timings.setdefault("full_script", LatencyHistogram(window=200)).observe(
+    time.perf_counter() - _script_t0
+)
+rerun_timing_box.table({
+    scope: {k: v for k, v in hist.snapshot().items() if k in ("count", "p50_ms", "p95_ms")}
+    for scope, hist in st.session_state.rerun_timings.items()
+})
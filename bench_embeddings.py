@@ -0,0 +1,153 @@
+# bench_embeddings.py
+"""
+Embedding backend comparison: torch (HuggingFaceEmbedding) vs ONNX fp32
+vs ONNX int8, on chunks of the NDMA corpus.
+
+    python bench_embeddings.py [data_path] [max_chunks]
+
+Each backend runs in its own subprocess so startup time and RSS are not
+polluted by the others. Reported per backend:
+    startup    import + model load (s)
+    RSS        resident memory after load + embedding (MB)
+    docs/s     batch document embedding throughput
+    query p50 / p95   single query embedding latency (ms)
+    min cos    lowest cosine similarity to the torch vectors (equivalence)
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+MIN_COSINE = {"onnx": 0.999, "onnx-int8": 0.98}
+QUERIES = [
+    "flood evacuation steps", "what to do during an earthquake", "fire exit safety",
+    "landslide warning signs", "first aid for burns", "electrical safety in floods",
+    "shelter after earthquake", "smoke inhalation", "railway station waterlogging",
+    "how to help trapped passengers",
+]
+QUERY_ROUNDS = 10
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _worker(backend: str, texts_path: str, out_path: str):
+    """Runs in a subprocess: load one backend, embed, dump vectors + timings."""
+    import numpy as np
+
+    t0 = time.perf_counter()
+    if backend == "torch":
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+    else:
+        from agents.onnx_embedding import OnnxEmbedding
+        model = OnnxEmbedding.from_pretrained("BAAI/bge-small-en-v1.5", quantized=backend == "onnx-int8")
+    startup = time.perf_counter() - t0
+
+    with open(texts_path, encoding="utf-8") as f:
+        texts = json.load(f)
+
+    model.embed_batch_size = 64
+    t0 = time.perf_counter()
+    docs = np.asarray(model.get_text_embedding_batch(texts), dtype=np.float32)
+    docs_seconds = time.perf_counter() - t0
+
+    latencies = []
+    for _ in range(QUERY_ROUNDS):
+        for q in QUERIES:
+            t0 = time.perf_counter()
+            model.get_query_embedding(q)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+
+    np.save(out_path + ".docs.npy", docs)
+    np.save(out_path + ".queries.npy", np.asarray(
+        [model.get_query_embedding(q) for q in QUERIES], dtype=np.float32
+    ))
+    with open(out_path, "w") as f:
+        json.dump({
+            "startup_s": startup,
+            "rss_mb": _rss_mb(),
+            "docs_per_s": len(texts) / docs_seconds,
+            "query_p50_ms": latencies[len(latencies) // 2],
+            "query_p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        }, f)
+
+
+def _min_cosine(a, b) -> float:
+    import numpy as np
+
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return float(np.min(np.sum(a * b, axis=1)))
+
+
+# ------------------------------
+# MAIN
+# ------------------------------
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        _worker(sys.argv[2], sys.argv[3], sys.argv[4])
+        sys.exit(0)
+
+    import numpy as np
+    from agents.ingest import build_nodes
+
+    data_path = sys.argv[1] if len(sys.argv) > 1 else "./data/ndma_docs"
+    max_chunks = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+
+    nodes, stats = build_nodes(data_path, embed=False)
+    texts = [n.get_content() for n in nodes[:max_chunks]]
+    print(f"🧪 {len(texts)} chunks from {stats.files} files, {len(QUERIES) * QUERY_ROUNDS} queries")
+
+    # the ONNX backends load an existing export; make it once, outside the timings
+    from agents.onnx_embedding import default_model_dir, export_model, FP32_FILE, INT8_FILE
+    model_dir = default_model_dir("BAAI/bge-small-en-v1.5")
+    if not all(os.path.exists(os.path.join(model_dir, name)) for name in (FP32_FILE, INT8_FILE)):
+        print(f"📦 Exporting BAAI/bge-small-en-v1.5 to ONNX in {model_dir} (one-off, not timed)...")
+        export_model("BAAI/bge-small-en-v1.5", model_dir)
+
+    tmp = tempfile.mkdtemp(prefix="nivaran_embed_bench_")
+    texts_path = os.path.join(tmp, "texts.json")
+    with open(texts_path, "w", encoding="utf-8") as f:
+        json.dump(texts, f)
+
+    results = {}
+    for backend in BACKENDS:
+        out_path = os.path.join(tmp, f"{backend}.json")
+        print(f"▶️ {backend}...")
+        proc = subprocess.run([sys.executable, __file__, "--worker", backend, texts_path, out_path])
+        if proc.returncode != 0:
+            print(f"   ❌ {backend} failed (exit {proc.returncode})")
+            continue
+        with open(out_path) as f:
+            results[backend] = json.load(f)
+        results[backend]["docs"] = np.load(out_path + ".docs.npy")
+        results[backend]["queries"] = np.load(out_path + ".queries.npy")
+
+    print(f"\n{'backend':<12}{'startup s':>10}{'RSS MB':>9}{'docs/s':>9}"
+          f"{'q p50 ms':>10}{'q p95 ms':>10}{'min cos':>9}")
+    failed = [f"{backend} did not run" for backend in BACKENDS if backend not in results]
+    for backend, r in results.items():
+        cos = ""
+        if backend != "torch" and "torch" in results:
+            ref = results["torch"]
+            value = min(_min_cosine(r["docs"], ref["docs"]), _min_cosine(r["queries"], ref["queries"]))
+            cos = f"{value:.4f}"
+            if value < MIN_COSINE[backend]:
+                failed.append(f"{backend} min cosine {value:.4f} < {MIN_COSINE[backend]}")
+        print(f"{backend:<12}{r['startup_s']:>10.2f}{r['rss_mb']:>9.0f}{r['docs_per_s']:>9.1f}"
+              f"{r['query_p50_ms']:>10.2f}{r['query_p95_ms']:>10.2f}{cos:>9}")
+
+    if failed:
+        print("\n❌ Not equivalent: " + "; ".join(failed))
+        sys.exit(1)
+    print("\n✅ ONNX embeddings match torch within tolerance")
@@ -0,0 +1,91 @@
+# bench_memory.py
+"""
+Simulates 24 hours of monitoring (one sample every 5 s) with tracemalloc
+and checks that retained memory stays flat once the result buffer is full.
+
+Each sample produces a graph-style result dict. The protocol text comes
+from a small set of cached protocols, and each new incident gets a fresh
+set of alert drafts. Results are kept the way the dashboard keeps them,
+in a RecordBuffer.
+
+    python bench_memory.py            # bounded RecordBuffer (asserts flat)
+    python bench_memory.py --naive    # old behaviour: list of dicts, for comparison
+"""
+import argparse
+import random
+import tracemalloc
+
+from utils.records import RecordBuffer, RESULT_CAP
+
+SAMPLE_EVERY_SECONDS = 5
+HOURS = 24
+SAMPLES = HOURS * 3600 // SAMPLE_EVERY_SECONDS
+SAMPLES_PER_INCIDENT = 60          # new alert drafts every ~5 minutes
+MAX_GROWTH_BYTES = 256 * 1024      # allowed drift after warm-up
+
+PROTOCOLS = {
+    t: (f"NDMA {t} protocol. " + "Move to higher ground and follow official instructions. " * 60)
+    for t in ("flood", "fire", "landslide", "none")
+}
+
+
+def _result(rng: random.Random, incident: int) -> tuple:
+    disaster_type = rng.choice(("flood", "fire", "landslide", "none"))
+    vision = {
+        "hazard": disaster_type != "none",
+        "type": disaster_type,
+        "severity": rng.choice(("low", "medium", "high")),
+        "confidence": round(rng.random(), 2),
+    }
+    alert = f"Incident {incident}: {disaster_type} reported, avoid the area and use alternate routes. "
+    result = {
+        "vision_output": vision,
+        # fresh string objects every sample, as the graph produces them
+        "protocol": "".join(PROTOCOLS[disaster_type]),
+        "alert_en": alert * 2,
+        "alert_hi": "हिंदी " + alert * 2,
+        "alert_mr": "मराठी " + alert * 2,
+        "tweet_public": alert + "#MumbaiRains #Nivaran",
+        "tweet_authority": "@MumbaiPolice " + alert + "#NivaranAlert",
+        "outcome": "full",
+    }
+    return vision, result
+
+
+def simulate(naive: bool = False, samples: int = SAMPLES) -> list:
+    """Returns (hour, traced bytes) after each simulated hour."""
+    rng = random.Random(7)
+    kept = [] if naive else RecordBuffer(maxlen=RESULT_CAP)
+    per_hour = 3600 // SAMPLE_EVERY_SECONDS
+    curve = []
+
+    tracemalloc.start()
+    for n in range(samples):
+        vision, result = _result(rng, n // SAMPLES_PER_INCIDENT)
+        ts = f"t+{n * SAMPLE_EVERY_SECONDS}s"
+        if naive:
+            kept.insert(0, {"id": f"INC-{n + 1:03d}", "time": ts, "location": "Kurla", **result})
+        else:
+            kept.add(vision, result, time=ts, location="Kurla", lat=19.07, lon=72.88)
+
+        if (n + 1) % per_hour == 0:
+            curve.append(((n + 1) // per_hour, tracemalloc.get_traced_memory()[0]))
+    tracemalloc.stop()
+    return curve
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="24h simulated memory profile")
+    parser.add_argument("--naive", action="store_true", help="keep every result dict (pre-RecordBuffer)")
+    args = parser.parse_args()
+
+    curve = simulate(naive=args.naive)
+    for hour, traced in curve:
+        print(f"   {hour:>2}h  {traced / 1024:>10.1f} KiB")
+
+    # the buffer fills within the first hour at the default cap
+    growth = curve[-1][1] - curve[1][1]
+    print(f"📊 Growth from hour 2 to hour {HOURS}: {growth / 1024:.1f} KiB")
+    if not args.naive:
+        assert growth <= MAX_GROWTH_BYTES, f"memory grew by {growth} bytes"
+        print("✅ Memory is flat")
@@ -0,0 +1,146 @@
+# bench_structured.py
+"""
+Token and latency comparison: legacy free-text prompts vs the
+schema-constrained vision and alert calls. Both vision sides call the
+same single model (VISION_MODEL); the structured side goes through the
+one-tier detector, not the flash-lite → flash cascade, so each sample is
+exactly one call plus any field retry.
+
+    python bench_structured.py [image_folder] [rounds]
+"""
+import os
+import sys
+import time
+from PIL import Image
+
+from agents import vision_agent, alert_agent
+from utils import llm_client
+
+LEGACY_VISION_PROMPT = """
+        You are an advanced disaster detection AI.
+
+        Analyze the image carefully.
+
+        Detect if there is:
+        - Flood
+        - Landslide
+        - Fire
+        - Infrastructure damage
+        - Or no disaster
+
+        Determine:
+        - hazard (true/false)
+        - type (flood/landslide/fire/infrastructure/none)
+        - severity (low/medium/high)
+        - confidence (0.0 to 1.0)
+
+        Severity Guidelines:
+        - low: minor issue
+        - medium: visible hazard but manageable
+        - high: severe damage, danger to life
+
+        Respond ONLY in valid JSON format:
+
+        {
+            "hazard": true,
+            "type": "flood",
+            "severity": "high",
+            "confidence": 0.95
+        }
+        """
+
+LEGACY_ALERT_PROMPT = """You are a disaster alert officer for Mumbai city.
+    A {severity} severity {disaster_type} has been detected at a Mumbai railway station.
+
+    NDMA Protocol summary:
+    {protocol}
+
+    Generate ALL of the following. Follow the format exactly:
+
+    EN: <Public alert in English, max 180 chars, mention alternate routes>
+    HI: <Public alert in Hindi, max 180 chars>
+    MR: <Public alert in Marathi, max 180 chars>
+    PUBLIC_TWEET: <Tweet for general public, max 220 chars, include #MumbaiRains #Nivaran>
+    AUTHORITY_TWEET: <Tweet tagging @RailwayMumbai @MumbaiPolice @NDMA_India, urgent tone, max 220 chars, include #NivaranAlert>
+
+    Only output these 5 lines. Nothing else."""
+
+def _legacy_vision(img):
+    t0 = time.perf_counter()
+    response = vision_agent.client.models.generate_content(
+        model=vision_agent.VISION_MODEL, contents=[LEGACY_VISION_PROMPT, img]
+    )
+    meta = response.usage_metadata
+    return time.perf_counter() - t0, meta.prompt_token_count or 0, meta.candidates_token_count or 0
+
+
+def _structured_vision(img, path):
+    before = vision_agent.usage.snapshot()
+    t0 = time.perf_counter()
+    vision_agent._detect(img, path, vision_agent.VISION_MODEL)
+    after = vision_agent.usage.snapshot()
+    return (
+        time.perf_counter() - t0,
+        after.get("prompt_tokens", 0) - before.get("prompt_tokens", 0),
+        after.get("output_tokens", 0) - before.get("output_tokens", 0),
+    )
+
+
+def _legacy_alert(protocol):
+    t0 = time.perf_counter()
+    response = llm_client.groq_client().chat.completions.create(
+        model=alert_agent.ALERT_MODEL,
+        messages=[{"role": "user", "content": LEGACY_ALERT_PROMPT.format(
+            severity="high", disaster_type="flood", protocol=protocol[:400])}],
+        max_tokens=600,
+    )
+    return time.perf_counter() - t0, response.usage.prompt_tokens, response.usage.completion_tokens
+
+
+def _structured_alert(protocol):
+    before = alert_agent.usage.snapshot()
+    t0 = time.perf_counter()
+    alert_agent.draft_alerts("flood", "high", protocol)
+    after = alert_agent.usage.snapshot()
+    return (
+        time.perf_counter() - t0,
+        after.get("prompt_tokens", 0) - before.get("prompt_tokens", 0),
+        after.get("output_tokens", 0) - before.get("output_tokens", 0),
+    )
+
+
+def _summarize(label, samples):
+    n = len(samples) or 1
+    latency = sum(s[0] for s in samples) / n * 1000
+    prompt = sum(s[1] for s in samples) / n
+    output = sum(s[2] for s in samples) / n
+    print(f"{label:<22}{latency:>12.0f}{prompt:>12.0f}{output:>12.0f}")
+
+
+if __name__ == "__main__":
+    with open("./data/ndma_docs/flood_guidelines.txt") as f:
+        protocol = f.read()
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else "test_images"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    images = [
+        os.path.join(folder, f) for f in sorted(os.listdir(folder))
+        if f.lower().endswith((".jpg", ".jpeg", ".png"))
+    ]
+
+    results = {"vision legacy": [], "vision structured": [], "alert legacy": [], "alert structured": []}
+    for _ in range(rounds):
+        for path in images:
+            with Image.open(path) as img:
+                img.load()
+            results["vision legacy"].append(_legacy_vision(img))
+            results["vision structured"].append(_structured_vision(img, path))
+        results["alert legacy"].append(_legacy_alert(protocol))
+        results["alert structured"].append(_structured_alert(protocol))
+
+    print(f"\n{'call':<22}{'latency ms':>12}{'prompt tok':>12}{'output tok':>12}")
+    for label, samples in results.items():
+        _summarize(label, samples)
+    print(f"\nfield retries: vision={vision_agent.usage.get('field_retries')} "
+          f"alert={alert_agent.usage.get('field_retries')}")
@@ -1,23 +1,40 @@
 import os
+import time
+import operator
 import logging
-from typing import TypedDict
+from typing import TypedDict, Annotated
 from langgraph.graph import StateGraph, END
-from groq import Groq as GroqClient
+from langchain_core.runnables import RunnableConfig
 from dotenv import load_dotenv
 
-from agents.vision_agent import analyze_image
-from agents.policy_agent import get_protocol
+from agents.vision_agent import analyze_image, analyze_image_hedged
+from agents.policy_agent import get_protocol, get_cached_protocol
+from agents.alert_agent import draft_alerts, empty_alerts, template_alerts
+from utils.llm_client import remaining
+from utils import event_log
+from utils import profiling
+from utils.geo_index import shared_index
 
 logging.getLogger("google.ai").setLevel(logging.WARNING)
 load_dotenv()
 
-groq_client = GroqClient(api_key=os.getenv("GROQ_API_KEY"))
+# ------------------------------
+# Deadline budget (seconds)
+# Below these remaining budgets a node takes its fast path.
+# ------------------------------
+RUN_BUDGET_SECONDS = float(os.getenv("NIVARAN_RUN_BUDGET", "20"))
+VISION_HEDGE_BELOW = float(os.getenv("NIVARAN_VISION_HEDGE_BELOW", "12"))
+PROTOCOL_MIN_SECONDS = float(os.getenv("NIVARAN_PROTOCOL_MIN_SECONDS", "6"))
+ALERT_MIN_SECONDS = float(os.getenv("NIVARAN_ALERT_MIN_SECONDS", "4"))
+# how long an attached duplicate waits for the original run's protocol / alerts
+DEDUP_WAIT_SECONDS = float(os.getenv("NIVARAN_DEDUP_WAIT_SECONDS", "15"))
 
 # ------------------------------
 # Define State
 # ------------------------------
 class AgentState(TypedDict):
     image_path: str
+    image_bytes: bytes     # encoded JPEG; when set, image_path is only a label
     vision_output: dict
     protocol: str
     alert_en: str
@@ -25,33 +42,94 @@ class AgentState(TypedDict):
     alert_mr: str
     tweet_public: str      # ← NEW
     tweet_authority: str   # ← NEW
+    deadline: float        # absolute time.time(); missing = no budget
+    detect_only: bool      # stop after detection (monitor debouncing)
+    degraded: Annotated[list, operator.add]   # nodes that used a fast path
+    lat: float             # report location; missing = no proximity dedup
+    lon: float
+    incident_id: str       # geo incident this report belongs to
+    incident_uid: str      # its UUID (stable across restarts, unlike incident_id)
+    duplicate_of: str      # set when the report attached to an existing incident
 
 
-workflow = StateGraph(AgentState)
+def _budget(state: AgentState) -> float:
+    """Seconds left in this run's budget (inf when the run has no deadline)."""
+    deadline = state.get("deadline")
+    return float("inf") if deadline is None else remaining(deadline)
 
 
 # ------------------------------
 # Node 1: Vision
 # ------------------------------
 def detection_node(state: AgentState):
+    if state.get("vision_output"):
+        # detection already done by the caller (e.g. an incident transition)
+        return {}
+
     print(f"\n🔍 Running Vision Agent on: {state['image_path']}")
-    result = analyze_image(state["image_path"])
+    deadline = state.get("deadline")
+
+    if _budget(state) < VISION_HEDGE_BELOW:
+        print(f"⏱️ {_budget(state):.1f}s left, using hedged vision request")
+        result = analyze_image_hedged(
+            state["image_path"], deadline=deadline, image_bytes=state.get("image_bytes")
+        )
+        return {"vision_output": result, "degraded": ["detect"]}
+
+    result = analyze_image(state["image_path"], deadline=deadline, image_bytes=state.get("image_bytes"))
+    if result.get("type") == "error":
+        # Gemini failed or the vision deadline passed: the run has no real detection
+        return {"vision_output": result, "degraded": ["detect"]}
     return {"vision_output": result}
 
 
+# ------------------------------
+# Node 1b: Proximity dedup
+# ------------------------------
+def dedup_node(state: AgentState, config: RunnableConfig = None):
+    index = ((config or {}).get("configurable") or {}).get("incident_index")
+    vision = state["vision_output"]
+    if index is None or not vision.get("hazard") or state.get("lat") is None or state.get("lon") is None:
+        return {}
+
+    disaster_type = vision.get("type", "unknown")
+    incident, action = index.claim(state["lat"], state["lon"], disaster_type, vision.get("severity"))
+    if action != "attach":
+        return {"incident_id": incident.incident_id, "incident_uid": incident.uid}
+
+    print(f"🔗 Attached to open {disaster_type} incident {incident.incident_id} ({incident.reports} reports)")
+    update = {"incident_id": incident.incident_id, "incident_uid": incident.uid,
+              "duplicate_of": incident.incident_id}
+    if incident.ready.wait(timeout=max(0.0, min(DEDUP_WAIT_SECONDS, _budget(state)))) and incident.texts:
+        return {**update, **incident.texts}
+
+    # the original run is still drafting (or failed): same fast path as a tight budget
+    protocol = get_cached_protocol(disaster_type) or (
+        f"⚠️ Follow NDMA {disaster_type} guidelines. Full protocol pending."
+    )
+    return {**update, "protocol": protocol, **template_alerts(disaster_type), "degraded": ["dedup"]}
+
+
 # ------------------------------
 # Node 2: NDMA Protocol
 # ------------------------------
 def protocol_node(state: AgentState):
     vision = state["vision_output"]
 
-    if vision.get("hazard"):
-        disaster_type = vision.get("type", "unknown")
-        print(f"\n📚 Querying NDMA knowledge base for: {disaster_type}")
-        protocol = get_protocol(disaster_type)
-    else:
-        protocol = "No disaster detected. No action required."
+    if not vision.get("hazard"):
+        return {"protocol": "No disaster detected. No action required."}
 
+    disaster_type = vision.get("type", "unknown")
+
+    if _budget(state) < PROTOCOL_MIN_SECONDS:
+        print(f"⏱️ {_budget(state):.1f}s left, using cached NDMA protocol for: {disaster_type}")
+        protocol = get_cached_protocol(disaster_type) or (
+            f"⚠️ Follow NDMA {disaster_type} guidelines. Full protocol pending."
+        )
+        return {"protocol": protocol, "degraded": ["get_rules"]}
+
+    print(f"\n📚 Querying NDMA knowledge base for: {disaster_type}")
+    protocol = get_protocol(disaster_type, deadline=state.get("deadline"))
     return {"protocol": protocol}
 
 
@@ -62,110 +140,212 @@ def alert_node(state: AgentState):
     vision = state["vision_output"]
 
     if not vision.get("hazard"):
-        return {
-            "alert_en": "", "alert_hi": "", "alert_mr": "",
-            "tweet_public": "", "tweet_authority": ""
-        }
+        return empty_alerts()
 
     disaster_type = vision.get("type", "unknown")
     severity = vision.get("severity", "unknown")
-    protocol = state["protocol"]
+
+    if _budget(state) < ALERT_MIN_SECONDS:
+        print(f"⏱️ {_budget(state):.1f}s left, using templated alerts for: {disaster_type}")
+        return {**template_alerts(disaster_type), "degraded": ["draft_alert"]}
 
     print(f"\n🌐 Generating multilingual alerts for: {disaster_type} ({severity})")
+    try:
+        alerts, sources = draft_alerts(disaster_type, severity, state["protocol"], deadline=state.get("deadline"))
+    except Exception as e:
+        print(f"❌ Alert generation failed: {e}")
+        return {**template_alerts(disaster_type), "degraded": ["draft_alert"]}
 
-    prompt = f"""You are a disaster alert officer for Mumbai city.
-    A {severity} severity {disaster_type} has been detected at a Mumbai railway station.
+    fallbacks = [field for field, source in sources.items() if source == "template"]
+    if fallbacks:
+        print(f"⚠️ Template alert(s) for: {', '.join(fallbacks)}")
+        return {**alerts, "degraded": ["alerts_partial"]}
+    return alerts
 
-    NDMA Protocol summary:
-    {protocol[:400]}
+# ------------------------------
+# Build Graph
+# ------------------------------
+def route_after_detect(state: AgentState):
+    return END if state.get("detect_only") else "dedup"
 
-    Generate ALL of the following. Follow the format exactly:
 
-    EN: <Public alert in English, max 180 chars, mention alternate routes>
-    HI: <Public alert in Hindi, max 180 chars>
-    MR: <Public alert in Marathi, max 180 chars>
-    PUBLIC_TWEET: <Tweet for general public, max 220 chars, include #MumbaiRains #Nivaran>
-    AUTHORITY_TWEET: <Tweet tagging @RailwayMumbai @MumbaiPolice @NDMA_India, urgent tone, max 220 chars, include #NivaranAlert>
+def route_after_dedup(state: AgentState):
+    return END if state.get("duplicate_of") else "get_rules"
 
-    Only output these 5 lines. Nothing else."""
 
-    try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=600
-        )
+def build_graph(wrap=None):
+    """Compile the graph; wrap(name, fn) decorates each node (profiling)."""
+    wrap = wrap or (lambda name, fn: fn)
+    workflow = StateGraph(AgentState)
 
-        text = response.choices[0].message.content.strip()
-        print(f"\n📢 Raw Alert Output:\n{text}")
-
-        output = {
-            "alert_en": "", "alert_hi": "", "alert_mr": "",
-            "tweet_public": "", "tweet_authority": ""
-        }
-
-        for line in text.splitlines():
-            line = line.strip()
-            if line.startswith("EN:"):
-                output["alert_en"] = line[3:].strip()
-            elif line.startswith("HI:"):
-                output["alert_hi"] = line[3:].strip()
-            elif line.startswith("MR:"):
-                output["alert_mr"] = line[3:].strip()
-            elif line.startswith("PUBLIC_TWEET:"):
-                output["tweet_public"] = line[13:].strip()
-            elif line.startswith("AUTHORITY_TWEET:"):
-                output["tweet_authority"] = line[16:].strip()
-
-        return output
+    workflow.add_node("detect", wrap("detect", detection_node))
+    workflow.add_node("dedup", wrap("dedup", dedup_node))
+    workflow.add_node("get_rules", wrap("get_rules", protocol_node))
+    workflow.add_node("draft_alert", wrap("draft_alert", alert_node))
 
-    except Exception as e:
-        print(f"❌ Alert generation failed: {e}")
-        return {
-            "alert_en": f"⚠️ {disaster_type.capitalize()} alert. Follow NDMA guidelines.",
-            "alert_hi": f"⚠️ {disaster_type} चेतावनी। NDMA दिशानिर्देशों का पालन करें।",
-            "alert_mr": f"⚠️ {disaster_type} इशारा। NDMA मार्गदर्शक तत्त्वांचे पालन करा।",
-            "tweet_public": f"⚠️ {disaster_type.capitalize()} detected in Mumbai. Stay safe. #MumbaiRains #Nivaran",
-            "tweet_authority": f"@RailwayMumbai @MumbaiPolice 🚨 {disaster_type.capitalize()} HIGH severity. Immediate action needed. #NivaranAlert"
-        }
+    workflow.set_entry_point("detect")
+    workflow.add_conditional_edges("detect", route_after_detect, ["dedup", END])
+    workflow.add_conditional_edges("dedup", route_after_dedup, ["get_rules", END])
+    workflow.add_edge("get_rules", "draft_alert")
+    workflow.add_edge("draft_alert", END)
+    return workflow.compile()
+
+
+app = build_graph()
+_profiled_app = None
 
-# ------------------------------
-# Build Graph
-# ------------------------------
-workflow.add_node("detect", detection_node)
-workflow.add_node("get_rules", protocol_node)
-workflow.add_node("draft_alert", alert_node)
 
-workflow.set_entry_point("detect")
-workflow.add_edge("detect", "get_rules")
-workflow.add_edge("get_rules", "draft_alert")
-workflow.add_edge("draft_alert", END)
+def _get_profiled_app():
+    """Same graph with timed nodes; compiled on first profiled run only."""
+    global _profiled_app
+    if _profiled_app is None:
+        _profiled_app = build_graph(wrap=profiling.timed_node)
+    return _profiled_app
 
-app = workflow.compile()
+
+def _invoke(compiled, state: dict, config: dict, index) -> dict:
+    """
+    compiled.invoke(), but if the run fails after claiming an incident it
+    discards the claim, so reports attached to it stop waiting.
+    """
+    last = state
+    try:
+        for last in compiled.stream(state, config=config, stream_mode="values"):
+            pass
+    except Exception:
+        if last.get("incident_id") and not last.get("duplicate_of"):
+            index.discard(last["incident_id"])
+        raise
+    return last
+
+
+def run(image_path: str, budget_seconds: float = RUN_BUDGET_SECONDS, camera: str = None,
+        incident_index=None, profile: bool = None, **extra) -> dict:
+    """
+    Invoke the graph with an end-to-end deadline. budget_seconds <= 0
+    disables the budget. The result carries "outcome" ("full" or
+    "degraded"), the degraded node names and "elapsed_s". Every run is
+    appended to the event log (utils/event_log.py) tagged with camera.
+    With profile=True (default: profiling.enabled(), the process flag) the
+    run is sampled and timed per node (utils/profiling.py); the summary is
+    returned as "profile" when this run opened the session.
+
+    When lat / lon are passed, a hazard is deduplicated against open
+    incidents nearby (utils/geo_index.py, the shared index unless
+    incident_index is given). A duplicate skips protocol and alerts and
+    returns the existing incident's, with "duplicate_of" set.
+    """
+    state = {"image_path": image_path, "degraded": [], **extra}
+    if budget_seconds and budget_seconds > 0:
+        state["deadline"] = time.time() + budget_seconds
+    index = incident_index if incident_index is not None else shared_index()
+    config = {"configurable": {"incident_index": index}}
+
+    t0 = time.perf_counter()
+    if profile is None:
+        profile = profiling.enabled()
+    if profile:
+        with profiling.profiled(f"run-{os.path.basename(image_path)}") as session:
+            result = _invoke(_get_profiled_app(), state, config, index)
+        result["profile"] = session.summary   # None when joined an outer session
+    else:
+        result = _invoke(app, state, config, index)
+    result.setdefault("protocol", "")
+    result.pop("image_bytes", None)
+    result["elapsed_s"] = round(time.perf_counter() - t0, 2)
+    result["outcome"] = "degraded" if result.get("degraded") else "full"
+
+    if result["outcome"] == "degraded":
+        print(f"⏱️ Run degraded ({', '.join(result['degraded'])}) in {result['elapsed_s']}s")
+    if result.get("incident_id") and not result.get("duplicate_of"):
+        # this run opened or escalated the incident: attached reports reuse its text
+        index.complete(result["incident_id"], result)
+
+    vision = result.get("vision_output") or {}
+    event_log.emit(
+        "run",
+        camera=camera,
+        image=image_path,
+        hazard=vision.get("hazard"),
+        type=vision.get("type"),
+        severity=vision.get("severity"),
+        confidence=vision.get("confidence"),
+        detect_only=bool(extra.get("detect_only")),
+        outcome=result["outcome"],
+        degraded=result.get("degraded", []),
+        incident_id=result.get("incident_id"),
+        duplicate_of=result.get("duplicate_of"),
+        elapsed_s=result["elapsed_s"],
+    )
+    return result
 
 
 # ------------------------------
 # MAIN
 # ------------------------------
 if __name__ == "__main__":
-    folder_path = "test_images"
+    import argparse
+    from agents.alert_agent import ALERT_FIELDS
+    from agents.vision_agent import analyze_images, batch_sizer
+    from utils.checkpoint import Checkpoint, checkpoint_name
+
+    parser = argparse.ArgumentParser(description="Run Nivaran on a folder of images")
+    parser.add_argument("folder", nargs="?", default="test_images")
+    parser.add_argument("--resume", action="store_true", help="skip images completed by a previous run")
+    args = parser.parse_args()
+    folder_path = args.folder
 
     if not os.path.exists(folder_path):
         print("Folder not found:", folder_path)
         exit()
 
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
-            full_path = os.path.join(folder_path, filename)
-
-            result = app.invoke({"image_path": full_path})
-
-            print("\n" + "="*50)
-            print("FINAL OUTPUT:")
-            print(f"  Hazard:   {result['vision_output'].get('type')}")
-            print(f"  Severity: {result['vision_output'].get('severity')}")
-            print(f"  Protocol:\n{result['protocol']}")
-            print(f"\n  Alert (EN): {result['alert_en']}")
-            print(f"  Alert (HI): {result['alert_hi']}")
-            print(f"  Alert (MR): {result['alert_mr']}")
-            print("="*50)
\ No newline at end of file
+    checkpoint = Checkpoint(checkpoint_name("folder", folder_path))
+    done = set()
+    if args.resume and checkpoint.load().get("folder") == os.path.abspath(folder_path):
+        done = {r["image"] for r in checkpoint.results()}
+        print(f"⏩ Resuming: {len(done)} image(s) already done")
+    else:
+        checkpoint.clear()
+
+    pending = [
+        filename for filename in sorted(os.listdir(folder_path))
+        if filename.lower().endswith((".jpg", ".jpeg", ".png")) and filename not in done
+    ]
+
+    try:
+        while pending:
+            # vision for a whole pack in one request (size adapts to latency / errors),
+            # then protocol + alerts per image with the detection pre-filled
+            size = batch_sizer.size
+            chunk, pending = pending[:size], pending[size:]
+            paths = [os.path.join(folder_path, filename) for filename in chunk]
+
+            for filename, full_path, vision in zip(chunk, paths, analyze_images(paths)):
+                degraded = ["detect"] if vision.get("type") == "error" else []
+                result = run(full_path, vision_output=vision, degraded=degraded)
+
+                print("\n" + "="*50)
+                print("FINAL OUTPUT:")
+                print(f"  Hazard:   {result['vision_output'].get('type')}")
+                print(f"  Severity: {result['vision_output'].get('severity')}")
+                print(f"  Protocol:\n{result['protocol']}")
+                print(f"\n  Alert (EN): {result['alert_en']}")
+                print(f"  Alert (HI): {result['alert_hi']}")
+                print(f"  Alert (MR): {result['alert_mr']}")
+                print(f"  Outcome:    {result['outcome']} ({result['elapsed_s']}s)")
+                print("="*50)
+
+                # the full result, so a resumed sweep has every image's protocol and alerts
+                checkpoint.record({
+                    "image": filename,
+                    "vision_output": result["vision_output"],
+                    "protocol": result["protocol"],
+                    **{key: result.get(key, "") for key in ALERT_FIELDS},
+                    "outcome": result["outcome"],
+                    "degraded": result.get("degraded", []),
+                    "incident_id": result.get("incident_id"),
+                })
+                checkpoint.maybe_save(folder=os.path.abspath(folder_path))
+    finally:
+        checkpoint.save(folder=os.path.abspath(folder_path))
+        checkpoint.close()
@@ -0,0 +1,228 @@
+# rag_eval.py
+"""
+Offline retrieval tuning for the NDMA RAG.
+
+    python rag_eval.py
+    python rag_eval.py --chunk-sizes 256,512,1024 --overlaps 32,128 --top-ks 3,5,8
+    python rag_eval.py --modes hybrid,dense,bm25
+
+For every (chunk_size, chunk_overlap) the corpus is chunked and embedded
+once with agents/ingest.build_nodes(). The chunks are then indexed the
+way the app retrieves them (agents/policy_agent.py):
+
+    dense           NIVARAN_VECTOR_STORE: the mmap store at
+                    NIVARAN_VECTOR_DTYPE, or llama_index's in-memory index
+    bm25            the BM25 index
+    hybrid          both, fused by RRF as HybridRetriever does once the
+                    dense side is warm
+
+--modes defaults to NIVARAN_RETRIEVAL. Each (mode, top_k) is then run
+over the labelled queries in data/rag_eval/queries.jsonl, which measures:
+
+    recall@k        share of each query's expected NDMA passages found in
+                    the top-k chunks (case-insensitive substring with all
+                    whitespace removed: pypdf splits words, "earthq uakes")
+    latency         retrieval wall time per query (embed + search), p50/p95
+    prompt tokens   tokens of the QA prompt that _load_engine() would send
+                    to Groq with those k chunks as context
+
+The winner has the best recall across all modes run. Configs within --recall-tolerance of it
+count as ties, and among those the fewest prompt tokens wins, then the
+lowest p95 latency. The winner is written to data/rag_profile.json,
+which agents/policy_agent.py reads at import.
+"""
+import os
+import re
+import json
+import time
+import argparse
+import itertools
+import tempfile
+from datetime import datetime
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.utils import get_tokenizer
+
+from agents import policy_agent
+from agents.ingest import build_nodes, corpus_fingerprint
+from agents.vector_store import MmapVectorStore, MmapRetriever
+from agents.bm25_index import BM25Index, BM25Retriever, reciprocal_rank_fusion
+from utils.metrics import LatencyHistogram
+
+QUERIES_PATH = "./data/rag_eval/queries.jsonl"
+
+DEFAULT_CHUNK_SIZES = [256, 512, 1024]
+DEFAULT_OVERLAPS = [32, 128]
+DEFAULT_TOP_KS = [3, 5, 8]
+MODES = ("hybrid", "dense", "bm25")
+
+
+def _norm(text: str) -> str:
+    return re.sub(r"\s+", "", text).lower()
+
+
+def load_queries(path: str = QUERIES_PATH) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _prompt_tokens(tokenizer, context: str, query: str) -> int:
+    prompt = (
+        policy_agent.SYSTEM_PROMPT
+        + f"\n\nContext:\n{context}\n\nQuestion: {query}\nAnswer:"
+    )
+    return len(tokenizer(prompt))
+
+
+def build_retrieve(mode: str, nodes: list, workdir: str):
+    """
+    Index nodes for one retrieval mode; returns retrieve(query, top_k).
+    Mirrors HybridRetriever / _load_dense_retriever in policy_agent.
+    """
+    dense = lexical = None
+    if mode in ("dense", "hybrid"):
+        if policy_agent.VECTOR_STORE == "mmap":
+            store = MmapVectorStore.build(
+                nodes, os.path.join(workdir, f"dense_{policy_agent.VECTOR_DTYPE}"),
+                dtype=policy_agent.VECTOR_DTYPE,
+            )
+            dense = lambda k: MmapRetriever(store, similarity_top_k=k)
+        else:
+            index = VectorStoreIndex(nodes)
+            dense = lambda k: index.as_retriever(similarity_top_k=k)
+    if mode in ("bm25", "hybrid"):
+        bm25 = BM25Index.build(nodes, os.path.join(workdir, "bm25"))
+        lexical = lambda k: BM25Retriever(bm25, similarity_top_k=k)
+
+    def retrieve(query: str, top_k: int):
+        if mode == "dense":
+            return dense(top_k).retrieve(query)
+        if mode == "bm25":
+            return lexical(top_k).retrieve(query)
+        candidates = max(top_k, policy_agent.RRF_CANDIDATES)
+        return reciprocal_rank_fusion(
+            [dense(candidates).retrieve(query), lexical(candidates).retrieve(query)],
+            top_k, k=policy_agent.RRF_K,
+        )
+    return retrieve
+
+
+def evaluate(retrieve, queries: list, top_k: int, tokenizer) -> dict:
+    latency = LatencyHistogram()
+    recalls, tokens = [], []
+
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = retrieve(q["query"], top_k)
+        latency.observe(time.perf_counter() - t0)
+
+        texts = [h.node.get_content() for h in hits]
+        haystack = _norm("\n".join(texts))
+        expected = q.get("expected", [])
+        found = sum(1 for phrase in expected if _norm(phrase) in haystack)
+        recalls.append(found / len(expected) if expected else 1.0)
+        tokens.append(_prompt_tokens(tokenizer, "\n\n".join(texts), q["query"]))
+
+    snap = latency.snapshot()
+    return {
+        "recall": round(sum(recalls) / len(recalls), 4),
+        "prompt_tokens": round(sum(tokens) / len(tokens), 1),
+        "latency_p50_ms": snap["p50_ms"],
+        "latency_p95_ms": snap["p95_ms"],
+    }
+
+
+def sweep(chunk_sizes, overlaps, top_ks, queries, modes) -> list:
+    tokenizer = get_tokenizer()
+    embed = any(mode != "bm25" for mode in modes)
+    if embed:
+        policy_agent.ensure_embed_model()
+    results = []
+
+    for chunk_size, overlap in itertools.product(chunk_sizes, overlaps):
+        if overlap >= chunk_size:
+            continue
+        print(f"📂 Chunking corpus: chunk_size={chunk_size} overlap={overlap}")
+        nodes, stats = build_nodes(
+            policy_agent.DATA_PATH, exts=policy_agent.DOC_EXTS,
+            chunk_size=chunk_size, chunk_overlap=overlap, embed=embed,
+        )
+
+        with tempfile.TemporaryDirectory(prefix="rag_eval-") as workdir:
+            for mode in modes:
+                retrieve = build_retrieve(mode, nodes, os.path.join(workdir, mode))
+                for top_k in top_ks:
+                    metrics = evaluate(retrieve, queries, top_k, tokenizer)
+                    row = {"retrieval": mode, "vector_store": policy_agent.VECTOR_STORE,
+                           "chunk_size": chunk_size, "chunk_overlap": overlap,
+                           "similarity_top_k": top_k, "chunks": stats.chunks, **metrics}
+                    results.append(row)
+                    print(
+                        f"   {mode:<6} k={top_k:<2} recall@k={row['recall']:.3f} "
+                        f"prompt_tokens={row['prompt_tokens']:.0f} "
+                        f"p50={row['latency_p50_ms']:.1f}ms p95={row['latency_p95_ms']:.1f}ms"
+                    )
+    return results
+
+
+def _modes(value: str) -> list:
+    modes = [m.strip().lower() for m in value.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown retrieval mode(s) {unknown}; use {MODES}")
+    return modes
+
+
+def pick_best(results: list, recall_tolerance: float) -> dict:
+    best_recall = max(r["recall"] for r in results)
+    ties = [r for r in results if r["recall"] >= best_recall - recall_tolerance]
+    return min(ties, key=lambda r: (r["prompt_tokens"], r["latency_p95_ms"]))
+
+
+def _csv_ints(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+# ------------------------------
+# MAIN
+# ------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep NDMA RAG retrieval settings")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--chunk-sizes", type=_csv_ints, default=DEFAULT_CHUNK_SIZES)
+    parser.add_argument("--overlaps", type=_csv_ints, default=DEFAULT_OVERLAPS)
+    parser.add_argument("--top-ks", type=_csv_ints, default=DEFAULT_TOP_KS)
+    parser.add_argument("--modes", type=_modes, default=[policy_agent.RETRIEVAL_MODE],
+                        help="retrieval modes to evaluate (default: NIVARAN_RETRIEVAL)")
+    parser.add_argument("--recall-tolerance", type=float, default=0.02)
+    parser.add_argument("--out", default=policy_agent.RAG_PROFILE_PATH)
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    print(f"🧪 {len(queries)} labelled queries from {args.queries}")
+
+    results = sweep(args.chunk_sizes, args.overlaps, args.top_ks, queries, args.modes)
+    best = pick_best(results, args.recall_tolerance)
+
+    profile = {
+        "chunk_size": best["chunk_size"],
+        "chunk_overlap": best["chunk_overlap"],
+        "similarity_top_k": best["similarity_top_k"],
+        "retrieval": best["retrieval"],
+        "vector_store": best["vector_store"],
+        "metrics": {k: best[k] for k in ("recall", "prompt_tokens", "latency_p50_ms", "latency_p95_ms")},
+        "corpus": corpus_fingerprint(policy_agent.DATA_PATH, policy_agent.DOC_EXTS),
+        "queries": len(queries),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "grid": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+
+    print(
+        f"\n✅ Best: {best['retrieval']} chunk_size={best['chunk_size']} overlap={best['chunk_overlap']} "
+        f"k={best['similarity_top_k']} recall@k={best['recall']:.3f} "
+        f"prompt_tokens={best['prompt_tokens']:.0f}"
+    )
+    print(f"📝 Profile written to {args.out}")
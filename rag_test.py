@@ -1,31 +1,39 @@
 import os
 import logging
 from dotenv import load_dotenv
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
-from llama_index.llms.groq import Groq
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+from agents.ingest import build_index, corpus_fingerprint
 
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("groq").setLevel(logging.WARNING)
 
-# 1. Load API Key
-load_dotenv()
-groq_api_key = os.getenv("GROQ_API_KEY")
 
-if not groq_api_key:
-    raise ValueError("❌ GROQ_API_KEY not found! Check your .env file.")
+def configure():
+    # Kept out of module scope: ingest workers are spawned and re-import
+    # this script as __mp_main__, and must not load torch / the LLM client.
+    from llama_index.core import Settings
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    from utils import llm_client
+
+    # 1. Load API Key
+    load_dotenv()
+    groq_api_key = os.getenv("GROQ_API_KEY")
+
+    if not groq_api_key:
+        raise ValueError("❌ GROQ_API_KEY not found! Check your .env file.")
+
+    # 2. Configure LLM + Embeddings
+    Settings.llm = llm_client.groq_llm("llama-3.1-8b-instant")
+    Settings.embed_model = HuggingFaceEmbedding(
+        model_name="BAAI/bge-small-en-v1.5"
+    )
 
-# 2. Configure LLM + Embeddings
-Settings.llm = Groq(
-    model="llama-3.1-8b-instant",
-    api_key=groq_api_key
-)
-Settings.embed_model = HuggingFaceEmbedding(
-    model_name="BAAI/bge-small-en-v1.5"
-)
 
 def run_rag_test():
+    from agents.semantic_cache import CachedQueryEngine
+
     print("🚀 Initializing Nivaran RAG Test...")
+    configure()
 
     # 3. Data path
     data_path = "./data/ndma_docs"
@@ -36,21 +44,18 @@ def run_rag_test():
         return
 
     try:
-        # 4. Load PDFs
+        # 4. Load PDFs + 5. Build Vector Index (parallel parse, batched embed)
         print(f"📂 Loading NDMA PDFs from {data_path}...")
-        documents = SimpleDirectoryReader(
-            data_path,
-            recursive=True,
-            required_exts=[".pdf"]
-        ).load_data()
-
-        print(f"✅ Loaded {len(documents)} document pages.")
+        index, stats = build_index(data_path, exts=[".pdf"])
 
-        # 5. Build Vector Index
-        index = VectorStoreIndex.from_documents(documents)
+        print(f"✅ Loaded {stats.pages} document pages.")
+        print(stats.report())
 
-        # 6. Create Query Engine
-        query_engine = index.as_query_engine()
+        # 6. Create Query Engine (paraphrased questions hit the semantic cache)
+        query_engine = CachedQueryEngine(
+            index.as_query_engine(),
+            version_fn=lambda: corpus_fingerprint(data_path, [".pdf"]),
+        )
 
         # 7. User Question Loop
         print("\n🧠 Nivaran RAG is ready. Ask your questions!")
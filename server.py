@@ -0,0 +1,547 @@
+# server.py
+"""
+Headless async inference server for the Nivaran graph.
+
+    python server.py --port 8080            # real graph (Gemini + Groq)
+    python server.py --port 8080 --stub     # stub backends, for load tests
+
+Endpoints
+    POST /v1/analyze          one image: raw image/* body, multipart "image",
+                              or JSON {"image_b64": ...}; ?camera=...&lat=...&lon=...
+                              &origin=operator|auto&captured_at=<epoch s>
+    POST /v1/analyze/batch    several images: multipart files or
+                              JSON {"images_b64": [...]}
+    POST /v1/video            JSON {"video_path": ..., "location": ..., "every": 5,
+                                    "lat": ..., "lon": ...}; video_path is
+                              relative to MEDIA_ROOT, at most MAX_VIDEO_JOBS run at once
+    GET  /v1/jobs/{id}        video job status
+    GET  /healthz
+    GET  /metrics
+
+Concurrent requests are coalesced into micro-batches: the batcher waits
+up to BATCH_WINDOW_MS after the first queued image for more (up to
+MAX_BATCH) and hands the batch to the backend in one call, which packs
+the images into one vision request. Past MAX_QUEUE queued images new
+requests get 429 with Retry-After.
+
+The queue is a PriorityScheduler (utils/scheduler.py). Frames from a
+camera whose last result was severe, and operator requests, go first.
+Routine frames age up so they are not starved, stale routine frames are
+dropped, and a full queue sheds lower classes before rejecting. Dropped
+requests get 503 with the reason. /metrics shows queue wait per class.
+
+With lat/lon a hazard near an open incident of the same type attaches
+to it (utils/geo_index.py): the response carries "duplicate_of" and
+that incident's protocol and alerts, without redrafting them.
+
+The server binds 127.0.0.1 unless --host says otherwise.
+"""
+import os
+import json
+import time
+import uuid
+import base64
+import asyncio
+import binascii
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from utils.metrics import Counters, LatencyHistogram
+from utils.scheduler import PriorityScheduler, ORIGINS
+
+MAX_QUEUE = int(os.getenv("NIVARAN_SERVER_MAX_QUEUE", "256"))
+MAX_BATCH = int(os.getenv("NIVARAN_SERVER_MAX_BATCH", "8"))
+BATCH_WINDOW_MS = float(os.getenv("NIVARAN_SERVER_BATCH_WINDOW_MS", "25"))
+BACKEND_WORKERS = int(os.getenv("NIVARAN_SERVER_WORKERS", "4"))
+MAX_BODY_BYTES = 32 * 1024 * 1024
+MAX_JOBS = int(os.getenv("NIVARAN_SERVER_MAX_JOBS", "200"))
+MAX_VIDEO_JOBS = int(os.getenv("NIVARAN_SERVER_MAX_VIDEO_JOBS", "2"))
+MEDIA_ROOT = os.getenv("NIVARAN_SERVER_MEDIA_ROOT", "./media")
+HOST = os.getenv("NIVARAN_SERVER_HOST", "127.0.0.1")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Dropped(Exception):
+    """A queued request was dropped by the scheduler ("stale" or "shed")."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# --------------------------------------------------
+# Backends
+# --------------------------------------------------
+class GraphBackend:
+    """The real pipeline: packed vision for the batch, then protocol + alerts per image."""
+
+    name = "graph"
+
+    def __init__(self):
+        from graph import run
+        from agents.vision_agent import analyze_images
+
+        self._run = run
+        self._analyze_images = analyze_images
+
+    def run_batch(self, items: list) -> list:
+        detections = self._analyze_images([item["path"] for item in items])
+        results = []
+        for item, vision in zip(items, detections):
+            result = self._run(
+                item["path"], camera=item.get("camera"), vision_output=vision,
+                lat=item.get("lat"), lon=item.get("lon"),
+            )
+            results.append(_public_result(result))
+        return results
+
+    def run_video(self, video_path: str, location: str, every: int, lat: float = None, lon: float = None):
+        from video_monitor import monitor_video
+
+        monitor_video(video_path, location=location, sample_every_seconds=every, resume=True, lat=lat, lon=lon)
+
+    def metrics(self) -> dict:
+        from utils import llm_client
+
+        return llm_client.metrics()
+
+
+class StubBackend:
+    """
+    No network: deterministic fake detections derived from the image
+    hash, with a fixed per-batch + per-image latency.
+    """
+
+    name = "stub"
+
+    def __init__(self, batch_ms: float = 300, per_image_ms: float = 40):
+        self.batch_ms = batch_ms
+        self.per_image_ms = per_image_ms
+
+    def run_batch(self, items: list) -> list:
+        time.sleep((self.batch_ms + self.per_image_ms * len(items)) / 1000.0)
+        results = []
+        for item in items:
+            with open(item["path"], "rb") as f:
+                digest = hashlib.sha1(f.read()).digest()
+            hazard = digest[0] % 3 == 0
+            disaster_type = ("flood", "fire", "landslide")[digest[1] % 3] if hazard else "none"
+            severity = ("low", "medium", "high")[digest[2] % 3] if hazard else "low"
+            results.append({
+                "vision_output": {
+                    "hazard": hazard,
+                    "type": disaster_type,
+                    "severity": severity,
+                    "confidence": round(0.5 + digest[3] / 510, 2),
+                },
+                "protocol": "Stub protocol." if hazard else "No disaster detected. No action required.",
+                "alert_en": f"Stub {disaster_type} alert." if hazard else "",
+                "alert_hi": "", "alert_mr": "", "tweet_public": "", "tweet_authority": "",
+                "outcome": "full",
+            })
+        return results
+
+    def run_video(self, video_path: str, location: str, every: int, lat: float = None, lon: float = None):
+        time.sleep(self.batch_ms / 1000.0)
+
+    def metrics(self) -> dict:
+        return {}
+
+
+def _public_result(result: dict) -> dict:
+    keys = ("vision_output", "protocol", "alert_en", "alert_hi", "alert_mr",
+            "tweet_public", "tweet_authority", "outcome", "degraded", "elapsed_s",
+            "incident_id", "duplicate_of")
+    return {k: result.get(k) for k in keys if k in result}
+
+
+# --------------------------------------------------
+# Micro-batcher
+# --------------------------------------------------
+class MicroBatcher:
+    def __init__(self, backend, max_batch: int = MAX_BATCH, window_ms: float = BATCH_WINDOW_MS,
+                 max_queue: int = MAX_QUEUE, workers: int = BACKEND_WORKERS):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self.max_queue = max_queue
+        self.scheduler = PriorityScheduler()
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nivaran-batch")
+        self._slots = asyncio.Semaphore(workers)
+        self._ready = asyncio.Event()
+
+        self.counters = Counters()
+        self.latency = LatencyHistogram()
+        self.queue_wait = LatencyHistogram()
+        self.batch_sizes = Counters()
+
+    def reserve(self, n: int, cls: str = "low"):
+        """
+        Admission control: reserve n queue slots or raise QueueFull. When
+        full, queued requests of lower classes than cls are shed first,
+        but only if that frees enough room; otherwise nothing is shed and
+        this request is rejected.
+        """
+        overflow = self.pending + n - self.max_queue
+        if overflow > 0:
+            if self.scheduler.evictable(cls) < overflow:
+                self.counters.inc("rejected", n)
+                raise QueueFull()
+            for ticket in self.scheduler.evict(cls, overflow):
+                self._drop(ticket, "shed")
+        self.pending += n
+
+    async def submit(self, item: dict, origin: str = "auto", captured_at: float = None) -> dict:
+        """Queue one (already reserved) item and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self.scheduler.push(item, source=item.get("camera"), origin=origin,
+                            captured_at=captured_at, future=future)
+        self._ready.set()
+        return await future
+
+    def _drop(self, ticket, reason: str):
+        self.pending -= 1
+        self.counters.inc(f"dropped_{reason}")
+        if not ticket.future.done():
+            ticket.future.set_exception(Dropped(reason))
+        _remove_temp(ticket.item)
+
+    def _pop(self):
+        for ticket in self.scheduler.drop_stale():
+            self._drop(ticket, "stale")
+        return self.scheduler.pop()
+
+    async def _collect(self) -> list:
+        """Up to max_batch tickets in priority order, waiting at most window after the first."""
+        batch, deadline = [], None
+        while len(batch) < self.max_batch:
+            ticket = self._pop()
+            if ticket is not None:
+                batch.append(ticket)
+                if deadline is None:
+                    deadline = time.perf_counter() + self.window
+                continue
+
+            timeout = None if deadline is None else deadline - time.perf_counter()
+            if timeout is not None and timeout <= 0:
+                break
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        while True:
+            # take a worker slot first, so the batch is picked by priority
+            # when it can actually run, not while it waits for a slot
+            await self._slots.acquire()
+            batch = await self._collect()
+            asyncio.create_task(self._execute(batch))
+
+    async def _execute(self, batch: list):
+        started = time.time()
+        for ticket in batch:
+            self.queue_wait.observe(started - ticket.enqueued)
+        self.batch_sizes.inc(str(len(batch)))
+
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.backend.run_batch, [ticket.item for ticket in batch]
+            )
+            for ticket, result in zip(batch, results):
+                self.latency.observe(time.time() - ticket.enqueued)
+                self.scheduler.note_result(ticket.source, result.get("vision_output"))
+                if not ticket.future.done():
+                    ticket.future.set_result(result)
+            self.counters.inc("completed", len(batch))
+        except Exception as e:
+            self.counters.inc("failed", len(batch))
+            for ticket in batch:
+                if not ticket.future.done():
+                    ticket.future.set_exception(e)
+        finally:
+            self.pending -= len(batch)
+            self._slots.release()
+            for ticket in batch:
+                _remove_temp(ticket.item)
+
+    def snapshot(self) -> dict:
+        return {
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            **self.counters.snapshot(),
+            "batch_sizes": self.batch_sizes.snapshot(),
+            "latency": self.latency.snapshot(),
+            "queue_wait": self.queue_wait.snapshot(),
+            "scheduler": self.scheduler.snapshot(),
+        }
+
+
+def _remove_temp(item: dict):
+    try:
+        os.remove(item["path"])
+    except OSError:
+        pass
+
+
+# --------------------------------------------------
+# HTTP handlers
+# --------------------------------------------------
+def _write_temp(data: bytes) -> str:
+    fd, path = tempfile.mkstemp(suffix=".jpg", prefix="nivaran_srv_")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+class BadRequest(ValueError):
+    """Malformed request body; answered with 400 and the message."""
+
+
+async def _json_body(request: web.Request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise BadRequest("invalid JSON body")
+    if not isinstance(body, dict):
+        raise BadRequest("JSON body must be an object")
+    return body
+
+
+def _bad_request(e: BadRequest) -> web.Response:
+    return web.json_response({"error": str(e)}, status=400)
+
+
+def _media_path(video_path) -> str:
+    """Resolve a client-supplied video path inside MEDIA_ROOT, or raise BadRequest."""
+    if not isinstance(video_path, str) or not video_path:
+        raise BadRequest("video_path required")
+    root = os.path.realpath(MEDIA_ROOT)
+    path = os.path.realpath(os.path.join(root, video_path))
+    if os.path.commonpath([root, path]) != root:
+        raise BadRequest("video_path must be inside the media root")
+    if not os.path.isfile(path):
+        raise BadRequest("video_path not found")
+    return path
+
+
+async def _read_images(request: web.Request) -> list:
+    """Return the list of image byte strings in the request body."""
+    ctype = request.content_type or ""
+
+    if ctype.startswith("multipart/"):
+        images = []
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename or part.name in ("image", "images"):
+                images.append(await part.read(decode=True))
+        return images
+
+    if ctype == "application/json":
+        body = await _json_body(request)
+        encoded = body.get("images_b64") or ([body["image_b64"]] if "image_b64" in body else [])
+        if not isinstance(encoded, list) or not all(isinstance(b, str) for b in encoded):
+            raise BadRequest("images_b64 must be a list of base64 strings")
+        try:
+            return [base64.b64decode(b, validate=True) for b in encoded]
+        except binascii.Error:
+            raise BadRequest("invalid base64 image")
+
+    return [await request.read()]
+
+
+def _too_busy(batcher: MicroBatcher) -> web.Response:
+    return web.json_response(
+        {"error": "queue full", "pending": batcher.pending},
+        status=429,
+        headers={"Retry-After": "1"},
+    )
+
+
+def _coords(source) -> tuple:
+    """(lat, lon) floats from a query / JSON mapping, or (None, None). Raises ValueError."""
+    lat, lon = source.get("lat"), source.get("lon")
+    if lat is None or lon is None:
+        return None, None
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat/lon out of range")
+    return lat, lon
+
+
+async def _analyze(request: web.Request, images: list) -> list:
+    batcher = request.app["batcher"]
+    lat, lon = _coords(request.query)
+    origin = request.query.get("origin", "auto")
+    if origin not in ORIGINS:
+        raise ValueError(f"origin must be one of {ORIGINS}")
+    captured_at = float(request.query["captured_at"]) if "captured_at" in request.query else None
+    camera = request.query.get("camera")
+
+    batcher.reserve(len(images), batcher.scheduler.classify(camera, origin))
+    try:
+        items = [{"path": _write_temp(data), "camera": camera, "lat": lat, "lon": lon} for data in images]
+    except OSError:
+        batcher.pending -= len(images)
+        raise
+    return await asyncio.gather(*(batcher.submit(item, origin, captured_at) for item in items))
+
+
+def _dropped(e: Dropped) -> web.Response:
+    return web.json_response({"error": "dropped", "reason": e.reason}, status=503)
+
+
+async def handle_analyze(request: web.Request) -> web.Response:
+    try:
+        images = await _read_images(request)
+    except BadRequest as e:
+        return _bad_request(e)
+    if len(images) != 1 or not images[0]:
+        return web.json_response({"error": "send exactly one image"}, status=400)
+    try:
+        results = await _analyze(request, images)
+    except QueueFull:
+        return _too_busy(request.app["batcher"])
+    except Dropped as e:
+        return _dropped(e)
+    except ValueError:
+        return web.json_response({"error": "invalid lat/lon/origin/captured_at"}, status=400)
+    return web.json_response(results[0])
+
+
+async def handle_batch(request: web.Request) -> web.Response:
+    try:
+        images = [img for img in await _read_images(request) if img]
+    except BadRequest as e:
+        return _bad_request(e)
+    if not images:
+        return web.json_response({"error": "no images"}, status=400)
+    try:
+        results = await _analyze(request, images)
+    except QueueFull:
+        return _too_busy(request.app["batcher"])
+    except Dropped as e:
+        return _dropped(e)
+    except ValueError:
+        return web.json_response({"error": "invalid lat/lon/origin/captured_at"}, status=400)
+    return web.json_response({"results": results})
+
+
+async def handle_video(request: web.Request) -> web.Response:
+    try:
+        body = await _json_body(request)
+        video_path = _media_path(body.get("video_path"))
+    except BadRequest as e:
+        return _bad_request(e)
+    try:
+        lat, lon = _coords(body)
+        every = int(body.get("every", 5))
+        if every <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return web.json_response({"error": "invalid lat/lon/every"}, status=400)
+
+    jobs = request.app["jobs"]
+    if sum(1 for job in jobs.values() if job["status"] == "running") >= MAX_VIDEO_JOBS:
+        return web.json_response(
+            {"error": "too many video jobs", "max_video_jobs": MAX_VIDEO_JOBS},
+            status=429,
+            headers={"Retry-After": "30"},
+        )
+
+    job_id = uuid.uuid4().hex[:12]
+    jobs[job_id] = {"status": "running", "video_path": video_path, "started": time.time()}
+    # keep the job table bounded: forget the oldest finished jobs
+    for old_id in [j for j, job in jobs.items() if job["status"] != "running"][:max(0, len(jobs) - MAX_JOBS)]:
+        del jobs[old_id]
+
+    async def _job():
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                request.app["video_pool"], request.app["backend"].run_video,
+                video_path, str(body.get("location", "Unknown")), every, lat, lon,
+            )
+            jobs[job_id]["status"] = "done"
+        except Exception as e:
+            jobs[job_id].update(status="failed", error=str(e))
+        jobs[job_id]["finished"] = time.time()
+
+    asyncio.create_task(_job())
+    return web.json_response({"job_id": job_id}, status=202)
+
+
+async def handle_job(request: web.Request) -> web.Response:
+    job = request.app["jobs"].get(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"error": "unknown job"}, status=404)
+    return web.json_response(job)
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    batcher = request.app["batcher"]
+    return web.json_response({
+        "status": "ok",
+        "backend": request.app["backend"].name,
+        "pending": batcher.pending,
+        "max_queue": batcher.max_queue,
+    })
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.json_response({
+        "batcher": request.app["batcher"].snapshot(),
+        "backend": request.app["backend"].metrics(),
+    }, dumps=lambda o: json.dumps(o, default=str))
+
+
+def create_app(backend) -> web.Application:
+    app = web.Application(client_max_size=MAX_BODY_BYTES)
+    app["backend"] = backend
+    app["jobs"] = {}
+    app["video_pool"] = ThreadPoolExecutor(max_workers=MAX_VIDEO_JOBS, thread_name_prefix="nivaran-video")
+
+    async def _start(app):
+        app["batcher"] = MicroBatcher(backend)
+        app["batcher_task"] = asyncio.create_task(app["batcher"].run())
+
+    async def _stop(app):
+        app["batcher_task"].cancel()
+        app["batcher"].executor.shutdown(wait=False)
+        app["video_pool"].shutdown(wait=False)
+
+    app.on_startup.append(_start)
+    app.on_cleanup.append(_stop)
+
+    app.router.add_post("/v1/analyze", handle_analyze)
+    app.router.add_post("/v1/analyze/batch", handle_batch)
+    app.router.add_post("/v1/video", handle_video)
+    app.router.add_get("/v1/jobs/{job_id}", handle_job)
+    app.router.add_get("/healthz", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+# ------------------------------
+# MAIN
+# ------------------------------
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Nivaran inference server")
+    parser.add_argument("--host", default=HOST, help="0.0.0.0 exposes the server to the network")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--stub", action="store_true", help="use stub model backends (no API keys needed)")
+    args = parser.parse_args()
+
+    backend = StubBackend() if args.stub else GraphBackend()
+    print(f"🛰️ Nivaran server on {args.host}:{args.port} (backend: {backend.name})")
+    web.run_app(create_app(backend), host=args.host, port=args.port)
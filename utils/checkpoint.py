@@ -0,0 +1,116 @@
+# utils/checkpoint.py
+"""
+Durable checkpoints for long video / folder runs.
+
+Two files per checkpoint:
+    <name>.json            small state (frame offset, counters, ...),
+                           rewritten atomically: tmp file → fsync → os.replace
+    <name>.results.jsonl   completed results, append-only
+
+The state records the byte length of the results file at save time. On
+resume, anything appended after the last save is truncated, so results
+and state always agree and the work after the last save is simply redone.
+
+Checkpoints for an input file or folder are named with checkpoint_name(),
+which hashes the absolute path (plus size and mtime for a file), so two
+inputs that share a basename never read or clear each other's checkpoint.
+"""
+import os
+import json
+import hashlib
+
+CHECKPOINT_DIR = os.getenv("NIVARAN_CHECKPOINT_DIR", "./checkpoints")
+CHECKPOINT_EVERY = int(os.getenv("NIVARAN_CHECKPOINT_EVERY", "3"))
+
+
+def checkpoint_name(kind: str, path: str) -> str:
+    """'<kind>-<basename>-<hash>' for an input path; a changed file gets a new name."""
+    path = os.path.abspath(path)
+    key = path
+    if os.path.isfile(path):
+        st = os.stat(path)
+        key += f"|{st.st_size}|{int(st.st_mtime)}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:10]
+    return f"{kind}-{os.path.basename(path)}-{digest}"
+
+
+class Checkpoint:
+    def __init__(self, name: str, directory: str = CHECKPOINT_DIR, every: int = CHECKPOINT_EVERY):
+        os.makedirs(directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+        self.state_path = os.path.join(directory, f"{safe}.json")
+        self.results_path = os.path.join(directory, f"{safe}.results.jsonl")
+        self.every = max(1, every)
+        self._results = None
+        self._pending = 0
+
+    # --------------------------------------------------
+    # Read side
+    # --------------------------------------------------
+    def load(self) -> dict:
+        """Saved state ({} if none). Drops results written after that state."""
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+
+        size = state.get("_results_bytes", 0)
+        if os.path.exists(self.results_path) and os.path.getsize(self.results_path) > size:
+            with open(self.results_path, "r+b") as f:
+                f.truncate(size)
+        return state
+
+    def results(self):
+        """Iterate completed results (generator)."""
+        if not os.path.exists(self.results_path):
+            return
+        with open(self.results_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    # --------------------------------------------------
+    # Write side
+    # --------------------------------------------------
+    def record(self, result: dict):
+        """Append one completed result (made durable by the next save())."""
+        if self._results is None:
+            self._results = open(self.results_path, "a", encoding="utf-8")
+        self._results.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+        self._pending += 1
+
+    def save(self, **state):
+        results_bytes = 0
+        if self._results is not None:
+            self._results.flush()
+            os.fsync(self._results.fileno())
+            results_bytes = self._results.tell()
+        elif os.path.exists(self.results_path):
+            results_bytes = os.path.getsize(self.results_path)
+
+        state["_results_bytes"] = results_bytes
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+        self._pending = 0
+
+    def maybe_save(self, **state) -> bool:
+        """save() once every `every` recorded results."""
+        if self._pending >= self.every:
+            self.save(**state)
+            return True
+        return False
+
+    def clear(self):
+        self.close()
+        for path in (self.state_path, self.results_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        if self._results is not None:
+            self._results.close()
+            self._results = None
@@ -0,0 +1,557 @@
+# utils/dispatch.py
+"""
+Durable, batched alert dispatch after human approval.
+
+Before this module, approving an alert in the dashboard only flipped
+approval_status. The EN/HI/MR alerts and tweet drafts were then copied
+by hand, and any real send from the Streamlit script would block it for
+as long as the fan-out takes. Now approval only writes to an outbox.
+Async workers deliver the messages in the background.
+
+Outbox
+    One SQLite file (WAL, BEGIN IMMEDIATE), shared by every process on
+    the host. Each message is one row, keyed by an idempotency key:
+    sha1(incident | channel | recipient | text), where incident is a
+    UUID stored with the incident (never a counter id such as INC-001,
+    which repeats after a restart and would swallow a new incident's
+    identical template text). Approving the same alert twice, or from
+    two browser tabs, inserts nothing new.
+
+Workers
+    Each channel gets WORKERS coroutines on a background event loop.
+    A worker claims up to the channel's batch size of due rows. The
+    claim sets a lease, and a lease that expires (the process died
+    mid-send) makes those rows due again. The worker sends them as one
+    batch, then marks them sent or schedules a retry with exponential
+    backoff. After MAX_ATTEMPTS a row is marked failed. Claims are
+    atomic, so the dashboard and server can both run dispatchers.
+
+Channels (pluggable, see register_channel)
+    sms       one row per recipient, in the recipient's language
+    social    public + authority tweet
+    webhook   incident summary JSON; POSTed with aiohttp to the
+              NIVARAN_DISPATCH_WEBHOOKS URLs, several messages per POST,
+              each with its own "key" (no batch-level Idempotency-Key:
+              rows retried later are re-batched differently)
+    By default each channel writes to a local stand-in,
+    <OUTBOX_DIR>/<channel>.jsonl. The stand-in skips keys it already
+    holds, so a batch retried after a crash is still delivered once. A
+    real gateway gets the key as its client reference / Idempotency-Key.
+
+Delivery latency (enqueue → delivered) is tracked per channel.
+
+    python -m utils.dispatch              # outbox status
+    python -m utils.dispatch --bench 5000 # fan-out benchmark on a temp outbox
+"""
+import os
+import json
+import time
+import atexit
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from utils.metrics import Counters, LatencyHistogram
+
+DISPATCH_ENABLED = os.getenv("NIVARAN_DISPATCH", "1") == "1"
+DISPATCH_DB = os.getenv("NIVARAN_DISPATCH_DB", "./storage/dispatch.sqlite")
+OUTBOX_DIR = os.getenv("NIVARAN_DISPATCH_OUTBOX_DIR", "./storage/outbox")
+SMS_RECIPIENTS = os.getenv("NIVARAN_SMS_RECIPIENTS", "./data/sms_recipients.csv")
+WEBHOOK_URLS = [u.strip() for u in os.getenv("NIVARAN_DISPATCH_WEBHOOKS", "").split(",") if u.strip()]
+
+WORKERS = int(os.getenv("NIVARAN_DISPATCH_WORKERS", "2"))
+BATCH_WINDOW_MS = float(os.getenv("NIVARAN_DISPATCH_WINDOW_MS", "200"))
+MAX_ATTEMPTS = int(os.getenv("NIVARAN_DISPATCH_MAX_ATTEMPTS", "6"))
+BACKOFF_S = float(os.getenv("NIVARAN_DISPATCH_BACKOFF_S", "2"))
+MAX_BACKOFF_S = float(os.getenv("NIVARAN_DISPATCH_MAX_BACKOFF_S", "300"))
+LEASE_S = float(os.getenv("NIVARAN_DISPATCH_LEASE_S", "60"))
+SEND_TIMEOUT_S = float(os.getenv("NIVARAN_DISPATCH_SEND_TIMEOUT_S", "30"))
+# idle workers also poll: retries fall due and other processes enqueue
+POLL_S = 1.0
+
+LANGS = ("en", "hi", "mr")
+STATUSES = ("queued", "sending", "sent", "failed")
+
+
+def idempotency_key(incident_id: str, channel: str, recipient: str, text: str) -> str:
+    return hashlib.sha1(f"{incident_id}|{channel}|{recipient}|{text}".encode("utf-8")).hexdigest()
+
+
+def message(incident_id: str, channel: str, recipient: str, payload: dict) -> dict:
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return {
+        "key": idempotency_key(incident_id, channel, recipient, text),
+        "incident_id": incident_id,
+        "channel": channel,
+        "recipient": recipient,
+        "payload": payload,
+    }
+
+
+# --------------------------------------------------
+# Recipients / planning
+# --------------------------------------------------
+def load_recipients(path: str = SMS_RECIPIENTS) -> list:
+    """
+    [(number, lang)] from a "number,lang" CSV (lang defaults to en; #
+    comments). Without the file, one stand-in recipient per language.
+    """
+    if not os.path.exists(path):
+        return [(f"standin-{lang}", lang) for lang in LANGS]
+    recipients = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            number, _, lang = (part.strip() for part in line.partition(","))
+            recipients.append((number, lang.lower() if lang.lower() in LANGS else "en"))
+    return recipients
+
+
+def plan_alerts(incident_id: str, alerts: dict, tweets: dict, summary: dict,
+                recipients: list = None, webhooks: list = None) -> list:
+    """
+    Messages for one approved incident.
+
+    alerts: {"en"|"hi"|"mr": text}, tweets: {"public"|"authority": text},
+    summary: small JSON-safe incident description for webhooks.
+    """
+    messages = []
+    for number, lang in (load_recipients() if recipients is None else recipients):
+        text = alerts.get(lang) or alerts.get("en")
+        if text:
+            messages.append(message(incident_id, "sms", number, {"text": text, "lang": lang}))
+    for audience, text in tweets.items():
+        if text:
+            messages.append(message(incident_id, "social", audience, {"text": text, "audience": audience}))
+    body = {"incident": summary, "alerts": alerts, "tweets": tweets}
+    for url in (WEBHOOK_URLS if webhooks is None else webhooks) or ["local"]:
+        messages.append(message(incident_id, "webhook", url, body))
+    return messages
+
+
+# --------------------------------------------------
+# Channels
+# --------------------------------------------------
+class Channel(ABC):
+    """A delivery target. Subclass and register_channel() a real gateway."""
+
+    name = ""
+    max_batch = 100
+
+    @abstractmethod
+    async def send(self, batch: list) -> dict:
+        """
+        Deliver a batch of messages ({key, recipient, payload, attempts}).
+        Return {key: error} for the ones that failed; a raised exception
+        fails the whole batch. Must be safe to call again with the same keys.
+        """
+
+
+class LocalChannel(Channel):
+    """Stand-in gateway: appends deliveries to <OUTBOX_DIR>/<name>.jsonl, once per key."""
+
+    def __init__(self, name: str, max_batch: int, directory: str = None):
+        self.name = name
+        self.max_batch = max_batch
+        self.directory = directory
+        self._delivered = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory or OUTBOX_DIR, f"{self.name}.jsonl")
+
+    def _write(self, batch: list) -> int:
+        with self._lock:
+            if self._delivered is None:
+                self._delivered = set()
+                if os.path.exists(self.path):
+                    with open(self.path, encoding="utf-8") as f:
+                        self._delivered.update(json.loads(line)["key"] for line in f if line.strip())
+            fresh = [m for m in batch if m["key"] not in self._delivered]
+            if fresh:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                now = time.time()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(
+                        json.dumps({"key": m["key"], "to": m["recipient"], "at": now, **m["payload"]},
+                                   ensure_ascii=False) + "\n"
+                        for m in fresh
+                    ))
+                self._delivered.update(m["key"] for m in fresh)
+            return len(fresh)
+
+    async def send(self, batch: list) -> dict:
+        await asyncio.to_thread(self._write, batch)
+        return {}
+
+
+class WebhookChannel(LocalChannel):
+    """POSTs each URL's messages as one JSON batch; "local" recipients use the stand-in."""
+
+    def __init__(self, max_batch: int = 50, directory: str = None):
+        super().__init__("webhook", max_batch, directory)
+
+    async def send(self, batch: list) -> dict:
+        by_url = {}
+        for m in batch:
+            by_url.setdefault(m["recipient"], []).append(m)
+        failures = {}
+        local = by_url.pop("local", [])
+        if local:
+            await super().send(local)
+        if by_url:
+            import aiohttp
+
+            timeout = aiohttp.ClientTimeout(total=SEND_TIMEOUT_S)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                for url, group in by_url.items():
+                    keys = [m["key"] for m in group]
+                    # receivers dedupe on each message's key: it is the same on every retry
+                    body = {"messages": [{"key": m["key"], **m["payload"]} for m in group]}
+                    try:
+                        async with session.post(url, json=body) as resp:
+                            if resp.status >= 300:
+                                raise RuntimeError(f"HTTP {resp.status}")
+                    except Exception as e:
+                        failures.update((k, f"{type(e).__name__}: {e}") for k in keys)
+        return failures
+
+
+def default_channels(directory: str = None) -> dict:
+    return {
+        "sms": LocalChannel("sms", max_batch=500, directory=directory),
+        "social": LocalChannel("social", max_batch=10, directory=directory),
+        "webhook": WebhookChannel(max_batch=50, directory=directory),
+    }
+
+
+CHANNELS = default_channels()
+
+
+def register_channel(channel: Channel):
+    """Replace a channel (e.g. a real SMS gateway) before the dispatcher starts."""
+    CHANNELS[channel.name] = channel
+
+
+# --------------------------------------------------
+# Outbox (SQLite)
+# --------------------------------------------------
+class Outbox:
+    def __init__(self, path: str = DISPATCH_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._tx() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " key TEXT PRIMARY KEY, incident_id TEXT, channel TEXT, recipient TEXT, payload TEXT,"
+                " status TEXT, attempts INTEGER, next_at REAL, created REAL, updated REAL,"
+                " sent_at REAL, error TEXT)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (channel, status, next_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS outbox_incident ON outbox (incident_id)")
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _tx(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def enqueue(self, messages: list) -> int:
+        """Insert messages in one transaction; returns how many were new (others: same key)."""
+        now = time.time()
+        with self._tx() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO outbox (key, incident_id, channel, recipient, payload, status,"
+                " attempts, next_at, created, updated) VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?, ?)",
+                [
+                    (m["key"], m["incident_id"], m["channel"], m["recipient"],
+                     json.dumps(m["payload"], ensure_ascii=False), now, now, now)
+                    for m in messages
+                ],
+            )
+            return db.total_changes - before
+
+    def claim(self, channel: str, limit: int, lease_s: float = LEASE_S) -> list:
+        """Lease up to limit due messages (queued, or sending with an expired lease)."""
+        now = time.time()
+        with self._tx() as db:
+            rows = db.execute(
+                "SELECT key, recipient, payload, attempts, created FROM outbox"
+                " WHERE channel = ? AND status IN ('queued', 'sending') AND next_at <= ?"
+                " ORDER BY next_at LIMIT ?",
+                (channel, now, limit),
+            ).fetchall()
+            db.executemany(
+                "UPDATE outbox SET status = 'sending', attempts = attempts + 1, next_at = ?, updated = ?"
+                " WHERE key = ?",
+                [(now + lease_s, now, row[0]) for row in rows],
+            )
+        return [
+            {"key": key, "recipient": recipient, "payload": json.loads(payload),
+             "attempts": attempts + 1, "created": created}
+            for key, recipient, payload, attempts, created in rows
+        ]
+
+    def finish(self, batch: list, failures: dict, max_attempts: int = MAX_ATTEMPTS,
+               backoff_s: float = BACKOFF_S) -> tuple:
+        """Mark a sent batch; failed ones retry with backoff or fail. Returns (sent, retried, failed)."""
+        now = time.time()
+        sent, retried, failed = [], [], []
+        for m in batch:
+            error = failures.get(m["key"])
+            if error is None:
+                sent.append((now, now, m["key"]))
+            elif m["attempts"] >= max_attempts:
+                failed.append((now, error, m["key"]))
+            else:
+                delay = min(MAX_BACKOFF_S, backoff_s * 2 ** (m["attempts"] - 1))
+                retried.append((now + delay, now, error, m["key"]))
+        with self._tx() as db:
+            db.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, updated = ?, error = NULL WHERE key = ?", sent)
+            db.executemany(
+                "UPDATE outbox SET status = 'queued', next_at = ?, updated = ?, error = ? WHERE key = ?", retried)
+            db.executemany(
+                "UPDATE outbox SET status = 'failed', updated = ?, error = ? WHERE key = ?", failed)
+        return len(sent), len(retried), len(failed)
+
+    def status(self, incident_id: str = None) -> dict:
+        """{channel: {status: count}} for one incident, or for the whole outbox."""
+        sql = "SELECT channel, status, COUNT(*) FROM outbox"
+        args = ()
+        if incident_id is not None:
+            sql += " WHERE incident_id = ?"
+            args = (incident_id,)
+        counts = {}
+        for channel, status, n in self._db().execute(sql + " GROUP BY channel, status", args):
+            counts.setdefault(channel, {})[status] = n
+        return counts
+
+    def pending(self) -> int:
+        return self._db().execute(
+            "SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending')").fetchone()[0]
+
+
+# --------------------------------------------------
+# Dispatcher (background event loop)
+# --------------------------------------------------
+class Dispatcher:
+    def __init__(self, outbox: Outbox = None, channels: dict = None, workers: int = WORKERS,
+                 window_ms: float = BATCH_WINDOW_MS, max_attempts: int = MAX_ATTEMPTS,
+                 backoff_s: float = BACKOFF_S):
+        self.outbox = outbox or Outbox()
+        self.channels = dict(CHANNELS if channels is None else channels)
+        self.workers = max(1, workers)
+        self.window = window_ms / 1000.0
+        self.max_attempts = max_attempts
+        self.backoff_s = backoff_s
+
+        self.counters = Counters()
+        self.latency = {name: LatencyHistogram() for name in self.channels}
+
+        self._loop = None
+        self._wake = {}
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="nivaran-dispatch", daemon=True)
+        self._thread.start()
+        self._started.wait(5)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wake = {name: asyncio.Event() for name in self.channels}
+        tasks = [
+            self._loop.create_task(self._worker(channel))
+            for channel in self.channels.values()
+            for _ in range(self.workers)
+        ]
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _worker(self, channel: Channel):
+        wake = self._wake[channel.name]
+        while True:
+            batch = await asyncio.to_thread(self.outbox.claim, channel.name, channel.max_batch)
+            if not batch:
+                wake.clear()
+                try:
+                    await asyncio.wait_for(wake.wait(), POLL_S)
+                    # woken by an enqueue: let the rest of a burst arrive first
+                    await asyncio.sleep(self.window)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._deliver(channel, batch)
+
+    async def _deliver(self, channel: Channel, batch: list):
+        self.counters.inc(f"{channel.name}_batches")
+        try:
+            failures = await asyncio.wait_for(channel.send(batch), SEND_TIMEOUT_S)
+        except Exception as e:
+            failures = {m["key"]: f"{type(e).__name__}: {e}" for m in batch}
+
+        sent, retried, failed = await asyncio.to_thread(
+            self.outbox.finish, batch, failures, self.max_attempts, self.backoff_s
+        )
+        now = time.time()
+        for m in batch:
+            if m["key"] not in failures:
+                self.latency[channel.name].observe(now - m["created"])
+        self.counters.inc(f"{channel.name}_sent", sent)
+        if retried:
+            self.counters.inc(f"{channel.name}_retried", retried)
+        if failed:
+            self.counters.inc(f"{channel.name}_failed", failed)
+            print(f"⚠️ dispatch: {failed} {channel.name} message(s) failed after {self.max_attempts} attempts")
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    def enqueue(self, messages: list) -> int:
+        """Durably queue messages and wake their channels. Fast: one SQLite transaction."""
+        inserted = self.outbox.enqueue(messages)
+        self.counters.inc("enqueued", inserted)
+        self.counters.inc("duplicates", len(messages) - inserted)
+        if inserted and self._loop is not None:
+            for name in {m["channel"] for m in messages}:
+                if name in self._wake:
+                    self._loop.call_soon_threadsafe(self._wake[name].set)
+        return inserted
+
+    def dispatch_approved(self, incident_id: str, alerts: dict, tweets: dict, summary: dict) -> tuple:
+        """Plan and queue the messages for an approved incident. Returns (planned, newly queued)."""
+        messages = plan_alerts(incident_id, alerts, tweets, summary)
+        return len(messages), self.enqueue(messages)
+
+    def status(self, incident_id: str = None) -> dict:
+        return self.outbox.status(incident_id)
+
+    def snapshot(self) -> dict:
+        return {
+            "outbox": self.outbox.status(),
+            **self.counters.snapshot(),
+            "latency": {
+                name: {k: v for k, v in hist.snapshot().items() if k != "buckets"}
+                for name, hist in self.latency.items()
+            },
+        }
+
+    def close(self, timeout: float = 5.0):
+        """Stop the workers. Undelivered rows stay in the outbox for the next start."""
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def dispatcher() -> Dispatcher:
+    """Process-wide dispatcher on DISPATCH_DB (None when NIVARAN_DISPATCH=0)."""
+    global _dispatcher
+    if not DISPATCH_ENABLED:
+        return None
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher()
+            atexit.register(_dispatcher.close)
+        return _dispatcher
+
+
+def report(snapshot: dict) -> str:
+    lines = []
+    for channel, counts in snapshot["outbox"].items():
+        line = f"📨 {channel:<8} " + "  ".join(f"{s}={counts.get(s, 0)}" for s in STATUSES)
+        lat = snapshot.get("latency", {}).get(channel)
+        if lat and lat["count"]:
+            line += f"  | delivery p50 {lat['p50_ms']:.0f} ms  p95 {lat['p95_ms']:.0f} ms"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# ------------------------------
+# MAIN (outbox status / fan-out benchmark)
+# ------------------------------
+if __name__ == "__main__":
+    import random
+    import shutil
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Alert dispatch outbox status and benchmark")
+    parser.add_argument("--bench", type=int, default=0, help="fan out to N SMS recipients on a temp outbox")
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="benchmark: injected send failure rate")
+    args = parser.parse_args()
+
+    if not args.bench:
+        print(report({"outbox": Outbox().status()}) or "📨 Outbox is empty")
+        raise SystemExit(0)
+
+    class FlakyChannel(LocalChannel):
+        async def send(self, batch):
+            await asyncio.sleep(0.005 * len(batch) ** 0.5)   # gateway round trip
+            failing = {m["key"]: "injected" for m in batch if random.random() < args.fail_rate}
+            await super().send([m for m in batch if m["key"] not in failing])
+            return failing
+
+    tmp_root = tempfile.mkdtemp(prefix="nivaran_dispatch_")
+    try:
+        channels = default_channels(tmp_root)
+        channels["sms"] = FlakyChannel("sms", max_batch=500, directory=tmp_root)
+        d = Dispatcher(Outbox(os.path.join(tmp_root, "dispatch.sqlite")), channels, backoff_s=0.05)
+
+        recipients = [(f"+9190000{i:05d}", LANGS[i % 3]) for i in range(args.bench)]
+        alerts = {"en": "Flood alert: move to higher ground.", "hi": "बाढ़ चेतावनी", "mr": "पूर इशारा"}
+        tweets = {"public": "Flooding near Kurla station. Avoid the area.", "authority": "@MumbaiPolice flooding at Kurla"}
+        messages = plan_alerts("INC-BENCH", alerts, tweets, {"type": "Flood"}, recipients, ["local"])
+
+        t0 = time.perf_counter()
+        inserted = d.enqueue(messages)
+        enqueue_ms = (time.perf_counter() - t0) * 1000
+        again = d.enqueue(messages)
+
+        while d.outbox.pending():
+            time.sleep(0.05)
+        total_s = time.perf_counter() - t0
+        d.close()
+
+        with open(channels["sms"].path, encoding="utf-8") as f:
+            delivered = sum(1 for _ in f)
+        snap = d.snapshot()
+        print(report(snap))
+        print(f"\n📨 {inserted} messages queued in {enqueue_ms:.1f} ms (re-approve queued {again})")
+        print(f"   all delivered in {total_s:.2f} s ({inserted / total_s:.0f} msg/s), "
+              f"sms file has {delivered} lines for {len(recipients)} recipients")
+        print(f"   retried {snap.get('sms_retried', 0)}, failed {snap['outbox']['sms'].get('failed', 0)}, "
+              f"sms batches {snap.get('sms_batches', 0)}")
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
@@ -0,0 +1,240 @@
+# utils/event_log.py
+"""
+Append-only JSONL event log for graph runs and monitor incidents.
+
+emit() only puts the event on a queue; a background thread writes
+batches, fsyncs once per batch, rotates the active file by size or age
+and gzips rotated files. The hot path never touches the disk.
+
+File names carry their time range so the reader can skip whole files:
+    events-<start>-current.<pid>.<seq>.jsonl      active file
+    events-<start>-<end>.<pid>.<seq>.jsonl.gz     rotated + compressed
+
+read_events() streams line by line and filters by camera, time range
+and hazard type without loading whole files into memory.
+
+    python -m utils.event_log --camera "Kurla Railway Station" --type flood --since 1700000000
+"""
+import os
+import re
+import gzip
+import math
+import json
+import time
+import queue
+import atexit
+import shutil
+import threading
+
+EVENT_LOG_ENABLED = os.getenv("NIVARAN_EVENT_LOG", "1") != "0"
+EVENT_LOG_DIR = os.getenv("NIVARAN_EVENT_LOG_DIR", "./logs/events")
+MAX_BYTES = int(os.getenv("NIVARAN_EVENT_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+MAX_AGE_SECONDS = float(os.getenv("NIVARAN_EVENT_LOG_MAX_AGE", "3600"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("NIVARAN_EVENT_LOG_FLUSH", "1.0"))
+BATCH_SIZE = 256
+QUEUE_SIZE = 10000
+
+_FILE_RE = re.compile(r"^events-(\d+)-(\d+|current)\.\d+\.\d+\.jsonl(\.gz)?$")
+
+
+class EventLog:
+    def __init__(
+        self,
+        directory: str = EVENT_LOG_DIR,
+        max_bytes: int = MAX_BYTES,
+        max_age_seconds: float = MAX_AGE_SECONDS,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        compress: bool = True,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.dropped = 0
+        self.written = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._file = None
+        self._file_path = None
+        self._file_start = 0
+        self._file_end = 0.0
+        self._opened_at = 0.0
+        self._seq = 0
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    # --------------------------------------------------
+    # Producer side (hot path)
+    # --------------------------------------------------
+    def emit(self, kind: str, **fields):
+        event = {"ts": round(time.time(), 3), "kind": kind, **fields}
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    # --------------------------------------------------
+    # Writer thread
+    # --------------------------------------------------
+    def _open(self, first_ts: float):
+        # named by the events it holds, not by when it was opened: events
+        # queued just before a rotation are older than the new file
+        self._file_start = math.floor(first_ts)
+        self._file_end = first_ts
+        self._opened_at = time.time()
+        self._seq += 1
+        self._file_path = os.path.join(
+            self.directory, f"events-{self._file_start}-current.{os.getpid()}.{self._seq}.jsonl"
+        )
+        self._file = open(self._file_path, "a", encoding="utf-8")
+
+    def _rotate(self):
+        self._file.close()
+        end = max(math.ceil(self._file_end), self._file_start)
+        rotated = os.path.join(
+            self.directory, f"events-{self._file_start}-{end}.{os.getpid()}.{self._seq}.jsonl"
+        )
+        os.replace(self._file_path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self._file = None
+
+    def _write_batch(self, batch: list):
+        stamps = [e.get("ts", 0) for e in batch]
+        if self._file is None:
+            self._open(min(stamps))
+        else:
+            # events from other threads may arrive a little out of order
+            self._file_start = min(self._file_start, math.floor(min(stamps)))
+        self._file_end = max(self._file_end, max(stamps))
+        self._file.write("".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in batch))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.written += len(batch)
+
+        if self._file.tell() >= self.max_bytes or time.time() - self._opened_at >= self.max_age_seconds:
+            self._rotate()
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except OSError as e:
+                    print(f"❌ Event log write failed: {e}")
+                    self.dropped += len(batch)
+
+        if self._file is not None:
+            self._file.close()
+
+
+# --------------------------------------------------
+# Process-wide default log
+# --------------------------------------------------
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_event_log():
+    """Shared EventLog for this process, or None when NIVARAN_EVENT_LOG=0."""
+    global _default
+
+    if not EVENT_LOG_ENABLED:
+        return None
+    with _default_lock:
+        if _default is None:
+            _default = EventLog()
+            atexit.register(_default.close)
+        return _default
+
+
+def emit(kind: str, **fields):
+    log = get_event_log()
+    if log is not None:
+        log.emit(kind, **fields)
+
+
+# --------------------------------------------------
+# Reader
+# --------------------------------------------------
+def _files_in_range(directory: str, start: float = None, end: float = None) -> list:
+    files = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        m = _FILE_RE.match(name)
+        if not m:
+            continue
+        f_start = int(m.group(1))
+        f_end = float("inf") if m.group(2) == "current" else int(m.group(2))
+        if start is not None and f_end < start:
+            continue
+        if end is not None and f_start > end:
+            continue
+        files.append((f_start, os.path.join(directory, name)))
+    return [path for _, path in sorted(files)]
+
+
+def read_events(
+    directory: str = EVENT_LOG_DIR,
+    camera: str = None,
+    start: float = None,
+    end: float = None,
+    hazard_type: str = None,
+    kind: str = None,
+):
+    """Stream events matching every given filter (generator)."""
+    for path in _files_in_range(directory, start, end):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue   # torn last line of a crashed writer
+                ts = event.get("ts", 0)
+                if start is not None and ts < start:
+                    continue
+                if end is not None and ts > end:
+                    continue
+                if camera is not None and event.get("camera") != camera:
+                    continue
+                if hazard_type is not None and str(event.get("type", "")).lower() != hazard_type.lower():
+                    continue
+                if kind is not None and event.get("kind") != kind:
+                    continue
+                yield event
+
+
+# ------------------------------
+# MAIN (query the log)
+# ------------------------------
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the Nivaran event log")
+    parser.add_argument("--dir", default=EVENT_LOG_DIR)
+    parser.add_argument("--camera")
+    parser.add_argument("--type", dest="hazard_type")
+    parser.add_argument("--kind")
+    parser.add_argument("--since", type=float, help="unix time")
+    parser.add_argument("--until", type=float, help="unix time")
+    args = parser.parse_args()
+
+    for ev in read_events(args.dir, args.camera, args.since, args.until, args.hazard_type, args.kind):
+        print(json.dumps(ev, ensure_ascii=False))
@@ -0,0 +1,249 @@
+# utils/geo_index.py
+"""
+Spatial-temporal index over open incidents, used for proximity dedup.
+
+Adjacent cameras and repeated uploads of the same scene would each run
+the full graph and each open their own incident. IncidentIndex answers
+"is there already a flood within 500 m updated in the last 10 minutes?"
+so that a new report can attach to that incident instead of redrafting
+the protocol and alerts.
+
+Incidents are bucketed in a uniform lat/lon grid of CELL_M-sized cells.
+A radius query scans only the cells that overlap the radius, and the
+exact check is a haversine distance. Entries not updated for RETENTION_S
+are pruned as new ones are added.
+
+claim() is the dedup hook. It atomically either attaches the report to
+the nearest matching incident, escalates that incident (the new report
+is more severe, so alerts must be redrafted), or opens a new one. The
+run that opened or escalated an incident publishes its protocol and
+alert text with complete(). Reports that attach while that is still in
+flight wait for it (bounded).
+"""
+import os
+import math
+import time
+import uuid
+import itertools
+import threading
+from dataclasses import dataclass, field
+
+from utils.incidents import SEVERITY_LEVEL
+from utils.records import TEXT_FIELDS
+
+DEDUP_RADIUS_M = float(os.getenv("NIVARAN_DEDUP_RADIUS_M", "500"))
+DEDUP_WINDOW_S = float(os.getenv("NIVARAN_DEDUP_WINDOW_S", "600"))
+CELL_M = float(os.getenv("NIVARAN_GEO_CELL_M", "500"))
+RETENTION_S = float(os.getenv("NIVARAN_GEO_RETENTION_S", "3600"))
+
+EARTH_RADIUS_M = 6_371_008.8
+METERS_PER_DEG_LAT = 111_320.0
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+@dataclass(slots=True)
+class GeoIncident:
+    incident_id: str
+    lat: float
+    lon: float
+    disaster_type: str
+    severity: str
+    opened_at: float
+    updated_at: float
+    reports: int = 1
+    # durable identity (dispatch keys); incident_id restarts at GEO-0001 with the process
+    uid: str = field(default_factory=lambda: uuid.uuid4().hex)
+    texts: dict = field(default_factory=dict)
+    ready: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def level(self) -> int:
+        return SEVERITY_LEVEL.get(self.severity, 0)
+
+    def to_dict(self) -> dict:
+        return {
+            "incident_id": self.incident_id,
+            "uid": self.uid,
+            "lat": self.lat,
+            "lon": self.lon,
+            "type": self.disaster_type,
+            "severity": self.severity,
+            "opened_at": self.opened_at,
+            "updated_at": self.updated_at,
+            "reports": self.reports,
+        }
+
+
+class IncidentIndex:
+    def __init__(self, cell_m: float = CELL_M, retention_s: float = RETENTION_S, prefix: str = "GEO"):
+        self.cell_deg = cell_m / METERS_PER_DEG_LAT
+        self.retention_s = retention_s
+        self.prefix = prefix
+        self._cells = {}      # (row, col) -> {incident_id: GeoIncident}
+        self._by_id = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.attached = 0
+        self.escalated = 0
+
+    # --------------------------------------------------
+    # Grid
+    # --------------------------------------------------
+    def _cell(self, lat: float, lon: float) -> tuple:
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _cells_around(self, lat: float, lon: float, radius_m: float):
+        row, col = self._cell(lat, lon)
+        d_rows = math.ceil(radius_m / (self.cell_deg * METERS_PER_DEG_LAT))
+        # a degree of longitude shrinks with cos(lat)
+        lon_m = self.cell_deg * METERS_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6)
+        d_cols = math.ceil(radius_m / lon_m)
+        for r in range(row - d_rows, row + d_rows + 1):
+            for c in range(col - d_cols, col + d_cols + 1):
+                bucket = self._cells.get((r, c))
+                if bucket:
+                    yield bucket
+
+    def _insert(self, incident: GeoIncident):
+        self._cells.setdefault(self._cell(incident.lat, incident.lon), {})[incident.incident_id] = incident
+        self._by_id[incident.incident_id] = incident
+
+    def _remove(self, incident: GeoIncident):
+        key = self._cell(incident.lat, incident.lon)
+        bucket = self._cells.get(key)
+        if bucket is not None:
+            bucket.pop(incident.incident_id, None)
+            if not bucket:
+                del self._cells[key]
+        self._by_id.pop(incident.incident_id, None)
+
+    def _prune(self, now: float):
+        cutoff = now - self.retention_s
+        for incident in [i for i in self._by_id.values() if i.updated_at < cutoff]:
+            self._remove(incident)
+
+    def _nearby(self, lat, lon, radius_m, since, disaster_type) -> list:
+        hits = []
+        for bucket in self._cells_around(lat, lon, radius_m):
+            for incident in bucket.values():
+                if since is not None and incident.updated_at < since:
+                    continue
+                if disaster_type is not None and incident.disaster_type != disaster_type:
+                    continue
+                distance = haversine_m(lat, lon, incident.lat, incident.lon)
+                if distance <= radius_m:
+                    hits.append((distance, incident))
+        hits.sort(key=lambda h: h[0])
+        return hits
+
+    # --------------------------------------------------
+    # Queries
+    # --------------------------------------------------
+    def nearby(self, lat: float, lon: float, radius_m: float = DEDUP_RADIUS_M,
+               window_s: float = DEDUP_WINDOW_S, disaster_type: str = None, now: float = None) -> list:
+        """[(distance_m, GeoIncident)] nearest first, updated within window_s (None = any age)."""
+        now = time.time() if now is None else now
+        since = None if window_s is None else now - window_s
+        kind = disaster_type.lower() if disaster_type else None
+        with self._lock:
+            return self._nearby(lat, lon, radius_m, since, kind)
+
+    def get(self, incident_id: str):
+        return self._by_id.get(incident_id)
+
+    # --------------------------------------------------
+    # Dedup hook
+    # --------------------------------------------------
+    def claim(self, lat: float, lon: float, disaster_type: str, severity: str,
+              radius_m: float = DEDUP_RADIUS_M, window_s: float = DEDUP_WINDOW_S, now: float = None) -> tuple:
+        """
+        Match a new hazard report against open incidents. Returns
+        (incident, action), where action is one of:
+            "attach"    same type nearby, not more severe: reuse its output
+            "escalate"  same type nearby, more severe: redraft its alerts
+            "open"      nothing nearby: a new incident
+        """
+        now = time.time() if now is None else now
+        kind = str(disaster_type or "unknown").lower()
+        severity = str(severity or "unknown").lower()
+
+        with self._lock:
+            hits = self._nearby(lat, lon, radius_m, now - window_s, kind)
+            if hits:
+                incident = hits[0][1]
+                incident.reports += 1
+                incident.updated_at = now
+                if SEVERITY_LEVEL.get(severity, 0) > incident.level:
+                    incident.severity = severity
+                    incident.ready.clear()
+                    self.escalated += 1
+                    return incident, "escalate"
+                self.attached += 1
+                return incident, "attach"
+
+            self._prune(now)
+            incident = GeoIncident(
+                incident_id=f"{self.prefix}-{next(self._ids):04d}",
+                lat=float(lat), lon=float(lon),
+                disaster_type=kind, severity=severity,
+                opened_at=now, updated_at=now,
+            )
+            self._insert(incident)
+            return incident, "open"
+
+    def complete(self, incident_id: str, result: dict):
+        """Publish the protocol / alert text of the run that opened or escalated the incident."""
+        incident = self._by_id.get(incident_id)
+        if incident is None:
+            return
+        incident.texts = {name: result.get(name, "") for name in TEXT_FIELDS}
+        incident.ready.set()
+
+    def discard(self, incident_id: str):
+        """
+        The run that opened or escalated the incident failed. A new
+        incident is dropped; an escalated one keeps its earlier text.
+        Either way waiting reports are released.
+        """
+        with self._lock:
+            incident = self._by_id.get(incident_id)
+            if incident is not None:
+                if not incident.texts:
+                    self._remove(incident)
+                incident.ready.set()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def stats(self) -> dict:
+        return {
+            "incidents": len(self._by_id),
+            "cells": len(self._cells),
+            "attached": self.attached,
+            "escalated": self.escalated,
+        }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_index() -> IncidentIndex:
+    """
+    Process-wide, in-memory index: runs in one process (dashboard
+    sessions; the server's image and video handlers) dedup against each
+    other. The dashboard, the server and a CLI monitor are separate
+    processes and each keep their own.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = IncidentIndex()
+        return _shared
@@ -0,0 +1,185 @@
+# utils/incidents.py
+"""
+Per-frame detections → incidents.
+
+A flickering classifier should not flip alerts on and off, and a long
+flood should not redraft alerts on every frame. IncidentTracker applies:
+
+- K-of-N confirmation: an incident opens (or escalates) only when at
+  least K of the last N samples reach that severity
+- hysteresis: once open, severity never steps down; the incident closes
+  only after `clear_after` consecutive samples below the alert level
+
+observe() returns an IncidentEvent only on open / escalate / close, and
+only those transitions should trigger alert drafting.
+
+incident_id ("<source>-0001") is the readable label and is unique only
+within one process; every incident also carries a uuid4 `uid`, which is
+what should be used to join events across processes.
+"""
+import os
+import re
+import uuid
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass, field, asdict
+
+SEVERITY_LEVEL = {"none": 0, "unknown": 0, "low": 1, "medium": 2, "high": 3}
+LEVEL_SEVERITY = {0: "none", 1: "low", 2: "medium", 3: "high"}
+
+CONFIRM_K = int(os.getenv("NIVARAN_INCIDENT_CONFIRM_K", "2"))
+CONFIRM_N = int(os.getenv("NIVARAN_INCIDENT_CONFIRM_N", "3"))
+CLEAR_AFTER = int(os.getenv("NIVARAN_INCIDENT_CLEAR_AFTER", "3"))
+
+_id_lock = threading.Lock()
+_last_id = 0
+
+
+def _next_id() -> int:
+    global _last_id
+    with _id_lock:
+        _last_id += 1
+        return _last_id
+
+
+def _reserve_ids(upto: int):
+    """Never hand out ids <= upto again (they were issued before a checkpoint)."""
+    global _last_id
+    with _id_lock:
+        _last_id = max(_last_id, upto)
+
+
+def source_name(name: str) -> str:
+    """Incident id prefix from a camera / video name: 'clips/Dadar east.mp4' → 'DADAR-EAST'."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return re.sub(r"[^A-Z0-9]+", "-", stem.upper()).strip("-") or "INC"
+
+
+@dataclass
+class IncidentEvent:
+    kind: str              # "open" | "escalate" | "close"
+    incident_id: str
+    disaster_type: str
+    severity: str
+    timestamp: float
+    vision_output: dict = field(default_factory=dict)
+    incident_uid: str = ""
+
+
+@dataclass
+class Incident:
+    incident_id: str
+    disaster_type: str
+    level: int
+    opened_at: float
+    samples: int = 0
+    uid: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+
+def _level(detection: dict) -> int:
+    if not detection.get("hazard"):
+        return 0
+    return SEVERITY_LEVEL.get(str(detection.get("severity", "")).lower(), 0)
+
+
+class IncidentTracker:
+    def __init__(
+        self,
+        alert_level: int = SEVERITY_LEVEL["medium"],
+        k: int = CONFIRM_K,
+        n: int = CONFIRM_N,
+        clear_after: int = CLEAR_AFTER,
+        source: str = "",
+    ):
+        self.alert_level = alert_level
+        self.k = max(1, min(k, n))
+        self.clear_after = max(1, clear_after)
+        self.source = source
+        self.window = deque(maxlen=max(1, n))
+        self.incident = None
+        self._clear_streak = 0
+        self._last_id = 0
+
+    def _issue_id(self) -> int:
+        self._last_id = _next_id()
+        return self._last_id
+
+    def _confirmed_level(self) -> int:
+        """Highest level reached by at least K samples in the window."""
+        for level in (3, 2, 1):
+            if sum(1 for lvl, _ in self.window if lvl >= level) >= self.k:
+                return level
+        return 0
+
+    def _majority_type(self) -> str:
+        types = Counter(t for lvl, t in self.window if lvl >= self.alert_level)
+        return types.most_common(1)[0][0] if types else "unknown"
+
+    def observe(self, detection: dict, timestamp: float):
+        """Feed one sample. Returns an IncidentEvent on a transition, else None."""
+        level = _level(detection)
+        self.window.append((level, str(detection.get("type", "unknown")).lower()))
+        confirmed = self._confirmed_level()
+
+        if self.incident is None:
+            if confirmed >= self.alert_level:
+                self.incident = Incident(
+                    incident_id=f"{self.source or 'INC'}-{self._issue_id():04d}",
+                    disaster_type=self._majority_type(),
+                    level=confirmed,
+                    opened_at=timestamp,
+                )
+                self._clear_streak = 0
+                return self._event("open", timestamp, detection)
+            return None
+
+        self.incident.samples += 1
+
+        if level < self.alert_level:
+            self._clear_streak += 1
+            if self._clear_streak >= self.clear_after:
+                event = self._event("close", timestamp, detection)
+                self.incident = None
+                self.window.clear()
+                return event
+            return None
+
+        self._clear_streak = 0
+        if confirmed > self.incident.level:
+            self.incident.level = confirmed
+            return self._event("escalate", timestamp, detection)
+        return None
+
+    def to_dict(self) -> dict:
+        """JSON-safe state, for checkpoints."""
+        return {
+            "window": [list(w) for w in self.window],
+            "incident": asdict(self.incident) if self.incident else None,
+            "clear_streak": self._clear_streak,
+            "last_id": self._last_id,
+        }
+
+    def restore(self, state: dict):
+        self.window.clear()
+        self.window.extend(tuple(w) for w in state.get("window", []))
+        self.incident = Incident(**state["incident"]) if state.get("incident") else None
+        self._clear_streak = state.get("clear_streak", 0)
+        # the id counter restarts with the process: skip ids this run already issued
+        self._last_id = state.get("last_id", 0)
+        _reserve_ids(self._last_id)
+
+    def _event(self, kind: str, timestamp: float, detection: dict) -> IncidentEvent:
+        severity = LEVEL_SEVERITY[self.incident.level]
+        vision = dict(detection)
+        if kind != "close":
+            # alert on the confirmed incident, not on this single frame
+            vision.update({"hazard": True, "type": self.incident.disaster_type, "severity": severity})
+        return IncidentEvent(
+            kind=kind,
+            incident_id=self.incident.incident_id,
+            disaster_type=self.incident.disaster_type,
+            severity=severity,
+            timestamp=timestamp,
+            vision_output=vision,
+            incident_uid=self.incident.uid,
+        )
@@ -0,0 +1,398 @@
+# utils/llm_client.py
+"""
+Shared, resilient client layer for every LLM call in Nivaran.
+
+One place configures the Gemini client (vision), the Groq SDK client
+(alerts) and the llama_index Groq LLM (NDMA RAG), and every call goes
+through `call(provider, fn, ...)`. The llama_index LLM does that itself
+for each chat / complete request, so a RAG query's retrieval and
+embedding run outside the guard. The caller sets the query's deadline
+with `deadline_scope()`. The guard adds:
+
+- keep-alive connection pools (one httpx pool shared by both Groq clients)
+- per-call deadlines (a stalled request frees the caller on time)
+- retries with full-jitter exponential backoff on 429 / 5xx / timeouts
+- a circuit breaker per provider, so a 429 storm fails fast
+- a concurrency semaphore per provider
+- host-wide rate-limit quotas shared with the other Nivaran processes
+  (utils/quota.py): every attempt takes a request + estimated tokens
+  first, and a 429 drains the provider's buckets for everyone
+- metrics per provider (see metrics() / metrics_report())
+"""
+import os
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from dotenv import load_dotenv
+
+from utils.metrics import Counters, LatencyHistogram
+from utils import quota as quota_mod
+
+load_dotenv()
+
+# --------------------------------------------------
+# Policy (env overridable)
+# --------------------------------------------------
+LLM_TIMEOUT_SECONDS = float(os.getenv("NIVARAN_LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("NIVARAN_LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("NIVARAN_LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("NIVARAN_LLM_BACKOFF_MAX", "8"))
+BREAKER_THRESHOLD = int(os.getenv("NIVARAN_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("NIVARAN_BREAKER_COOLDOWN", "30"))
+POOL_MAX_CONNECTIONS = int(os.getenv("NIVARAN_POOL_MAX_CONNECTIONS", "20"))
+POOL_KEEPALIVE_CONNECTIONS = int(os.getenv("NIVARAN_POOL_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("NIVARAN_POOL_KEEPALIVE_EXPIRY", "60"))
+# completion tokens charged to the quota when a groq_llm() sets no max_tokens
+GROQ_COMPLETION_ESTIMATE = int(os.getenv("NIVARAN_GROQ_COMPLETION_ESTIMATE", "512"))
+
+MAX_CONCURRENCY = {
+    "gemini": int(os.getenv("NIVARAN_GEMINI_CONCURRENCY", "4")),
+    "groq": int(os.getenv("NIVARAN_GROQ_CONCURRENCY", "4")),
+}
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = ("timeout", "connection", "ratelimit", "unavailable", "internalserver", "overloaded")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the provider while its breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call (including retries) runs past its deadline."""
+
+
+def remaining(deadline: float = None, default: float = LLM_TIMEOUT_SECONDS) -> float:
+    """Seconds left until an absolute time.time() deadline (or the default)."""
+    if deadline is None:
+        return default
+    return deadline - time.time()
+
+
+_scope_deadline = contextvars.ContextVar("nivaran_llm_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: float = None):
+    """Deadline for guarded calls made inside this block that don't pass their own (see groq_llm)."""
+    token = _scope_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _scope_deadline.reset(token)
+
+
+def _is_rate_limited(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    return status == 429 or "ratelimit" in type(exc).__name__.lower()
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if isinstance(status, int) and status in RETRYABLE_STATUS:
+        return True
+    name = type(exc).__name__.lower()
+    return any(key in name for key in RETRYABLE_NAMES)
+
+
+# --------------------------------------------------
+# Circuit breaker
+# --------------------------------------------------
+class CircuitBreaker:
+    """closed → open after N consecutive failures → half-open after cooldown."""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.time() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+            return self.state != "open"
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = "closed"
+
+    def record_failure(self) -> bool:
+        """Returns True if this failure opened the breaker."""
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.threshold:
+                opened = self.state != "open"
+                self.state = "open"
+                self._opened_at = time.time()
+                return opened
+            return False
+
+
+# --------------------------------------------------
+# Per-provider guard
+# --------------------------------------------------
+class ProviderGuard:
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.breaker = CircuitBreaker()
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.counters = Counters()
+        self.latency = LatencyHistogram()
+        # attempts run on this pool so a stalled socket never holds the caller
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix=f"llm-{name}")
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+
+    def _attempt(self, fn, args, kwargs, timeout: float):
+        if not self.semaphore.acquire(timeout=max(0.0, timeout)):
+            raise DeadlineExceeded(f"{self.name}: no free slot within {timeout:.1f}s")
+
+        with self._inflight_lock:
+            self._inflight += 1
+
+        def _release(_):
+            with self._inflight_lock:
+                self._inflight -= 1
+            self.semaphore.release()
+
+        future = self._pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(_release)
+        try:
+            return future.result(timeout=max(0.0, timeout))
+        except FutureTimeout:
+            self.counters.inc("timeouts")
+            raise DeadlineExceeded(f"{self.name}: call exceeded {timeout:.1f}s")
+
+    def call(self, fn, *args, deadline: float = None, retries: int = LLM_MAX_RETRIES,
+             quota_model: str = None, quota_tokens: int = None, quota_mode: str = quota_mod.QUOTA_MODE, **kwargs):
+        self.counters.inc("calls")
+        if deadline is None:
+            deadline = time.time() + LLM_TIMEOUT_SECONDS * (retries + 1)
+        quota = quota_mod.manager()
+        model = quota_model or kwargs.get("model")
+        tokens = quota_tokens if quota_tokens is not None else quota_mod.estimate_tokens(args, kwargs)
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.counters.inc("rejected_open")
+                raise CircuitOpenError(f"{self.name} circuit open, skipping call")
+
+            lease = None
+            if quota is not None:
+                try:
+                    lease = quota.acquire(self.name, model, tokens, mode=quota_mode, deadline=deadline)
+                except quota_mod.QuotaExceeded:
+                    self.counters.inc("quota_shed")
+                    raise
+                if lease.waited > 0.01:
+                    self.counters.inc("quota_waits")
+
+            budget = min(LLM_TIMEOUT_SECONDS, remaining(deadline))
+            if budget <= 0:
+                self.counters.inc("deadline_exceeded")
+                raise DeadlineExceeded(f"{self.name}: deadline passed before attempt {attempt + 1}")
+
+            t0 = time.perf_counter()
+            try:
+                result = self._attempt(fn, args, kwargs, budget)
+            except Exception as e:
+                self.latency.observe(time.perf_counter() - t0)
+                retryable = _is_retryable(e)
+                if quota is not None and _is_rate_limited(e):
+                    quota.penalize(self.name, model)
+                if retryable and self.breaker.record_failure():
+                    self.counters.inc("breaker_opened")
+                    print(f"⚡ {self.name} circuit breaker OPEN for {self.breaker.cooldown:.0f}s")
+
+                if not retryable or attempt >= retries:
+                    self.counters.inc("failures")
+                    raise
+
+                # full jitter: sleep U(0, min(cap, base * 2^attempt)), never past the deadline
+                backoff = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+                if backoff >= remaining(deadline):
+                    self.counters.inc("failures")
+                    raise
+                self.counters.inc("retries")
+                time.sleep(backoff)
+                attempt += 1
+                continue
+
+            self.latency.observe(time.perf_counter() - t0)
+            self.breaker.record_success()
+            self.counters.inc("successes")
+            if quota is not None:
+                quota.settle(lease, quota_mod.reported_tokens(result))
+            return result
+
+    def snapshot(self) -> dict:
+        return {
+            **self.counters.snapshot(),
+            "inflight": self._inflight,
+            "breaker": self.breaker.state,
+            "latency": self.latency.snapshot(),
+        }
+
+
+_guards = {name: ProviderGuard(name, limit) for name, limit in MAX_CONCURRENCY.items()}
+
+
+def call(provider: str, fn, *args, deadline: float = None, retries: int = LLM_MAX_RETRIES,
+         quota_model: str = None, quota_tokens: int = None, quota_mode: str = quota_mod.QUOTA_MODE, **kwargs):
+    """
+    Run fn(*args, **kwargs) under the provider's pool, breaker, retry and
+    deadline policy. deadline is an absolute time.time() value.
+
+    quota_model / quota_tokens override the model and token estimate
+    charged to the host-wide quota (default: kwargs["model"] and an
+    estimate from the prompt). quota_mode is "block", "wait" or "shed".
+    """
+    return _guards[provider].call(
+        fn, *args, deadline=deadline, retries=retries,
+        quota_model=quota_model, quota_tokens=quota_tokens, quota_mode=quota_mode, **kwargs
+    )
+
+
+def metrics() -> dict:
+    snap = {name: guard.snapshot() for name, guard in _guards.items()}
+    quota = quota_mod.manager()
+    if quota is not None:
+        snap["quota"] = quota.utilization()
+    return snap
+
+
+def metrics_report() -> str:
+    lines = []
+    snaps = metrics()
+    util = snaps.pop("quota", None)
+    for name, snap in snaps.items():
+        lat = snap["latency"]
+        lines.append(
+            f"📡 {name:<6} calls={snap.get('calls', 0)} ok={snap.get('successes', 0)} "
+            f"fail={snap.get('failures', 0)} retries={snap.get('retries', 0)} "
+            f"timeouts={snap.get('timeouts', 0)} open_rejects={snap.get('rejected_open', 0)} "
+            f"breaker={snap['breaker']} inflight={snap['inflight']} "
+            f"p50={lat['p50_ms']}ms p95={lat['p95_ms']}ms quota_shed={snap.get('quota_shed', 0)}"
+        )
+    if util:
+        lines.append(quota_mod.report(util))
+    return "\n".join(lines)
+
+
+# --------------------------------------------------
+# Clients (created once, shared by every agent)
+# --------------------------------------------------
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _http_client():
+    import httpx
+
+    with _clients_lock:
+        if "http" not in _clients:
+            _clients["http"] = httpx.Client(
+                timeout=LLM_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=POOL_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return _clients["http"]
+
+
+def gemini_client():
+    """google-genai client with an explicit request timeout."""
+    from google import genai
+    from google.genai import types
+
+    http_opts = types.HttpOptions(timeout=int(LLM_TIMEOUT_SECONDS * 1000))
+    with _clients_lock:
+        if "gemini" not in _clients:
+            _clients["gemini"] = genai.Client(
+                api_key=os.getenv("GOOGLE_API_KEY"),
+                http_options=http_opts,
+            )
+        return _clients["gemini"]
+
+
+def groq_client():
+    """Groq SDK client on the shared keep-alive pool. Retries are ours, not the SDK's."""
+    from groq import Groq as GroqClient
+
+    http = _http_client()
+    with _clients_lock:
+        if "groq" not in _clients:
+            _clients["groq"] = GroqClient(
+                api_key=os.getenv("GROQ_API_KEY"),
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=0,
+                http_client=http,
+            )
+        return _clients["groq"]
+
+
+_guarded_groq = None
+
+
+def _guarded_groq_class():
+    """llama_index Groq LLM whose chat / complete requests run under call("groq", ...)."""
+    global _guarded_groq
+    from llama_index.llms.groq import Groq
+
+    with _clients_lock:
+        if _guarded_groq is None:
+            class GuardedGroq(Groq):
+                # the quota is charged prompt + max_tokens up front, then settled
+                # from the usage Groq reports (ChatResponse.raw, see quota.reported_tokens)
+                def _quota_tokens(self, prompt) -> int:
+                    completion = self.max_tokens or GROQ_COMPLETION_ESTIMATE
+                    return quota_mod.estimate_tokens((prompt,), {"max_tokens": completion})
+
+                def chat(self, messages, **kwargs):
+                    return call(
+                        "groq", super().chat, messages, deadline=_scope_deadline.get(),
+                        quota_model=self.model, quota_tokens=self._quota_tokens(messages), **kwargs
+                    )
+
+                def complete(self, prompt, formatted: bool = False, **kwargs):
+                    return call(
+                        "groq", super().complete, prompt, formatted, deadline=_scope_deadline.get(),
+                        quota_model=self.model, quota_tokens=self._quota_tokens(prompt), **kwargs
+                    )
+
+            _guarded_groq = GuardedGroq
+        return _guarded_groq
+
+
+def groq_llm(model: str = "llama-3.1-8b-instant"):
+    """
+    llama_index Groq LLM on the shared keep-alive pool. Each request goes
+    through the groq guard (retries, breaker, quota); wrap the query in
+    deadline_scope() to bound it.
+    """
+    llm_cls = _guarded_groq_class()
+    http = _http_client()
+    key = f"groq_llm:{model}"
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = llm_cls(
+                model=model,
+                api_key=os.getenv("GROQ_API_KEY"),
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=0,
+                http_client=http,
+            )
+        return _clients[key]
@@ -0,0 +1,71 @@
+# utils/metrics.py
+"""
+Tiny in-process metrics helpers shared by the client layer, the vision
+cascade, the monitor and the inference server. No external deps.
+"""
+import threading
+from collections import deque
+
+
+class LatencyHistogram:
+    """Bucketed latency histogram plus a window of recent samples for percentiles."""
+
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf"))
+
+    def __init__(self, window: int = 2048):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.buckets = [0] * len(self.BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000.0
+        with self._lock:
+            self._recent.append(ms)
+            self.count += 1
+            self.total_ms += ms
+            for i, bound in enumerate(self.BUCKETS_MS):
+                if ms <= bound:
+                    self.buckets[i] += 1
+                    break
+
+    def percentile(self, p: float) -> float:
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return 0.0
+        idx = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+        return samples[idx]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 1),
+            "p95_ms": round(self.percentile(95), 1),
+            "p99_ms": round(self.percentile(99), 1),
+            "buckets": {
+                ("+inf" if b == float("inf") else f"le_{int(b)}ms"): n
+                for b, n in zip(self.BUCKETS_MS, self.buckets)
+            },
+        }
+
+
+class Counters:
+    """Thread-safe named counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, name: str, amount: int = 1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def get(self, name: str) -> int:
+        return self._values.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
@@ -0,0 +1,275 @@
+# utils/preprocess.py
+"""
+Multi-core frame preprocessing for the video monitor.
+
+Resize, grayscale conversion, JPEG encoding and hashing are CPU-bound
+and used to run on the monitor's own thread, under the GIL, next to the
+network calls. Preprocessor moves them to a process pool.
+
+Frames never go through pickle: each stream gets a FrameRing, one
+SharedMemory block cut into fixed-size slots. submit() copies the frame
+into a free slot and sends the pool only (block name, slot, shape,
+dtype); the worker maps the slot, encodes, and returns the finished
+FramePayload (JPEG bytes + hashes). The slot is released when the
+result is back. When every slot is in flight, submit() blocks, which
+backpressures the capture loop instead of queueing unbounded frames.
+
+One pool serves the whole process (shared_preprocessor()): concurrent
+monitors each get their own stream and release() it when done. Workers
+cache their ring mappings, so every task also carries the names of the
+rings still live; a worker closes its mapping of any other ring before
+encoding, which lets the kernel free a released ring's memory once the
+parent has unlinked it (a worker that never gets another task keeps at
+most the rings it had mapped). Callers
+submit() frames ahead and collect results later, so encoding overlaps
+their network calls instead of running between them.
+
+    pre = shared_preprocessor()
+    future = pre.submit(frame, stream="cam-1")
+    ...
+    payload = future.result()
+    pre.release("cam-1")
+"""
+import os
+import sys
+import queue
+import atexit
+import hashlib
+import threading
+import multiprocessing
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+PREPROCESS_WORKERS = int(os.getenv("NIVARAN_PREPROCESS_WORKERS", "0")) or max(1, (os.cpu_count() or 2) - 1)
+RING_SLOTS = int(os.getenv("NIVARAN_RING_SLOTS", "4"))
+MAX_SIDE = int(os.getenv("NIVARAN_FRAME_MAX_SIDE", "1280"))
+JPEG_QUALITY = int(os.getenv("NIVARAN_JPEG_QUALITY", "85"))
+
+
+@dataclass
+class FramePayload:
+    jpeg: bytes          # ready to upload / hand to the vision agent
+    sha1: str            # exact content hash of the JPEG
+    dhash: str           # 64-bit perceptual hash, for near-duplicate frames
+    width: int
+    height: int
+    source_shape: tuple
+
+
+# --------------------------------------------------
+# Worker side (runs in the process pool)
+# --------------------------------------------------
+_attached = {}
+
+
+def _init_worker():
+    # one process per core already; keep OpenCV from oversubscribing
+    cv2.setNumThreads(1)
+
+
+def _evict(live):
+    """Close mappings of rings the parent has released since the last task."""
+    for name in [n for n in _attached if n not in live]:
+        _attached.pop(name).close()
+
+
+def _attach(name: str) -> SharedMemory:
+    shm = _attached.get(name)
+    if shm is None:
+        # spawn workers share the parent's resource tracker, which already
+        # tracks the block the parent created: attaching must not change that
+        if sys.version_info >= (3, 13):
+            shm = SharedMemory(name=name, track=False)
+        else:
+            shm = SharedMemory(name=name)   # re-registering a tracked name is a no-op
+        _attached[name] = shm
+    return shm
+
+
+def _dhash(gray) -> str:
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+
+def _encode_slot(name: str, offset: int, shape: tuple, dtype: str, max_side: int, quality: int,
+                 live: frozenset = frozenset()) -> FramePayload:
+    _evict(live | {name})
+    shm = _attach(name)
+    frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+
+    h, w = shape[:2]
+    scale = min(1.0, max_side / max(h, w)) if max_side else 1.0
+    if scale < 1.0:
+        frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    jpeg = buf.tobytes()
+
+    return FramePayload(
+        jpeg=jpeg,
+        sha1=hashlib.sha1(jpeg).hexdigest(),
+        dhash=_dhash(gray),
+        width=frame.shape[1],
+        height=frame.shape[0],
+        source_shape=tuple(shape),
+    )
+
+
+# --------------------------------------------------
+# Parent side
+# --------------------------------------------------
+class FrameRing:
+    """Fixed-size frame slots in one shared-memory block."""
+
+    def __init__(self, slot_bytes: int, slots: int = RING_SLOTS):
+        self.slot_bytes = slot_bytes
+        self.slots = max(1, slots)
+        self.shm = SharedMemory(create=True, size=self.slot_bytes * self.slots)
+        self._free = queue.Queue()
+        for slot in range(self.slots):
+            self._free.put(slot)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, frame, timeout: float = None) -> int:
+        """Copy frame into a free slot (blocks while all are in flight)."""
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"frame of {frame.nbytes} bytes exceeds ring slot of {self.slot_bytes}")
+        slot = self._free.get(timeout=timeout)
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = frame
+        return slot
+
+    def release(self, slot: int):
+        self._free.put(slot)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class Preprocessor:
+    def __init__(
+        self,
+        workers: int = PREPROCESS_WORKERS,
+        slots_per_stream: int = RING_SLOTS,
+        max_side: int = MAX_SIDE,
+        quality: int = JPEG_QUALITY,
+    ):
+        self.slots_per_stream = slots_per_stream
+        self.max_side = max_side
+        self.quality = quality
+        self._rings = {}
+        self._live = frozenset()   # names of the rings in _rings, sent with every task
+        self._lock = threading.Lock()
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def _ring(self, stream: str, frame) -> FrameRing:
+        with self._lock:
+            ring = self._rings.get(stream)
+            if ring is None:
+                # streams keep one resolution; size the slots from the first frame
+                ring = self._rings[stream] = FrameRing(frame.nbytes, self.slots_per_stream)
+                self._live = self._live | {ring.name}
+            return ring
+
+    def submit(self, frame, stream: str = "default", timeout: float = None) -> Future:
+        """Queue one BGR frame; the future resolves to a FramePayload."""
+        frame = np.ascontiguousarray(frame)
+        ring = self._ring(stream, frame)
+        slot = ring.write(frame, timeout=timeout)
+        try:
+            future = self._pool.submit(
+                _encode_slot, ring.name, slot * ring.slot_bytes,
+                frame.shape, frame.dtype.str, self.max_side, self.quality, self._live,
+            )
+        except Exception:
+            ring.release(slot)
+            raise
+        future.add_done_callback(lambda _: ring.release(slot))
+        return future
+
+    def process(self, frame, stream: str = "default") -> FramePayload:
+        return self.submit(frame, stream).result()
+
+    def release(self, stream: str):
+        """Free a stream's ring. Call once its submitted frames have all resolved."""
+        with self._lock:
+            ring = self._rings.pop(stream, None)
+            if ring is not None:
+                self._live = self._live - {ring.name}
+        if ring is not None:
+            ring.close()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            for ring in self._rings.values():
+                ring.close()
+            self._rings.clear()
+            self._live = frozenset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_preprocessor() -> Preprocessor:
+    """Process-wide Preprocessor (one pool of PREPROCESS_WORKERS for every monitor)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Preprocessor()
+            atexit.register(_shared.close)
+        return _shared
+
+
+if __name__ == "__main__":
+    # Leak check: a new stream per cycle, as the server does per video job.
+    # Worker RSS and their mappings of released rings must stay flat.
+    import uuid
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check worker memory across stream release cycles")
+    parser.add_argument("--cycles", type=int, default=20)
+    args = parser.parse_args()
+
+    def _worker_memory():
+        rss_kb, stale = 0, 0
+        for child in multiprocessing.active_children():
+            with open(f"/proc/{child.pid}/status") as f:
+                rss_kb += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+            with open(f"/proc/{child.pid}/maps") as f:
+                stale += sum(1 for line in f if "/psm_" in line and "(deleted)" in line)
+        return rss_kb / 1024, stale
+
+    frame = np.random.randint(0, 255, (1080, 1920, 3), dtype=np.uint8)
+    with Preprocessor() as pre:
+        for cycle in range(args.cycles):
+            stream = f"job-{uuid.uuid4().hex[:8]}"
+            futures = [pre.submit(frame, stream=stream) for _ in range(pre.slots_per_stream * 2)]
+            for future in futures:
+                future.result()
+            pre.release(stream)
+            rss_mb, stale = _worker_memory()
+            print(f"cycle {cycle + 1:>3}: workers {rss_mb:7.1f} MB RSS, {stale} released ring(s) still mapped")
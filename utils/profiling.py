@@ -0,0 +1,239 @@
+# utils/profiling.py
+"""
+On-demand profiling for graph runs and monitor samples.
+
+Off by default. NIVARAN_PROFILE=1 turns it on for the process (CLI
+monitor, server); a caller can also ask per run, e.g. graph.run(...,
+profile=True) from one dashboard session's sidebar toggle, without
+touching the flag other sessions see. When off, callers take their
+normal path: no sampler thread, no wrapped nodes.
+
+When on, a profiled() block does three things:
+- starts a sampling profiler: a daemon thread reads the frames of the
+  threads running this session (the one that opened it, plus any graph
+  node threads while they run) every NIVARAN_PROFILE_INTERVAL seconds,
+  so PIL decodes, cv2 work, retrieval, embedding and waits on the llm-*
+  workers show up without a tracing hook on every call; other server
+  threads and concurrent sessions are not sampled
+- collects per-node wall / CPU time from graph nodes wrapped with
+  timed_node()
+- on exit writes profiles/<time>-<label>.json (summary) and .folded
+  (collapsed stacks, e.g. for flamegraph.pl / speedscope), and prints
+  the top hot functions
+
+Blocks nest: an inner profiled() in the same context joins the outer
+session, so a monitor sample that calls the graph produces one profile.
+The active session is a contextvar, so concurrent runs on other threads
+each get their own.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import functools
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_DIR = os.getenv("NIVARAN_PROFILE_DIR", "./profiles")
+SAMPLE_INTERVAL = float(os.getenv("NIVARAN_PROFILE_INTERVAL", "0.005"))
+TOP_N = int(os.getenv("NIVARAN_PROFILE_TOP", "15"))
+
+_enabled = os.getenv("NIVARAN_PROFILE", "0") == "1"
+_active = contextvars.ContextVar("nivaran_profile", default=None)
+_last_summary = None
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(value: bool):
+    """Process-wide default (CLI tools); per-run callers pass profile= instead."""
+    global _enabled
+    _enabled = bool(value)
+
+
+def last_summary() -> dict:
+    """Summary dict of the most recently finished profile (or None)."""
+    return _last_summary
+
+
+class Profile:
+    def __init__(self, label: str, interval: float = SAMPLE_INTERVAL,
+                 directory: str = PROFILE_DIR, top_n: int = TOP_N):
+        self.label = label
+        self.interval = interval
+        self.directory = directory
+        self.top_n = top_n
+        self.samples = 0
+        self.self_counts = Counter()
+        self.cum_counts = Counter()
+        self.folded = Counter()
+        self.nodes = {}
+        self._names = {}
+        self._stop = threading.Event()
+        self._target = threading.get_ident()
+        self._threads = Counter({self._target: 1})
+        self._threads_lock = threading.Lock()
+        self.summary = None
+        self._thread = threading.Thread(target=self._sample, name="nivaran-profiler", daemon=True)
+        self._nodes_lock = threading.Lock()
+
+    # --------------------------------------------------
+    # Sampler thread
+    # --------------------------------------------------
+    def _name(self, code) -> str:
+        name = self._names.get(code)
+        if name is None:
+            name = self._names[code] = (
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            )
+        return name
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                tids = [tid for tid in self._threads if tid != own]
+            frames = sys._current_frames()
+            for tid in tids:
+                frame = frames.get(tid)
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if not stack:
+                    continue
+
+                names = [self._name(code) for code in stack]
+                self.samples += 1
+                self.self_counts[names[0]] += 1
+                for name in set(names):
+                    self.cum_counts[name] += 1
+                self.folded[";".join(reversed(names))] += 1
+
+    # --------------------------------------------------
+    # Session
+    # --------------------------------------------------
+    def enter_thread(self):
+        """Sample the calling thread too until exit_thread()."""
+        with self._threads_lock:
+            self._threads[threading.get_ident()] += 1
+
+    def exit_thread(self):
+        tid = threading.get_ident()
+        with self._threads_lock:
+            self._threads[tid] -= 1
+            if self._threads[tid] <= 0:
+                del self._threads[tid]
+
+    def record_node(self, name: str, wall: float, cpu: float):
+        with self._nodes_lock:
+            node = self.nodes.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+            node["calls"] += 1
+            node["wall_s"] += wall
+            node["cpu_s"] += cpu
+
+    def start(self):
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._thread.start()
+        return self
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        wall = time.perf_counter() - self._wall0
+        cpu = time.process_time() - self._cpu0
+
+        def _top(counts):
+            return [
+                {"function": fn, "samples": n, "pct": round(100.0 * n / self.samples, 1)}
+                for fn, n in counts.most_common(self.top_n)
+            ] if self.samples else []
+
+        summary = {
+            "label": self.label,
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "samples": self.samples,
+            "interval_s": self.interval,
+            "nodes": {
+                name: {"calls": n["calls"], "wall_s": round(n["wall_s"], 4), "cpu_s": round(n["cpu_s"], 4)}
+                for name, n in self.nodes.items()
+            },
+            "top_self": _top(self.self_counts),
+            "top_cumulative": _top(self.cum_counts),
+        }
+        summary["artifacts"] = self._write(summary)
+        self.summary = summary
+        return summary
+
+    def _write(self, summary: dict) -> list:
+        os.makedirs(self.directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in self.label)
+        base = os.path.join(self.directory, f"{datetime.now():%Y%m%d-%H%M%S}-{safe}")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for stack, n in self.folded.most_common():
+                f.write(f"{stack} {n}\n")
+        return [base + ".json", base + ".folded"]
+
+
+def report(summary: dict) -> str:
+    lines = [
+        f"🔬 Profile '{summary['label']}': wall {summary['wall_s']:.2f}s | "
+        f"cpu {summary['cpu_s']:.2f}s | {summary['samples']} samples"
+    ]
+    for name, n in summary["nodes"].items():
+        lines.append(f"   node {name:<12} x{n['calls']}  wall {n['wall_s']:.3f}s  cpu {n['cpu_s']:.3f}s")
+    for row in summary["top_self"]:
+        lines.append(f"   {row['pct']:>5.1f}%  {row['function']}")
+    if summary.get("artifacts"):
+        lines.append(f"   → {summary['artifacts'][0]}")
+    return "\n".join(lines)
+
+
+@contextmanager
+def profiled(label: str):
+    """
+    Profile the block (joins the session active in this context if one is
+    running). Yields the Profile; its .summary is set once the block that
+    opened it exits.
+    """
+    global _last_summary
+
+    outer = _active.get()
+    if outer is not None:
+        yield outer
+        return
+
+    session = Profile(label).start()
+    token = _active.set(session)
+    try:
+        yield session
+    finally:
+        _active.reset(token)
+        _last_summary = session.stop()
+        print(report(_last_summary))
+
+
+def timed_node(name: str, fn):
+    """Wrap a graph node so the active profile gets its wall / CPU time."""
+    @functools.wraps(fn)   # keeps fn's signature, so LangGraph still passes config
+    def wrapper(state, *args, **kwargs):
+        session = _active.get()   # LangGraph runs nodes in a copy of the caller's context
+        if session is not None:
+            session.enter_thread()
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        try:
+            return fn(state, *args, **kwargs)
+        finally:
+            if session is not None:
+                session.exit_thread()
+                session.record_node(name, time.perf_counter() - wall0, time.thread_time() - cpu0)
+    return wrapper
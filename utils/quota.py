@@ -0,0 +1,335 @@
+# utils/quota.py
+"""
+Host-wide rate-limit quotas for Gemini and Groq.
+
+The dashboard, video_monitor.py, graph.py's folder run, the server and
+rag_test.py each call the providers on their own, so together they
+overshoot the account's rate limits, trip 429s, and then spend their
+deadline on retries. This module keeps token buckets in one SQLite file
+that every process on the host shares.
+
+Buckets
+    <provider>:requests   <provider>:tokens
+    <provider>:<model>:requests   <provider>:<model>:tokens   (when configured)
+
+Limits are per minute (rpm / tpm). Defaults are in LIMITS and can be
+overridden with NIVARAN_QUOTA_LIMITS, a JSON object keyed by "provider"
+or "provider:model", e.g.
+    {"groq:llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000}, "gemini:gemini-2.5-flash": {"rpm": 10}}
+Groq limits are per model, so Groq has no provider-wide bucket.
+
+acquire() takes one request and an estimated token count from every
+bucket that applies, all in one BEGIN IMMEDIATE transaction, so
+processes never race each other. Modes:
+    block   wait until granted (still bounded by the deadline, if any)
+    wait    wait until granted or the deadline passes, then QuotaExceeded
+    shed    QuotaExceeded at once if not available now
+
+Afterwards settle() corrects the token estimate with the provider's
+reported usage, and penalize() empties a provider's request buckets
+after a 429, so every process backs off, not just the one that got it.
+
+    python -m utils.quota            # live utilization
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+QUOTA_ENABLED = os.getenv("NIVARAN_QUOTA", "1") == "1"
+QUOTA_DB = os.getenv("NIVARAN_QUOTA_DB", "./storage/quota.sqlite")
+QUOTA_MODE = os.getenv("NIVARAN_QUOTA_MODE", "wait")
+MODES = ("block", "wait", "shed")
+
+# free-tier style defaults; override per account with NIVARAN_QUOTA_LIMITS
+LIMITS = {
+    "gemini": {"rpm": 15, "tpm": 1_000_000},
+    "groq:llama-3.1-8b-instant": {"rpm": 30, "tpm": 6_000},
+}
+LIMITS.update(json.loads(os.getenv("NIVARAN_QUOTA_LIMITS", "{}")))
+
+# Gemini bills a picture at a flat rate
+IMAGE_TOKENS = 258
+MAX_SLEEP_SECONDS = 1.0
+
+
+class QuotaExceeded(RuntimeError):
+    """Raised when a quota cannot be granted in the caller's mode / deadline."""
+
+
+def estimate_tokens(args: tuple, kwargs: dict) -> int:
+    """Rough prompt + completion token count for a provider call, before it runs."""
+    chars, images = 0, 0
+
+    def _walk(value):
+        nonlocal chars, images
+        if isinstance(value, str):
+            chars += len(value)
+        elif isinstance(value, dict):
+            for v in value.values():
+                _walk(v)
+        elif isinstance(value, (list, tuple)):
+            for v in value:
+                _walk(v)
+        elif hasattr(value, "size") and hasattr(value, "mode"):   # PIL image
+            images += 1
+        elif getattr(value, "inline_data", None) is not None:     # genai Part (encoded image)
+            images += 1
+        elif isinstance(getattr(value, "content", None), str):    # llama_index ChatMessage
+            chars += len(value.content)
+
+    _walk(list(args))
+    _walk(kwargs.get("messages"))
+    _walk(kwargs.get("contents"))
+
+    completion = kwargs.get("max_tokens") or 0
+    config = kwargs.get("config")
+    if config is not None:
+        completion = getattr(config, "max_output_tokens", None) or completion
+    return chars // 4 + images * IMAGE_TOKENS + int(completion)
+
+
+def reported_tokens(response) -> int:
+    """
+    Total tokens a provider response says it used (None if it does not
+    say). llama_index ChatResponse / CompletionResponse are unwrapped to
+    the provider response they carry in .raw.
+    """
+    raw = getattr(response, "raw", None)
+    if raw is not None and raw is not response:
+        return reported_tokens(raw)
+    if isinstance(response, dict):
+        usage = response.get("usage") or {}
+        total = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", None)
+        return int(total) if total is not None else None
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None) is not None:
+        return int(usage.total_tokens)
+    meta = getattr(response, "usage_metadata", None)
+    if meta is not None and getattr(meta, "total_token_count", None) is not None:
+        return int(meta.total_token_count)
+    return None
+
+
+class Lease:
+    __slots__ = ("provider", "model", "tokens", "waited")
+
+    def __init__(self, provider: str, model: str, tokens: int, waited: float):
+        self.provider = provider
+        self.model = model
+        self.tokens = tokens
+        self.waited = waited
+
+
+class QuotaManager:
+    def __init__(self, path: str = QUOTA_DB, limits: dict = None):
+        self.path = path
+        self.limits = dict(LIMITS if limits is None else limits)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._tx() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY, capacity REAL, refill REAL, level REAL, updated REAL)"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value REAL)")
+
+    # --------------------------------------------------
+    # SQLite
+    # --------------------------------------------------
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _tx(self):
+        # take the write lock up front: read-refill-write is atomic across processes
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    # --------------------------------------------------
+    # Buckets
+    # --------------------------------------------------
+    def _specs(self, provider: str, model: str = None) -> list:
+        """[(bucket_key, capacity_per_minute, kind)] for every bucket that applies."""
+        specs = []
+        for scope in (provider, f"{provider}:{model}" if model else None):
+            limits = self.limits.get(scope) if scope else None
+            if not limits:
+                continue
+            if limits.get("rpm"):
+                specs.append((f"{scope}:requests", float(limits["rpm"]), "requests"))
+            if limits.get("tpm"):
+                specs.append((f"{scope}:tokens", float(limits["tpm"]), "tokens"))
+        return specs
+
+    @staticmethod
+    def _level(db, key: str, capacity: float, now: float) -> float:
+        row = db.execute("SELECT capacity, level, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] != capacity:
+            # new bucket (or a changed limit): start full
+            return capacity
+        _, level, updated = row
+        return min(capacity, level + (now - updated) * capacity / 60.0)
+
+    @staticmethod
+    def _store(db, key: str, capacity: float, level: float, now: float):
+        db.execute(
+            "INSERT INTO buckets (key, capacity, refill, level, updated) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET capacity = excluded.capacity, refill = excluded.refill, "
+            "level = excluded.level, updated = excluded.updated",
+            (key, capacity, capacity / 60.0, level, now),
+        )
+
+    @staticmethod
+    def _bump(db, key: str, amount: float = 1.0):
+        db.execute(
+            "INSERT INTO stats (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            (key, amount),
+        )
+
+    def _try_take(self, provider: str, model: str, tokens: int) -> float:
+        """Take from every bucket and return 0, or take nothing and return seconds to wait."""
+        now = time.time()
+        with self._tx() as db:
+            levels, wait = [], 0.0
+            for key, capacity, kind in self._specs(provider, model):
+                need = 1.0 if kind == "requests" else min(float(tokens), capacity)
+                level = self._level(db, key, capacity, now)
+                levels.append((key, capacity, level, need))
+                if level < need:
+                    wait = max(wait, (need - level) * 60.0 / capacity)
+            if wait > 0:
+                return wait
+            for key, capacity, level, need in levels:
+                self._store(db, key, capacity, level - need, now)
+            self._bump(db, f"{provider}:granted")
+            return 0.0
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    def acquire(self, provider: str, model: str = None, tokens: int = 0,
+                mode: str = QUOTA_MODE, deadline: float = None) -> Lease:
+        """Take one request + tokens from the provider's (and model's) buckets. See module doc."""
+        if mode not in MODES:
+            raise ValueError(f"quota mode must be one of {MODES}")
+        t0 = time.time()
+        while True:
+            wait = self._try_take(provider, model, tokens)
+            if wait == 0:
+                waited = time.time() - t0
+                if waited > 0.01:
+                    with self._tx() as db:
+                        self._bump(db, f"{provider}:waits")
+                        self._bump(db, f"{provider}:waited_s", waited)
+                return Lease(provider, model, tokens, waited)
+
+            left = float("inf") if deadline is None else deadline - time.time()
+            if mode == "shed" or (mode == "wait" and deadline is not None and wait > left) or left <= 0:
+                with self._tx() as db:
+                    self._bump(db, f"{provider}:shed")
+                raise QuotaExceeded(
+                    f"{provider}{':' + model if model else ''} quota exhausted "
+                    f"(next slot in {wait:.1f}s, mode={mode})"
+                )
+            # short sleeps: another process may refund tokens meanwhile
+            time.sleep(min(wait, left, MAX_SLEEP_SECONDS))
+
+    def settle(self, lease: Lease, actual_tokens: int):
+        """Replace the lease's token estimate with what the provider actually reported."""
+        if lease is None or actual_tokens is None:
+            return
+        delta = float(lease.tokens - actual_tokens)   # > 0: refund, < 0: extra debit (may go negative)
+        if delta == 0:
+            return
+        now = time.time()
+        with self._tx() as db:
+            for key, capacity, kind in self._specs(lease.provider, lease.model):
+                if kind == "tokens":
+                    level = self._level(db, key, capacity, now)
+                    self._store(db, key, capacity, min(capacity, level + delta), now)
+
+    def penalize(self, provider: str, model: str = None):
+        """The provider said 429: empty its request buckets for every process on the host."""
+        now = time.time()
+        with self._tx() as db:
+            for key, capacity, kind in self._specs(provider, model):
+                if kind == "requests":
+                    self._store(db, key, capacity, 0.0, now)
+            self._bump(db, f"{provider}:throttled")
+
+    def utilization(self) -> dict:
+        """Live per-bucket fill and host-wide counters (from every process)."""
+        now = time.time()
+        db = self._db()
+        buckets = {}
+        for key, capacity, _, level, updated in db.execute(
+            "SELECT key, capacity, refill, level, updated FROM buckets ORDER BY key"
+        ):
+            available = min(capacity, level + (now - updated) * capacity / 60.0)
+            buckets[key] = {
+                "capacity_per_min": capacity,
+                "available": round(available, 1),
+                "used_pct": round(100.0 * (1 - available / capacity), 1) if capacity else 0.0,
+            }
+        stats = {key: round(value, 3) for key, value in db.execute("SELECT key, value FROM stats ORDER BY key")}
+        return {"buckets": buckets, "stats": stats}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def manager() -> QuotaManager:
+    """Process-wide manager on QUOTA_DB (None when NIVARAN_QUOTA=0)."""
+    global _manager
+    if not QUOTA_ENABLED:
+        return None
+    with _manager_lock:
+        if _manager is None:
+            _manager = QuotaManager()
+        return _manager
+
+
+def report(util: dict) -> str:
+    lines = [
+        f"🪣 {key:<40} {b['used_pct']:>5.1f}% used  {b['available']:>10.1f} / {b['capacity_per_min']:.0f} per min"
+        for key, b in util["buckets"].items()
+    ]
+    if util["stats"]:
+        lines.append("   " + "  ".join(f"{k}={v:g}" for k, v in util["stats"].items()))
+    return "\n".join(lines)
+
+
+# ------------------------------
+# MAIN (live utilization)
+# ------------------------------
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show host-wide LLM quota utilization")
+    parser.add_argument("--watch", type=float, default=0, help="refresh every N seconds")
+    args = parser.parse_args()
+
+    quota = QuotaManager()
+    while True:
+        print(report(quota.utilization()) or "🪣 No quota buckets yet")
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+        print()
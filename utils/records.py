@@ -0,0 +1,184 @@
+# utils/records.py
+"""
+Compact, bounded result storage for long-running processes.
+
+Graph results are plain dicts, and each one carries its own copy of the
+protocol text and five alert strings. The dashboard and the monitor used
+to keep every one of them. This module provides:
+
+- Detection / ResultRecord: frozen, slotted records (no per-instance
+  __dict__)
+- TextPool: a reference-counted store that dedupes long text by content
+  hash, so a thousand results for the same protocol share one string
+- RecordBuffer: a ring buffer with a fixed cap. Evicting a record
+  releases its pooled text.
+
+Memory is therefore bounded by the cap, whatever the run length. See
+bench_memory.py.
+"""
+import os
+import hashlib
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+
+RESULT_CAP = int(os.getenv("NIVARAN_RESULT_CAP", "500"))
+
+TEXT_FIELDS = ("protocol", "alert_en", "alert_hi", "alert_mr", "tweet_public", "tweet_authority")
+
+
+class TextPool:
+    """Content-addressed, reference-counted strings."""
+
+    def __init__(self):
+        self._texts = {}   # digest -> [text, refs]
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def intern(self, text: str) -> str:
+        if not text:
+            return ""
+        key = self._key(text)
+        entry = self._texts.get(key)
+        if entry is None:
+            entry = self._texts[key] = [text, 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, text: str):
+        if not text:
+            return
+        key = self._key(text)
+        entry = self._texts.get(key)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._texts[key]
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def stats(self) -> dict:
+        return {
+            "texts": len(self._texts),
+            "refs": sum(refs for _, refs in self._texts.values()),
+            "chars": sum(len(text) for text, _ in self._texts.values()),
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class Detection:
+    hazard: bool
+    type: str
+    severity: str
+    confidence: float
+
+    @classmethod
+    def from_dict(cls, vision: dict) -> "Detection":
+        return cls(
+            hazard=bool(vision.get("hazard", False)),
+            type=str(vision.get("type", "unknown")).lower(),
+            severity=str(vision.get("severity", "unknown")).lower(),
+            confidence=float(vision.get("confidence", 0.0) or 0.0),
+        )
+
+    def to_dict(self) -> dict:
+        return {"hazard": self.hazard, "type": self.type, "severity": self.severity, "confidence": self.confidence}
+
+
+@dataclass(frozen=True, slots=True)
+class ResultRecord:
+    id: str
+    time: str
+    location: str
+    lat: float
+    lon: float
+    detection: Detection
+    protocol: str = ""
+    alert_en: str = ""
+    alert_hi: str = ""
+    alert_mr: str = ""
+    tweet_public: str = ""
+    tweet_authority: str = ""
+    media_kind: str = ""
+    media_name: str = ""
+    outcome: str = "full"
+    extra: tuple = field(default=())
+
+    def to_dict(self) -> dict:
+        """The flat incident dict the dashboard renders (strings are shared, not copied)."""
+        d = self.detection
+        return {
+            "id": self.id,
+            "time": self.time,
+            "location": self.location,
+            "lat": self.lat,
+            "lon": self.lon,
+            "detected": "YES" if d.hazard else "NO",
+            "type": d.type.capitalize(),
+            "severity": d.severity.capitalize(),
+            "confidence": d.confidence,
+            **{name: getattr(self, name) for name in TEXT_FIELDS},
+            "media_kind": self.media_kind,
+            "media_name": self.media_name,
+            "outcome": self.outcome,
+            **dict(self.extra),
+        }
+
+
+class RecordBuffer:
+    """Newest-last ring buffer of ResultRecords sharing one TextPool."""
+
+    def __init__(self, maxlen: int = RESULT_CAP, pool: TextPool = None, prefix: str = "INC"):
+        self.maxlen = max(1, maxlen)
+        self.pool = pool if pool is not None else TextPool()
+        self.prefix = prefix
+        self._records = deque()
+        self._ids = itertools.count(1)
+        self.evicted = 0
+
+    def add(self, vision: dict, result: dict, time: str, location: str = "Unknown",
+            lat: float = None, lon: float = None, **extra) -> ResultRecord:
+        """Build a record from a graph result, intern its text, and append it."""
+        record = ResultRecord(
+            id=f"{self.prefix}-{next(self._ids):03d}",
+            time=time,
+            location=location,
+            lat=lat,
+            lon=lon,
+            detection=Detection.from_dict(vision),
+            **{name: self.pool.intern(str(result.get(name, "") or "")) for name in TEXT_FIELDS},
+            media_kind=str(extra.pop("media_kind", "")),
+            media_name=str(extra.pop("media_name", "")),
+            outcome=str(result.get("outcome", "full")),
+            extra=tuple(sorted(extra.items())),
+        )
+        self._records.append(record)
+        while len(self._records) > self.maxlen:
+            self._evict(self._records.popleft())
+        return record
+
+    def _evict(self, record: ResultRecord):
+        for name in TEXT_FIELDS:
+            self.pool.release(getattr(record, name))
+        self.evicted += 1
+
+    def clear(self):
+        while self._records:
+            self._evict(self._records.popleft())
+
+    def newest(self, n: int = None) -> list:
+        """Records newest first (at most n)."""
+        items = reversed(self._records)
+        return list(itertools.islice(items, n)) if n is not None else list(items)
+
+    def get(self, record_id: str):
+        return next((r for r in self._records if r.id == record_id), None)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
@@ -0,0 +1,207 @@
+# utils/scheduler.py
+"""
+Severity-aware priority scheduling for inference requests.
+
+Under quota pressure the server's FIFO queue made frames from a camera
+showing an active high-severity flood wait behind routine frames from
+calm cameras. PriorityScheduler replaces that FIFO (see server.py).
+
+Every request gets a priority class when it is queued:
+
+    critical   the source's last known severity is high
+    high       the last known severity is medium, or an operator sent it
+               (dashboard upload, manual re-check)
+    normal     the last known severity is low
+    low        automatic, from a calm or unknown source
+
+The last known severity of a source (camera) comes from its own recent
+results, via note_result(). It expires after SEVERITY_TTL_S, and
+drop_stale() prunes expired sources so the table does not grow with
+every camera ever seen.
+
+Dequeue order:
+- aging: each class is FIFO, and the head of a class gains one class
+  level per AGING_S seconds of frame age (since capture when the client
+  sends captured_at, else since enqueue). A steady stream of critical
+  frames therefore cannot starve routine ones forever, and a frame that
+  arrived late has already spent part of its wait.
+- stale drop: normal / low frames older than their STALE_S (measured
+  from capture time when the client sends it) are dropped instead of
+  run. A stale routine frame is not worth a quota slot.
+- shedding: when the queue is full, evict() makes room for a request by
+  dropping the oldest queued requests of strictly lower classes.
+
+Queue wait (enqueue → dequeue) is tracked per class.
+"""
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from utils.incidents import SEVERITY_LEVEL
+from utils.metrics import Counters, LatencyHistogram
+
+CLASSES = ("critical", "high", "normal", "low")          # best first
+CLASS_SCORE = {"critical": 3, "high": 2, "normal": 1, "low": 0}
+ORIGINS = ("operator", "auto")
+
+AGING_S = float(os.getenv("NIVARAN_SCHED_AGING_S", "5"))
+STALE_S = {
+    "normal": float(os.getenv("NIVARAN_SCHED_STALE_NORMAL_S", "30")),
+    "low": float(os.getenv("NIVARAN_SCHED_STALE_LOW_S", "10")),
+}
+SEVERITY_TTL_S = float(os.getenv("NIVARAN_SCHED_SEVERITY_TTL_S", "600"))
+
+
+def classify(severity: str, origin: str = "auto") -> str:
+    level = SEVERITY_LEVEL.get(str(severity or "none").lower(), 0)
+    if level >= SEVERITY_LEVEL["high"]:
+        return "critical"
+    if level == SEVERITY_LEVEL["medium"] or origin == "operator":
+        return "high"
+    if level == SEVERITY_LEVEL["low"]:
+        return "normal"
+    return "low"
+
+
+@dataclass(slots=True)
+class Ticket:
+    item: dict
+    cls: str
+    origin: str
+    source: str
+    enqueued: float
+    captured_at: float
+    future: object = field(default=None)
+
+    def age(self, now: float) -> float:
+        """Seconds since the frame was captured (or queued, if unknown)."""
+        return now - self.captured_at
+
+
+class PriorityScheduler:
+    """Not thread-safe: owned by one event loop (the server's batcher)."""
+
+    def __init__(self, aging_s: float = AGING_S, stale_s: dict = None, severity_ttl_s: float = SEVERITY_TTL_S):
+        self.aging_s = max(aging_s, 1e-3)
+        self.stale_s = dict(STALE_S if stale_s is None else stale_s)
+        self.severity_ttl_s = severity_ttl_s
+        self._queues = {cls: deque() for cls in CLASSES}
+        self._severity = {}   # source -> (severity, time)
+        self.wait = {cls: LatencyHistogram() for cls in CLASSES}
+        self.counters = Counters()
+
+    # --------------------------------------------------
+    # Source severity
+    # --------------------------------------------------
+    def note_result(self, source: str, vision: dict, now: float = None):
+        """Remember a source's latest severity (from its own result)."""
+        if not source or not isinstance(vision, dict):
+            return
+        severity = str(vision.get("severity", "none")).lower() if vision.get("hazard") else "none"
+        self._severity[source] = (severity, time.time() if now is None else now)
+
+    def source_severity(self, source: str, now: float = None) -> str:
+        entry = self._severity.get(source) if source else None
+        if entry is None:
+            return "none"
+        severity, seen = entry
+        now = time.time() if now is None else now
+        if now - seen > self.severity_ttl_s:
+            del self._severity[source]
+            return "none"
+        return severity
+
+    def classify(self, source: str = None, origin: str = "auto", now: float = None) -> str:
+        return classify(self.source_severity(source, now), origin)
+
+    # --------------------------------------------------
+    # Queue
+    # --------------------------------------------------
+    def push(self, item: dict, source: str = None, origin: str = "auto", captured_at: float = None,
+             future=None, now: float = None) -> Ticket:
+        now = time.time() if now is None else now
+        origin = origin if origin in ORIGINS else "auto"
+        ticket = Ticket(
+            item=item,
+            cls=self.classify(source, origin, now),
+            origin=origin,
+            source=source or "",
+            enqueued=now,
+            # a capture time in the future (clock skew) counts as "now"
+            captured_at=min(captured_at, now) if captured_at else now,
+            future=future,
+        )
+        self._queues[ticket.cls].append(ticket)
+        self.counters.inc(f"queued_{ticket.cls}")
+        return ticket
+
+    def _score(self, ticket: Ticket, now: float) -> float:
+        return CLASS_SCORE[ticket.cls] + ticket.age(now) / self.aging_s
+
+    def drop_stale(self, now: float = None) -> list:
+        """
+        Remove and return queued tickets past their class's staleness
+        limit. Also forgets sources whose severity has expired.
+        """
+        now = time.time() if now is None else now
+        expired = [source for source, (_, seen) in self._severity.items() if now - seen > self.severity_ttl_s]
+        for source in expired:
+            del self._severity[source]
+
+        dropped = []
+        for cls, limit in self.stale_s.items():
+            queue = self._queues.get(cls)
+            if not queue:
+                continue
+            keep = deque()
+            for ticket in queue:
+                (dropped if ticket.age(now) > limit else keep).append(ticket)
+            self._queues[cls] = keep
+        for ticket in dropped:
+            self.counters.inc(f"dropped_stale_{ticket.cls}")
+        return dropped
+
+    def pop(self, now: float = None):
+        """Highest-scoring head across classes (None when empty)."""
+        now = time.time() if now is None else now
+        best = None
+        for cls in CLASSES:
+            queue = self._queues[cls]
+            if queue and (best is None or self._score(queue[0], now) > self._score(best, now)):
+                best = queue[0]
+        if best is None:
+            return None
+        self._queues[best.cls].popleft()
+        self.wait[best.cls].observe(now - best.enqueued)
+        return best
+
+    def evictable(self, cls: str) -> int:
+        """How many queued tickets evict(cls, ...) could drop."""
+        return sum(len(self._queues[lower]) for lower in CLASSES if CLASS_SCORE[lower] < CLASS_SCORE[cls])
+
+    def evict(self, cls: str, n: int) -> list:
+        """Drop up to n queued tickets of classes below cls (lowest class, oldest first)."""
+        evicted = []
+        for lower in reversed(CLASSES):
+            if CLASS_SCORE[lower] >= CLASS_SCORE[cls]:
+                break
+            queue = self._queues[lower]
+            while queue and len(evicted) < n:
+                evicted.append(queue.popleft())
+                self.counters.inc(f"shed_{lower}")
+        return evicted
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": {cls: len(self._queues[cls]) for cls in CLASSES},
+            "queue_wait": {
+                cls: {k: v for k, v in self.wait[cls].snapshot().items() if k != "buckets"}
+                for cls in CLASSES
+            },
+            "sources": len(self._severity),
+            **self.counters.snapshot(),
+        }
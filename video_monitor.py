@@ -2,16 +2,31 @@
 import cv2
 import os
 import time
+import uuid
+import concurrent.futures
+from contextlib import nullcontext
+from collections import deque
 from dotenv import load_dotenv
-from graph import app as nivaran_graph
+from utils import llm_client
+from utils.incidents import IncidentTracker, SEVERITY_LEVEL, source_name
+from utils import event_log
+from utils.checkpoint import Checkpoint, checkpoint_name
+from utils.preprocess import shared_preprocessor
+from utils import profiling
 
 load_dotenv()
 
+# sampled frames encoded ahead of the one being analyzed
+PIPELINE_DEPTH = int(os.getenv("NIVARAN_MONITOR_PIPELINE", "2"))
+
 def monitor_video(
     video_path: str,
     location: str = "Mumbai Railway Station",
     sample_every_seconds: int = 5,
-    alert_on_severity: list = ["high", "medium"]
+    alert_on_severity: list = ["high", "medium"],
+    resume: bool = False,
+    lat: float = None,
+    lon: float = None
 ):
     """
     Analyze a video file frame by frame.
@@ -21,7 +36,13 @@ def monitor_video(
         location: Human-readable location name
         sample_every_seconds: How often to grab a frame for analysis
         alert_on_severity: Which severity levels trigger an alert
+        resume: Seek past frames completed by a previous (crashed) run
+        lat, lon: Camera position; incidents near an open one attach to it
     """
+    # imported here, not at module level: spawned preprocess workers
+    # re-import this module and must not load the models with it
+    from graph import run as run_graph
+    from agents.vision_agent import cascade_report
 
     if not os.path.exists(video_path):
         print(f"❌ Video not found: {video_path}")
@@ -50,32 +71,62 @@ def monitor_video(
     frame_interval = int(fps * sample_every_seconds)
     frame_count = 0
     sample_count = 0
-    last_alerted_severity = None
-    temp_frame_path = "temp_monitor_frame.jpg"
+    alert_runs = 0
 
-    try:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
+    # Per-frame detections → incidents; alerts are drafted only on transitions
+    tracker = IncidentTracker(
+        alert_level=min(SEVERITY_LEVEL.get(s.lower(), 2) for s in alert_on_severity),
+        source=source_name(video_path),
+    )
 
-            frame_count += 1
+    # Checkpoint: frame offset + tracker state, completed samples alongside
+    checkpoint = Checkpoint(checkpoint_name("video", video_path))
+    state = checkpoint.load() if resume else {}
+    if state.get("video") == os.path.abspath(video_path) and state.get("total_frames") == total_frames:
+        frame_count = state["frame"]
+        sample_count = state["samples"]
+        alert_runs = state["alert_runs"]
+        tracker.restore(state["tracker"])
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+        print(f"⏩ Resuming at frame {frame_count} ({frame_count / fps:.1f}s), {sample_count} samples done")
+    else:
+        if resume:
+            print("ℹ️ No matching checkpoint, starting from frame 0")
+        checkpoint.clear()
 
-            # Only process every Nth frame
-            if frame_count % frame_interval != 0:
-                continue
+    # only fully completed samples count as progress
+    progress = {"frame": frame_count, "samples": sample_count, "alert_runs": alert_runs}
 
-            sample_count += 1
-            timestamp = frame_count / fps
+    def _save_state():
+        return dict(
+            video=os.path.abspath(video_path),
+            total_frames=total_frames,
+            tracker=tracker.to_dict(),
+            **progress,
+        )
 
-            print(f"🔍 [{timestamp:.1f}s] Analyzing frame {frame_count}...")
+    # resize / JPEG encode / hashing run in the shared worker pool, PIPELINE_DEPTH
+    # frames ahead, so encoding overlaps the Gemini / Groq calls of earlier samples
+    preprocessor = shared_preprocessor()
+    stream = f"{location}-{uuid.uuid4().hex[:8]}"
+    pending = deque()   # (frame number, video time, future FramePayload), oldest first
 
-            # Save frame as image
-            cv2.imwrite(temp_frame_path, frame)
+    def _analyze(frame_no: int, timestamp: float, future):
+        nonlocal sample_count, alert_runs
 
-            # Run through full Nivaran pipeline
+        sample_count += 1
+        label = f"{video_path}@{timestamp:.1f}s"
+        print(f"🔍 [{timestamp:.1f}s] Analyzing frame {frame_no}...")
+
+        # graph + tracker per sample is one profile when enabled
+        profile = profiling.profiled(f"monitor-frame{frame_no}") if profiling.enabled() else nullcontext()
+
+        with profile:
+            # Detection only; protocol + alerts run on incident transitions
             try:
-                result = nivaran_graph.invoke({"image_path": temp_frame_path})
+                payload = future.result()
+                # the JPEG goes to Gemini as is: no temp file, no second decode
+                result = run_graph(label, camera=location, detect_only=True, image_bytes=payload.jpeg)
                 vision = result["vision_output"]
 
                 hazard = vision.get("hazard", False)
@@ -84,48 +135,104 @@ def monitor_video(
                 confidence = vision.get("confidence", 0.0)
 
                 status_icon = "🚨" if hazard else "✅"
-                print(f"   {status_icon} Hazard: {hazard} | Type: {disaster_type} | Severity: {severity} | Confidence: {confidence}")
-
-                # Trigger alert logic
-                if hazard and severity.lower() in alert_on_severity:
-                    # Only alert if situation changed (avoid spamming same alert)
-                    if severity != last_alerted_severity:
-                        print(f"\n{'🚨'*20}")
-                        print(f"ALERT TRIGGERED at {timestamp:.1f}s")
-                        print(f"Location: {location}")
-                        print(f"Type: {disaster_type.upper()} | Severity: {severity.upper()}")
-                        print(f"\n📘 NDMA Protocol:")
-                        print(result["protocol"])
-                        print(f"\n🌐 Alert (EN): {result.get('alert_en', '')}")
-                        print(f"🌐 Alert (HI): {result.get('alert_hi', '')}")
-                        print(f"🌐 Alert (MR): {result.get('alert_mr', '')}")
-                        print(f"\n👥 Public Tweet:\n{result.get('tweet_public', '')}")
-                        print(f"\n🚨 Authority Tweet:\n{result.get('tweet_authority', '')}")
-                        print(f"{'🚨'*20}\n")
-
-                        last_alerted_severity = severity
-                else:
-                    # Reset alert state when situation clears
-                    if last_alerted_severity is not None:
-                        print(f"   ✅ Situation cleared at {timestamp:.1f}s")
-                        last_alerted_severity = None
+                print(f"   {status_icon} Hazard: {hazard} | Type: {disaster_type} | Severity: {severity} | Confidence: {confidence} | Run: {result['outcome']}")
+
+                event = tracker.observe(vision, timestamp)
+
+                if event is not None:
+                    event_log.emit(
+                        "incident",
+                        camera=location,
+                        transition=event.kind,
+                        incident_id=event.incident_id,
+                        incident_uid=event.incident_uid,
+                        type=event.disaster_type,
+                        severity=event.severity,
+                        video=video_path,
+                        frame=frame_no,
+                        video_ts=round(timestamp, 2),
+                    )
+
+                if event is not None and event.kind in ("open", "escalate"):
+                    result = run_graph(
+                        label, camera=location, vision_output=event.vision_output, lat=lat, lon=lon
+                    )
+                    alert_runs += 1
+
+                    print(f"\n{'🚨'*20}")
+                    print(f"ALERT TRIGGERED at {timestamp:.1f}s ({event.kind.upper()} {event.incident_id})")
+                    print(f"Location: {location}")
+                    print(f"Type: {event.disaster_type.upper()} | Severity: {event.severity.upper()}")
+                    if result.get("duplicate_of"):
+                        print(f"🔗 Already open nearby as {result['duplicate_of']}: alerts not redrafted")
+                    print(f"\n📘 NDMA Protocol:")
+                    print(result["protocol"])
+                    print(f"\n🌐 Alert (EN): {result.get('alert_en', '')}")
+                    print(f"🌐 Alert (HI): {result.get('alert_hi', '')}")
+                    print(f"🌐 Alert (MR): {result.get('alert_mr', '')}")
+                    print(f"\n👥 Public Tweet:\n{result.get('tweet_public', '')}")
+                    print(f"\n🚨 Authority Tweet:\n{result.get('tweet_authority', '')}")
+                    print(f"{'🚨'*20}\n")
+
+                elif event is not None and event.kind == "close":
+                    print(f"   ✅ Situation cleared at {timestamp:.1f}s ({event.incident_id} closed)")
+
+                checkpoint.record({
+                    "frame": frame_no,
+                    "video_ts": round(timestamp, 2),
+                    "vision": vision,
+                    "dhash": payload.dhash,
+                    "transition": event.kind if event else None,
+                })
+                progress.update(frame=frame_no, samples=sample_count, alert_runs=alert_runs)
+                checkpoint.maybe_save(**_save_state())
 
             except Exception as e:
-                print(f"   ❌ Pipeline error on frame {frame_count}: {e}")
+                print(f"   ❌ Pipeline error on frame {frame_no}: {e}")
+
+    try:
+        while cap.isOpened():
+            # grab() skips the decode for frames we won't sample
+            if not cap.grab():
+                break
+
+            frame_count += 1
+
+            # Only process every Nth frame
+            if frame_count % frame_interval != 0:
                 continue
 
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+
+            pending.append((frame_count, frame_count / fps, preprocessor.submit(frame, stream=stream)))
+            if len(pending) > PIPELINE_DEPTH:
+                _analyze(*pending.popleft())
+
+        while pending:
+            _analyze(*pending.popleft())
+
     except KeyboardInterrupt:
         print("\n\n⏹️  Monitoring stopped by user.")
 
     finally:
+        # frames still in the pool must finish before their ring is freed
+        for _, _, future in pending:
+            if not future.cancel():
+                concurrent.futures.wait([future])
+        preprocessor.release(stream)
+        checkpoint.save(**_save_state())
+        checkpoint.close()
         cap.release()
-        if os.path.exists(temp_frame_path):
-            os.remove(temp_frame_path)
 
         print(f"\n{'='*60}")
         print(f"📊 MONITORING COMPLETE")
         print(f"   Frames analyzed: {sample_count}")
+        print(f"   Alert drafts:    {alert_runs}")
         print(f"   Video duration:  {duration_seconds:.1f}s")
+        print(llm_client.metrics_report())
+        print(cascade_report())
         print(f"{'='*60}")
 
 
@@ -133,9 +240,23 @@ def monitor_video(
 # MAIN
 # ------------------------------
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Nivaran video monitor")
+    parser.add_argument("--video", default="test_videos/flood_test.mp4")
+    parser.add_argument("--location", default="Kurla Railway Station")
+    parser.add_argument("--every", type=int, default=5, help="sample every N seconds")
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    parser.add_argument("--lat", type=float, default=None, help="camera latitude (proximity dedup)")
+    parser.add_argument("--lon", type=float, default=None, help="camera longitude (proximity dedup)")
+    args = parser.parse_args()
+
     monitor_video(
-        video_path="test_videos/flood_test.mp4",
-        location="Kurla Railway Station",
-        sample_every_seconds=5,
-        alert_on_severity=["high", "medium"]
+        video_path=args.video,
+        location=args.location,
+        sample_every_seconds=args.every,
+        alert_on_severity=["high", "medium"],
+        resume=args.resume,
+        lat=args.lat,
+        lon=args.lon
     )
\ No newline at end of file